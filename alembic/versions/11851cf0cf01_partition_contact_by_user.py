@@ -0,0 +1,97 @@
+"""partition contact by user
+
+Revision ID: 11851cf0cf01
+Revises: 4ca40080d61b
+Create Date: 2026-10-19 14:25:48.902113
+
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '11851cf0cf01'
+down_revision: Union[str, None] = '4ca40080d61b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMN_LIST = ("id, first_name, last_name, email, phone_number, email_normalized, phone_normalized, "
+               "birthday, additional_info, user_id")
+PARTITIONS = int(os.getenv('CONTACT_PARTITIONS', '16'))
+
+
+def upgrade() -> None:
+    # the table is rebuilt and copied under an exclusive lock; the partition count is
+    # fixed from here on (CONTACT_PARTITIONS, default 16), changing it means another rebuild
+    op.execute("LOCK TABLE contact IN ACCESS EXCLUSIVE MODE")
+    op.execute("ALTER TABLE contact RENAME TO contact_old")
+    op.execute("ALTER TABLE contact_old RENAME CONSTRAINT contact_pkey TO contact_old_pkey")
+    op.execute("ALTER TABLE contact_old RENAME CONSTRAINT uq_contact_user_email TO uq_contact_old_user_email")
+    op.execute("ALTER TABLE contact_old RENAME CONSTRAINT uq_contact_user_phone TO uq_contact_old_user_phone")
+    # PostgreSQL requires the partition key in every unique constraint, so the primary key
+    # becomes (user_id, id); ids still come from contact_id_seq and stay unique
+    op.execute("""
+        CREATE TABLE contact (
+            id integer NOT NULL DEFAULT nextval('contact_id_seq'),
+            first_name varchar,
+            last_name varchar,
+            email varchar,
+            phone_number varchar,
+            email_normalized varchar,
+            phone_normalized varchar,
+            birthday date,
+            additional_info varchar,
+            user_id integer NOT NULL REFERENCES users (id),
+            CONSTRAINT contact_pkey PRIMARY KEY (user_id, id),
+            CONSTRAINT uq_contact_user_email UNIQUE (user_id, email_normalized),
+            CONSTRAINT uq_contact_user_phone UNIQUE (user_id, phone_normalized)
+        ) PARTITION BY HASH (user_id)
+    """)
+    for remainder in range(PARTITIONS):
+        op.execute(f"CREATE TABLE contact_p{remainder} PARTITION OF contact "
+                   f"FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})")
+    # indexes on the parent are created on every partition
+    op.execute("CREATE INDEX ix_contact_user_birthday ON contact (user_id, birthday)")
+    op.execute("CREATE INDEX ix_contact_user_name ON contact (user_id, last_name, first_name)")
+    op.execute("ALTER SEQUENCE contact_id_seq OWNED BY contact.id")
+    # fails on contacts without a user: the partition key is part of the primary key
+    op.execute(f"INSERT INTO contact ({COLUMN_LIST}) SELECT {COLUMN_LIST} FROM contact_old")
+    op.execute("DROP TABLE contact_old")
+    op.execute("ANALYZE contact")
+
+
+def downgrade() -> None:
+    op.execute("LOCK TABLE contact IN ACCESS EXCLUSIVE MODE")
+    op.execute("ALTER TABLE contact RENAME TO contact_partitioned")
+    op.execute("ALTER TABLE contact_partitioned RENAME CONSTRAINT contact_pkey TO contact_partitioned_pkey")
+    op.execute("ALTER TABLE contact_partitioned RENAME CONSTRAINT uq_contact_user_email "
+               "TO uq_contact_partitioned_user_email")
+    op.execute("ALTER TABLE contact_partitioned RENAME CONSTRAINT uq_contact_user_phone "
+               "TO uq_contact_partitioned_user_phone")
+    op.execute("""
+        CREATE TABLE contact (
+            id integer NOT NULL DEFAULT nextval('contact_id_seq'),
+            first_name varchar,
+            last_name varchar,
+            email varchar,
+            phone_number varchar,
+            email_normalized varchar,
+            phone_normalized varchar,
+            birthday date,
+            additional_info varchar,
+            user_id integer REFERENCES users (id),
+            CONSTRAINT contact_pkey PRIMARY KEY (id),
+            CONSTRAINT uq_contact_user_email UNIQUE (user_id, email_normalized),
+            CONSTRAINT uq_contact_user_phone UNIQUE (user_id, phone_normalized)
+        )
+    """)
+    op.execute("ALTER SEQUENCE contact_id_seq OWNED BY contact.id")
+    op.execute(f"INSERT INTO contact ({COLUMN_LIST}) SELECT {COLUMN_LIST} FROM contact_partitioned")
+    op.execute("DROP TABLE contact_partitioned")
+    op.create_index('ix_contact_id', 'contact', ['id'], unique=False)
+    op.create_index('ix_contact_first_name', 'contact', ['first_name'], unique=False)
+    op.create_index('ix_contact_last_name', 'contact', ['last_name'], unique=False)
+    op.create_index('ix_contact_email', 'contact', ['email'], unique=False)
+    op.create_index('ix_contact_phone_number', 'contact', ['phone_number'], unique=False)
@@ -0,0 +1,76 @@
+"""contact soft delete
+
+Revision ID: 1948f365cb26
+Revises: d5b68535fdae
+Create Date: 2026-10-19 17:02:41.519306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from src.db.migrations import create_index_concurrently, drop_index_concurrently, run_with_lock_timeout
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1948f365cb26'
+down_revision: Union[str, None] = 'd5b68535fdae'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# the indexes only cover live rows, so tombstones cost live queries nothing and free their email and phone
+LIVE = "deleted_at IS NULL"
+UNIQUE_KEYS = {
+    "uq_contact_user_email": "(user_id, email_normalized)",
+    "uq_contact_user_phone": "(user_id, phone_normalized)",
+}
+INDEXES = {
+    "ix_contact_user_birthday": "(user_id, birthday)",
+    "ix_contact_user_name": "(user_id, last_name, first_name)",
+    "ix_contact_user_first_name_prefix": "(user_id, lower(first_name) text_pattern_ops)",
+    "ix_contact_user_last_name_prefix": "(user_id, lower(last_name) text_pattern_ops)",
+    "ix_contact_user_email_prefix": "(user_id, lower(email) text_pattern_ops)",
+    "ix_contact_search_vector": "USING gin (user_id, search_vector)",
+}
+
+
+def replace_index(conn, name: str, columns: str, where: str | None = None, unique: bool = False,
+                  constraint: bool = False) -> None:
+    # the new index is built beside the old one, which keeps serving (and enforcing) until
+    # the swap; only the drop and the rename take a lock, and only briefly
+    create_index_concurrently(conn, f"{name}_new", "contact", columns, where=where, unique=unique)
+    if constraint:
+        run_with_lock_timeout(conn, f"ALTER TABLE contact DROP CONSTRAINT IF EXISTS {name}")
+    else:
+        drop_index_concurrently(conn, name)
+    run_with_lock_timeout(conn, f"ALTER INDEX {name}_new RENAME TO {name}")
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        # a nullable column without a default is a catalog-only change
+        run_with_lock_timeout(conn, "ALTER TABLE contact ADD COLUMN IF NOT EXISTS deleted_at timestamp")
+        for name, columns in UNIQUE_KEYS.items():
+            replace_index(conn, name, columns, where=LIVE, unique=True, constraint=True)
+        for name, columns in INDEXES.items():
+            replace_index(conn, name, columns, where=LIVE)
+        # tombstones, for the purge job
+        create_index_concurrently(conn, "ix_contact_deleted_at", "contact", "(deleted_at)",
+                                  where="deleted_at IS NOT NULL")
+
+
+def downgrade() -> None:
+    # tombstones would collide with live rows under the full unique keys
+    op.execute("DELETE FROM contact WHERE deleted_at IS NOT NULL")
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        drop_index_concurrently(conn, "ix_contact_deleted_at")
+        for name, columns in INDEXES.items():
+            replace_index(conn, name, columns)
+        # a unique constraint on a partitioned table cannot adopt an existing index, so it
+        # is built under the table lock
+        for name, columns in UNIQUE_KEYS.items():
+            drop_index_concurrently(conn, name)
+            run_with_lock_timeout(conn, f"ALTER TABLE contact ADD CONSTRAINT {name} UNIQUE {columns}")
+        run_with_lock_timeout(conn, "ALTER TABLE contact DROP COLUMN deleted_at")
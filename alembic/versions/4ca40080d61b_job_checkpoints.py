@@ -0,0 +1,32 @@
+"""job checkpoints
+
+Revision ID: 4ca40080d61b
+Revises: 7d413296b541
+Create Date: 2026-10-19 13:41:05.318227
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4ca40080d61b'
+down_revision: Union[str, None] = '7d413296b541'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('job_checkpoints',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('run_date', sa.Date(), nullable=False),
+    sa.Column('last_user_id', sa.Integer(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name', 'run_date')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('job_checkpoints')
@@ -0,0 +1,37 @@
+"""shard directory
+
+Revision ID: 5a0c7e2d9b14
+Revises: 1948f365cb26
+Create Date: 2026-10-19 19:12:07.402113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a0c7e2d9b14'
+down_revision: Union[str, None] = '1948f365cb26'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('shard_directory',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('email', sa.String(length=250), nullable=False),
+    sa.Column('shard', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id'),
+    sa.UniqueConstraint('email')
+    )
+    # the existing users stay where they are, on the catalog shard; only shard 0 reads
+    # the directory, on the other shards the table stays empty
+    op.execute("INSERT INTO shard_directory (user_id, email, shard) SELECT id, email, 0 FROM users")
+    op.execute("SELECT setval(pg_get_serial_sequence('shard_directory', 'user_id'), "
+               "coalesce((SELECT max(user_id) FROM shard_directory), 0) + 1, false)")
+
+
+def downgrade() -> None:
+    op.drop_table('shard_directory')
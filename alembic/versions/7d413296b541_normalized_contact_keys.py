@@ -0,0 +1,76 @@
+"""normalized contact keys
+
+Revision ID: 7d413296b541
+Revises: d76a8e9fff72
+Create Date: 2026-10-19 11:02:17.550381
+
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d413296b541'
+down_revision: Union[str, None] = 'd76a8e9fff72'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('contact', sa.Column('email_normalized', sa.String(), nullable=True))
+    op.add_column('contact', sa.Column('phone_normalized', sa.String(), nullable=True))
+
+    # one set-based UPDATE mirroring src.services.normalization as of this revision, frozen
+    # here so later changes to the application do not rewrite history; a second contact
+    # with the same key for a user keeps NULL and is left for the duplicate finder
+    # instead of failing the unique constraint
+    op.execute(sa.text(r"""
+        UPDATE contact SET email_normalized = CASE WHEN keys.email_rank = 1 THEN keys.email_key END,
+                           phone_normalized = CASE WHEN keys.phone_rank = 1 THEN keys.phone_key END
+        FROM (
+            SELECT id, email_key, phone_key,
+                   row_number() OVER (PARTITION BY user_id, email_key ORDER BY id) AS email_rank,
+                   row_number() OVER (PARTITION BY user_id, phone_key ORDER BY id) AS phone_rank
+            FROM (
+                SELECT id, user_id,
+                       NULLIF(lower(regexp_replace(email, '^\s+|\s+$', '', 'g')), '') AS email_key,
+                       CASE
+                           WHEN digits = '' THEN NULL
+                           WHEN phone LIKE '+%' THEN '+' || digits
+                           WHEN digits LIKE '00%' THEN '+' || substr(digits, 3)
+                           WHEN :country_code = '1' AND length(digits) = 11 AND digits LIKE '1%'
+                               THEN '+1' || substr(digits, 2)
+                           WHEN :country_code <> '1' AND digits LIKE '0%'
+                               THEN '+' || :country_code || substr(digits, 2)
+                           ELSE '+' || :country_code || digits
+                       END AS phone_key
+                FROM (
+                    SELECT id, user_id, email, regexp_replace(phone_number, '^\s+|\s+$', '', 'g') AS phone,
+                           regexp_replace(coalesce(phone_number, ''), '\D', '', 'g') AS digits
+                    FROM contact
+                ) AS raw
+            ) AS normalized
+        ) AS keys
+        WHERE contact.id = keys.id
+    """).bindparams(country_code=os.getenv('PHONE_DEFAULT_COUNTRY_CODE', '1')))
+
+    op.drop_index('ix_contact_email', table_name='contact')
+    op.drop_index('ix_contact_phone_number', table_name='contact')
+    op.create_index(op.f('ix_contact_email'), 'contact', ['email'], unique=False)
+    op.create_index(op.f('ix_contact_phone_number'), 'contact', ['phone_number'], unique=False)
+    op.create_unique_constraint('uq_contact_user_email', 'contact', ['user_id', 'email_normalized'])
+    op.create_unique_constraint('uq_contact_user_phone', 'contact', ['user_id', 'phone_normalized'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_contact_user_phone', 'contact', type_='unique')
+    op.drop_constraint('uq_contact_user_email', 'contact', type_='unique')
+    op.drop_index(op.f('ix_contact_phone_number'), table_name='contact')
+    op.drop_index(op.f('ix_contact_email'), table_name='contact')
+    op.create_index('ix_contact_phone_number', 'contact', ['phone_number'], unique=True)
+    op.create_index('ix_contact_email', 'contact', ['email'], unique=True)
+    op.drop_column('contact', 'phone_normalized')
+    op.drop_column('contact', 'email_normalized')
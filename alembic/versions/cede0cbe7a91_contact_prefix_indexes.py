@@ -0,0 +1,32 @@
+"""contact prefix indexes
+
+Revision ID: cede0cbe7a91
+Revises: 11851cf0cf01
+Create Date: 2026-10-19 15:08:33.671420
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'cede0cbe7a91'
+down_revision: Union[str, None] = '11851cf0cf01'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PREFIX_COLUMNS = ('first_name', 'last_name', 'email')
+
+
+def upgrade() -> None:
+    # created on the partitioned parent, PostgreSQL builds one per partition
+    for column in PREFIX_COLUMNS:
+        op.create_index(f'ix_contact_user_{column}_prefix', 'contact',
+                        ['user_id', sa.text(f'lower({column}) text_pattern_ops')], unique=False)
+
+
+def downgrade() -> None:
+    for column in PREFIX_COLUMNS:
+        op.drop_index(f'ix_contact_user_{column}_prefix', table_name='contact')
@@ -0,0 +1,42 @@
+"""full text search
+
+Revision ID: d5b68535fdae
+Revises: cede0cbe7a91
+Create Date: 2026-10-19 15:52:10.284957
+
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5b68535fdae'
+down_revision: Union[str, None] = 'cede0cbe7a91'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_CONFIG = os.getenv('SEARCH_TS_CONFIG', 'simple')
+# names weigh most, then email and phone, then the free-text notes
+SEARCH_VECTOR_SQL = f"""
+    setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(first_name, '') || ' ' || coalesce(last_name, '')), 'A') ||
+    setweight(to_tsvector('{SEARCH_CONFIG}',
+        coalesce(email, '') || ' ' || translate(split_part(coalesce(email, ''), '@', 1), '._-+', '    ') || ' ' ||
+        coalesce(phone_number, '') || ' ' || coalesce(phone_normalized, '')), 'B') ||
+    setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(additional_info, '')), 'C')
+"""
+
+
+def upgrade() -> None:
+    # btree_gin lets the GIN index lead with user_id, so a search only visits one user's entries
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    # a stored generated column is computed for existing rows here (a table rewrite) and
+    # kept current by PostgreSQL on every insert and update
+    op.execute(f"ALTER TABLE contact ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED")
+    op.execute("CREATE INDEX ix_contact_search_vector ON contact USING gin (user_id, search_vector)")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX ix_contact_search_vector")
+    op.execute("ALTER TABLE contact DROP COLUMN search_vector")
@@ -0,0 +1,46 @@
+"""contact stats
+
+Revision ID: d76a8e9fff72
+Revises: 1c6f1ce08341
+Create Date: 2026-10-19 10:12:41.204118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd76a8e9fff72'
+down_revision: Union[str, None] = '1c6f1ce08341'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('contact_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('birth_month', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('missing_phone', sa.Integer(), nullable=False),
+    sa.Column('missing_email', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'birth_month')
+    )
+    # backfill from existing contacts, afterwards the application maintains the counters
+    op.execute("""
+        INSERT INTO contact_stats (user_id, birth_month, total, missing_phone, missing_email)
+        SELECT user_id,
+               COALESCE(EXTRACT(MONTH FROM birthday)::int, 0),
+               COUNT(*),
+               COUNT(*) FILTER (WHERE COALESCE(TRIM(phone_number), '') = ''),
+               COUNT(*) FILTER (WHERE COALESCE(TRIM(email), '') = '')
+        FROM contact
+        WHERE user_id IS NOT NULL
+        GROUP BY 1, 2
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('contact_stats')
@@ -0,0 +1,123 @@
+"""
+Shared helpers for the benchmark suite: offline environment defaults, result files
+and an in-process application wired to SQLite and fakeredis.
+"""
+import json
+import os
+import platform
+import statistics
+import sys
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+RESULTS_DIR = Path(os.getenv('BENCH_RESULTS_DIR', Path(__file__).parent / 'results'))
+
+OFFLINE_DATABASE_URL = "sqlite:///./bench.db"
+
+OFFLINE_ENV = {
+    'DATABASE_URL': OFFLINE_DATABASE_URL,
+    'SECRET_KEY': 'benchmark-secret',
+    'JWT_ALGORITHM': 'HS256',
+    'ACCESS_TOKEN_EXPIRE_MINUTES': '60',
+    'REFRESH_TOKEN_EXPIRE_DAYS': '7',
+    'MAIL_USERNAME': 'bench@example.com',
+    'MAIL_PASSWORD': 'bench',
+    'MAIL_FROM': 'bench@example.com',
+    'MAIL_PORT': '465',
+    'MAIL_SERVER': 'localhost',
+}
+
+
+def configure_offline_env(database_url: str | None = None) -> None:
+    """
+    Fills in the settings the application reads at import time, so benchmarks run
+    without a ``.env`` file. Values already present in the environment win.
+
+    Must be called before anything from ``src`` or ``main`` is imported.
+
+    :param database_url: Database to use instead of the local SQLite file.
+    :type database_url: str, optional
+    """
+    if database_url:
+        os.environ['DATABASE_URL'] = database_url
+    for key, value in OFFLINE_ENV.items():
+        os.environ.setdefault(key, value)
+
+
+def percentiles(samples: list[float]) -> dict:
+    """
+    Summarises latency samples (seconds) into milliseconds.
+
+    :param samples: Latency samples in seconds.
+    :type samples: list[float]
+    :return: count, mean and p50/p95/p99/max in milliseconds.
+    :rtype: dict
+    """
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def write_result(name: str, payload: dict) -> Path:
+    """
+    Writes a benchmark result as JSON into :data:`RESULTS_DIR`.
+
+    The file carries enough metadata (timestamp, python, platform) for
+    ``benchmarks.compare`` to diff two runs in CI.
+
+    :param name: Result name, used as the file name.
+    :type name: str
+    :param payload: Benchmark-specific measurements.
+    :type payload: dict
+    :return: Path of the written file.
+    :rtype: Path
+    """
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    path = RESULTS_DIR / f"{name}.json"
+    document = {
+        "name": name,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": payload,
+    }
+    path.write_text(json.dumps(document, indent=2, default=str))
+    return path
+
+
+async def _unique_identifier(request):
+    # every request gets its own rate-limit bucket, the limiter still runs but never trips
+    return uuid.uuid4().hex
+
+
+async def init_local_app():
+    """
+    Returns the FastAPI application with the rate limiter bound to fakeredis and the
+    tables created in the configured database, for in-process load generation.
+
+    :return: The application object from ``main``.
+    :rtype: FastAPI
+    """
+    import fakeredis
+    from fastapi_limiter import FastAPILimiter
+
+    from main import app
+    from src.db.db import engine
+    from src.db.models import Base
+
+    Base.metadata.create_all(bind=engine)
+    await FastAPILimiter.init(fakeredis.FakeAsyncRedis(decode_responses=True), identifier=_unique_identifier)
+    return app
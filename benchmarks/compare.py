@@ -0,0 +1,78 @@
+"""
+Compares two benchmark result files and fails on regressions.
+
+Usage::
+
+    python -m benchmarks.compare baseline/load.json benchmarks/results/load.json --threshold 0.15
+    python -m benchmarks.compare baseline/micro.json benchmarks/results/micro.json
+
+Understands the files written by :func:`benchmarks.common.write_result` (latency
+percentiles per operation) and pytest-benchmark ``--benchmark-json`` output (mean
+time per benchmark). Exits with status 1 when any metric is slower than the baseline
+by more than ``--threshold``.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def flatten(document: dict) -> dict[str, float]:
+    """
+    Extracts comparable "lower is better" metrics from a result document.
+
+    :param document: A parsed result file.
+    :type document: dict
+    :return: Metric name to value.
+    :rtype: dict[str, float]
+    """
+    if "benchmarks" in document:
+        return {f"{b['name']}.mean_s": b["stats"]["mean"] for b in document["benchmarks"]}
+    metrics = {}
+    for operation, stats in document.get("results", {}).get("operations", {}).items():
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if key in stats:
+                metrics[f"{operation}.{key}"] = stats[key]
+    return metrics
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[tuple[str, float, float, float]]:
+    """
+    Returns the metrics present in both documents with their relative change.
+
+    :param baseline: The baseline result document.
+    :type baseline: dict
+    :param current: The result document to check.
+    :type current: dict
+    :param threshold: Allowed relative slowdown, 0.1 means 10%.
+    :type threshold: float
+    :return: Rows of (metric, baseline, current, change), regressions first.
+    :rtype: list[tuple[str, float, float, float]]
+    """
+    old, new = flatten(baseline), flatten(current)
+    rows = []
+    for name in sorted(old.keys() & new.keys()):
+        change = (new[name] - old[name]) / old[name] if old[name] else 0.0
+        rows.append((name, old[name], new[name], change))
+    rows.sort(key=lambda row: row[3] <= threshold)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("current", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+
+    rows = compare(json.loads(args.baseline.read_text()), json.loads(args.current.read_text()), args.threshold)
+    regressions = 0
+    for name, old, new, change in rows:
+        flag = "REGRESSION" if change > args.threshold else ""
+        regressions += bool(flag)
+        print(f"{name:50} {old:12.4f} {new:12.4f} {change:+8.1%} {flag}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+CPU cost versus bytes saved when compressing typical contact list pages.
+
+Usage::
+
+    python -m benchmarks.compression --pages 200
+
+Builds ``--pages`` JSON pages of ``--page-size`` contacts (default 100, the largest
+``/contact/contacts`` page) exactly as the API serialises them, and for every
+available encoding and a range of levels reports the median time to compress and
+decompress one page, the compressed size and the ratio. ``cache_hit`` is the cost of
+serving a page from :class:`~src.services.compression.CompressedBodyCache` instead
+(hashing the body and a dictionary lookup). ``br`` and ``zstd`` are measured when the
+``brotli`` and ``zstandard`` packages are installed.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import statistics
+import time
+
+from benchmarks.common import configure_offline_env, write_result
+from benchmarks.seed import make_contact
+
+LEVELS = {"gzip": (1, 4, 6, 9), "br": (1, 4, 6, 11), "zstd": (1, 3, 6, 12)}
+
+
+def make_pages(pages: int, page_size: int, seed: int) -> list[bytes]:
+    from src.schemas import ContactResponse
+
+    rng = random.Random(seed)
+    result = []
+    for page in range(pages):
+        contacts = [ContactResponse(id=page * page_size + n, **make_contact(rng, page, n, 1)).model_dump(mode="json")
+                    for n in range(page_size)]
+        result.append(json.dumps(contacts, separators=(",", ":")).encode())
+    return result
+
+
+def codecs() -> dict:
+    from src.services import compression
+
+    available = {"gzip": (lambda level: lambda body: gzip.compress(body, compresslevel=level, mtime=0),
+                          gzip.decompress)}
+    if compression.brotli is not None:
+        brotli = compression.brotli
+        available["br"] = (lambda level: lambda body: brotli.compress(body, quality=level), brotli.decompress)
+    if compression.zstandard is not None:
+        zstandard = compression.zstandard
+        available["zstd"] = (lambda level: zstandard.ZstdCompressor(level=level).compress,
+                             zstandard.ZstdDecompressor().decompress)
+    return available
+
+
+def median_us(function, pages: list[bytes]) -> float:
+    samples = []
+    for page in pages:
+        started = time.perf_counter()
+        function(page)
+        samples.append(time.perf_counter() - started)
+    return round(statistics.median(samples) * 1_000_000, 1)
+
+
+def measure(pages: list[bytes]) -> dict:
+    plain = sum(len(page) for page in pages)
+    results = {"plain_bytes_per_page": plain // len(pages)}
+    for name, (make_compressor, decompress) in codecs().items():
+        for level in LEVELS[name]:
+            compress = make_compressor(level)
+            compressed = [compress(page) for page in pages]
+            size = sum(len(page) for page in compressed)
+            compress_us = median_us(compress, pages)
+            results[f"{name}-{level}"] = {
+                "compress_us": compress_us,
+                "decompress_us": median_us(decompress, compressed),
+                "bytes_per_page": size // len(pages),
+                "ratio": round(plain / size, 2),
+                "saved_bytes_per_cpu_ms": round((plain - size) / len(pages) / (compress_us / 1000)),
+            }
+    cache = {hashlib.sha256(page).digest(): page for page in pages}
+    results["cache_hit"] = {"lookup_us": median_us(lambda page: cache.get(hashlib.sha256(page).digest()), pages)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    configure_offline_env()
+    results = measure(make_pages(args.pages, args.page_size, args.seed))
+    print(f"plain page: {results['plain_bytes_per_page']} bytes")
+    for name, summary in results.items():
+        if name.startswith(("gzip", "br", "zstd")):
+            print(f"{name:8} {summary['compress_us']:8} us compress  {summary['decompress_us']:7} us decompress  "
+                  f"{summary['bytes_per_page']:6} bytes  x{summary['ratio']}")
+    print(f"cache hit {results['cache_hit']['lookup_us']} us")
+    print(write_result("compression", results))
+
+
+if __name__ == "__main__":
+    main()
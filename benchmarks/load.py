@@ -0,0 +1,225 @@
+"""
+Asynchronous load generator for the contacts API.
+
+Usage::
+
+    # against a running server (seed the same database first)
+    python -m benchmarks.load --base-url http://127.0.0.1:8000 --users 10 --concurrency 20 --duration 30
+
+    # fully offline: the app runs in-process on SQLite and fakeredis
+    python -m benchmarks.seed --users 10 --contacts 100 --reset
+    python -m benchmarks.load --in-process --users 10 --concurrency 20 --duration 10
+
+Each virtual user logs in as a seeded user and then picks operations from ``--mix``
+(``login``, ``list``, ``search``, ``birthdays``, ``crud``) by weight. Latency
+percentiles, throughput and status codes per operation go to
+``benchmarks/results/<name>.json``.
+
+Against a live server the per-IP rate limiter would throttle the run, so every
+request carries a random ``X-Forwarded-For`` address, which the limiter uses as the
+client identity.
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import httpx
+
+from benchmarks.common import configure_offline_env, percentiles, write_result
+from benchmarks.seed import FIRST_NAMES, PASSWORD, user_email
+
+DEFAULT_MIX = "list=40,search=20,birthdays=10,crud=25,login=5"
+
+
+def parse_mix(mix: str) -> dict[str, int]:
+    """
+    Parses an operation mix such as ``"list=40,crud=10"``.
+
+    :param mix: Comma separated ``operation=weight`` pairs.
+    :type mix: str
+    :return: Weight per operation.
+    :rtype: dict[str, int]
+    :raises ValueError: If an operation is unknown.
+    """
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}', expected one of {sorted(OPERATIONS)}")
+        weights[name] = int(weight or 1)
+    return weights
+
+
+class Recorder:
+    """
+    Collects latency samples and status codes per operation.
+    """
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    async def call(self, operation: str, coro):
+        started = time.perf_counter()
+        try:
+            response = await coro
+            status = response.status_code
+        except httpx.HTTPError as err:
+            response, status = None, type(err).__name__
+        self.samples[operation].append(time.perf_counter() - started)
+        self.statuses[operation][str(status)] += 1
+        return response
+
+    def summary(self, elapsed: float) -> dict:
+        total = sum(len(s) for s in self.samples.values())
+        ok = sum(n for c in self.statuses.values() for status, n in c.items() if status.startswith("2"))
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "requests": total,
+            "rps": round(total / elapsed, 2) if elapsed else 0,
+            "goodput_rps": round(ok / elapsed, 2) if elapsed else 0,
+            "operations": {
+                name: {**percentiles(samples), "statuses": dict(self.statuses[name])}
+                for name, samples in sorted(self.samples.items())
+            },
+        }
+
+
+def _headers(token: str | None = None) -> dict:
+    headers = {"X-Forwarded-For": f"10.{random.randrange(256)}.{random.randrange(256)}.{random.randrange(256)}"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    return headers
+
+
+async def op_login(client, recorder, state):
+    response = await recorder.call("login", client.post(
+        "/auth/login", data={"username": state["email"], "password": PASSWORD}, headers=_headers()))
+    if response is not None and response.status_code == 200:
+        state["token"] = response.json()["access_token"]
+
+
+async def op_list(client, recorder, state):
+    await recorder.call("list", client.get(
+        "/contact/contacts", params={"skip": random.randrange(0, 50), "limit": 10}, headers=_headers(state["token"])))
+
+
+async def op_search(client, recorder, state):
+    await recorder.call("search", client.get(
+        "/contact/contacts/search", params={"first_name": random.choice(FIRST_NAMES)[:3]},
+        headers=_headers(state["token"])))
+
+
+async def op_birthdays(client, recorder, state):
+    await recorder.call("birthdays", client.get(
+        "/contact/contacts/upcoming-birthdays", headers=_headers(state["token"])))
+
+
+async def op_crud(client, recorder, state):
+    suffix = uuid.uuid4().hex[:12]
+    body = {
+        "first_name": "Load",
+        "last_name": "Test",
+        "email": f"load.{suffix}@example.com",
+        "phone_number": f"+1555{int(suffix, 16) % 10 ** 10:010d}",
+        "birthday": "1990-01-01",
+        "additional_info": "created by benchmarks.load",
+    }
+    headers = _headers(state["token"])
+    response = await recorder.call("crud.create", client.post("/contact/contacts", json=body, headers=headers))
+    if response is None or response.status_code != 201:
+        return
+    contact_id = response.json()["id"]
+    await recorder.call("crud.read", client.get(f"/contact/contacts/{contact_id}", headers=headers))
+    body["additional_info"] = "updated by benchmarks.load"
+    await recorder.call("crud.update", client.put(f"/contact/contacts/{contact_id}", json=body, headers=headers))
+    await recorder.call("crud.delete", client.delete(f"/contact/contacts/{contact_id}", headers=headers))
+
+
+OPERATIONS = {
+    "login": op_login,
+    "list": op_list,
+    "search": op_search,
+    "birthdays": op_birthdays,
+    "crud": op_crud,
+}
+
+
+async def virtual_user(client, recorder, email, weights, deadline):
+    state = {"email": email, "token": None}
+    await op_login(client, recorder, state)
+    if not state["token"]:
+        return
+    names, cum = list(weights), list(weights.values())
+    while time.perf_counter() < deadline:
+        operation = random.choices(names, weights=cum)[0]
+        await OPERATIONS[operation](client, recorder, state)
+
+
+async def run(base_url: str | None, users: int, concurrency: int, duration: float, mix: str) -> dict:
+    """
+    Drives ``concurrency`` virtual users for ``duration`` seconds.
+
+    :param base_url: URL of a running server, or None to run the app in-process.
+    :type base_url: str, optional
+    :param users: Number of seeded users to log in as.
+    :type users: int
+    :param concurrency: Number of concurrent virtual users.
+    :type concurrency: int
+    :param duration: Run time in seconds.
+    :type duration: float
+    :param mix: Operation mix, see :func:`parse_mix`.
+    :type mix: str
+    :return: The run summary.
+    :rtype: dict
+    """
+    weights = parse_mix(mix)
+    if base_url is None:
+        from benchmarks.common import init_local_app
+        transport = httpx.ASGITransport(app=await init_local_app())
+        base_url = "http://bench"
+    else:
+        transport = None
+
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(
+            virtual_user(client, recorder, user_email(n % users), weights, deadline) for n in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+    return {
+        "config": {"base_url": base_url, "users": users, "concurrency": concurrency,
+                   "duration_s": duration, "mix": weights},
+        **recorder.summary(elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--base-url")
+    target.add_argument("--in-process", action="store_true")
+    parser.add_argument("--db-url", default=None, help="database for --in-process runs")
+    parser.add_argument("--users", type=int, default=10, help="seeded users to log in as")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--name", default="load", help="result file name")
+    args = parser.parse_args()
+
+    if args.in_process:
+        configure_offline_env(args.db_url)
+    summary = asyncio.run(run(args.base_url, args.users, args.concurrency, args.duration, args.mix))
+    path = write_result(args.name, summary)
+    print(f"{summary['requests']} requests, {summary['rps']} rps -> {path}")
+
+
+if __name__ == "__main__":
+    main()
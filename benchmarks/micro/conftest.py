@@ -0,0 +1,30 @@
+import random
+
+import pytest
+
+from benchmarks.common import configure_offline_env
+
+configure_offline_env("sqlite://")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from benchmarks.seed import make_contact
+from src.db.models import Base, Contact, User
+
+
+@pytest.fixture(scope="session")
+def bench_session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    user = User(username="bench", email="bench-user-0@example.com", password="x", confirmed=True)
+    db.add(user)
+    db.commit()
+    rng = random.Random(42)
+    db.add_all(Contact(**make_contact(rng, 0, n, user.id)) for n in range(100))
+    db.commit()
+    yield db
+    db.close()
+    engine.dispose()
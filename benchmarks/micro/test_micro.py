@@ -0,0 +1,107 @@
+"""
+Microbenchmarks for the hot paths of a request, run with pytest-benchmark::
+
+    pytest benchmarks/micro --benchmark-json=benchmarks/results/micro.json
+
+The ``contact-by-id`` and ``user-by-email`` groups compare the per-query Python
+overhead of building a query with the ORM ``Query`` API on every call against the
+statements built once in the repositories; ``build`` and ``compile`` split that
+overhead into constructing the query and compiling it without the statement cache.
+"""
+import asyncio
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from src.db.models import Contact, User
+from src.repository import contacts as repository_contacts
+from src.repository import users as repository_users
+from src.schemas import ContactResponse
+from src.services.auth import auth_service
+
+
+def test_password_verify(benchmark):
+    hashed = auth_service.get_password_hash("benchpass")
+    assert benchmark(auth_service.verify_password, "benchpass", hashed)
+
+
+def test_access_token_roundtrip(benchmark):
+    def roundtrip():
+        token = asyncio.run(auth_service.create_access_token(data={"sub": "bench-user-0@example.com"}))
+        return asyncio.run(auth_service.get_email_from_token(token))
+
+    assert benchmark(roundtrip) == "bench-user-0@example.com"
+
+
+def test_get_user_by_email(benchmark, bench_session):
+    def lookup():
+        return asyncio.run(repository_users.get_user_by_email("bench-user-0@example.com", bench_session))
+
+    assert benchmark(lookup) is not None
+
+
+def test_list_page_query(benchmark, bench_session):
+    def page():
+        return bench_session.query(Contact).filter(Contact.user_id == 1).offset(0).limit(100).all()
+
+    assert len(benchmark(page)) == 100
+
+
+def test_serialize_contact_page(benchmark, bench_session):
+    contacts = bench_session.query(Contact).limit(100).all()
+
+    def serialize():
+        return [ContactResponse.model_validate(contact, from_attributes=True).model_dump(mode="json")
+                for contact in contacts]
+
+    assert len(benchmark(serialize)) == 100
+
+
+@pytest.mark.benchmark(group="contact-by-id")
+def test_contact_by_id_orm_query(benchmark, bench_session):
+    def lookup():
+        return bench_session.query(Contact).filter(Contact.id == 7, Contact.user_id == 1).first()
+
+    assert benchmark(lookup).id == 7
+
+
+@pytest.mark.benchmark(group="contact-by-id")
+def test_contact_by_id_cached_statement(benchmark, bench_session):
+    def lookup():
+        return bench_session.scalars(repository_contacts.CONTACT_BY_ID, {"contact_id": 7, "user_id": 1}).first()
+
+    assert benchmark(lookup).id == 7
+
+
+@pytest.mark.benchmark(group="user-by-email")
+def test_user_by_email_orm_query(benchmark, bench_session):
+    def lookup():
+        return bench_session.query(User).filter(User.email == "bench-user-0@example.com").first()
+
+    assert benchmark(lookup) is not None
+
+
+@pytest.mark.benchmark(group="user-by-email")
+def test_user_by_email_cached_statement(benchmark, bench_session):
+    def lookup():
+        return bench_session.scalars(repository_users.USER_BY_EMAIL, {"email": "bench-user-0@example.com"}).first()
+
+    assert benchmark(lookup) is not None
+
+
+@pytest.mark.benchmark(group="build")
+def test_build_contact_query(benchmark, bench_session):
+    def build():
+        return bench_session.query(Contact).filter(Contact.id == 7, Contact.user_id == 1).limit(1).statement
+
+    assert benchmark(build) is not None
+
+
+@pytest.mark.benchmark(group="compile")
+def test_compile_contact_query(benchmark):
+    dialect = postgresql.dialect()
+
+    def compile_uncached():
+        return str(repository_contacts.CONTACT_BY_ID.compile(dialect=dialect))
+
+    assert "LIMIT" in benchmark(compile_uncached)
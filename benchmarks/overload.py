@@ -0,0 +1,106 @@
+"""
+Overload test for the admission control middleware.
+
+Usage::
+
+    python -m benchmarks.overload --capacity 4 --service-ms 20 --duration 3
+
+Runs open-loop traffic at increasing multiples of the backend's capacity against a
+synthetic ASGI app whose handler holds one of ``--capacity`` slots (think: pooled DB
+connections) for ``--service-ms``, once bare and once behind
+:class:`src.services.admission.AdmissionControlMiddleware`. A response only counts as
+goodput if it succeeded within the client timeout; requests the client gave up on
+still occupy the backend, as they would in production.
+
+Without admission control goodput collapses once offered load passes capacity,
+because every request queues behind work nobody is waiting for anymore. With it,
+excess requests are shed early with 503 and goodput stays near capacity.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.common import write_result
+from src.services.admission import AdmissionControlMiddleware, CoDel
+
+
+def make_backend(capacity: int, service_time: float):
+    slots = asyncio.Semaphore(capacity)
+
+    async def app(scope, receive, send):
+        async with slots:
+            await asyncio.sleep(service_time)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    return app
+
+
+async def drive(app, rate: float, duration: float, timeout: float) -> dict:
+    latencies, statuses = [], []
+
+    async def one(client):
+        started = time.perf_counter()
+        response = await client.get("/contact/contacts")
+        latencies.append(time.perf_counter() - started)
+        statuses.append(response.status_code)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                 timeout=None) as client:
+        tasks = []
+        started = time.perf_counter()
+        sent = 0
+        while time.perf_counter() - started < duration:
+            due = int((time.perf_counter() - started) * rate)
+            while sent < due:
+                tasks.append(asyncio.create_task(one(client)))
+                sent += 1
+            await asyncio.sleep(0.001)
+        await asyncio.gather(*tasks)
+
+    good = sum(1 for status, latency in zip(statuses, latencies) if status == 200 and latency <= timeout)
+    return {
+        "offered_rps": rate,
+        "goodput_rps": round(good / duration, 1),
+        "shed": statuses.count(503),
+        "late": sum(1 for status, latency in zip(statuses, latencies) if status == 200 and latency > timeout),
+    }
+
+
+async def run(capacity: int, service_ms: float, duration: float, timeout: float, multiples: list[float]) -> dict:
+    service_time = service_ms / 1000
+    capacity_rps = capacity / service_time
+    results = {"capacity_rps": capacity_rps, "bare": [], "admission": []}
+    for multiple in multiples:
+        rate = capacity_rps * multiple
+        results["bare"].append(await drive(make_backend(capacity, service_time), rate, duration, timeout))
+        guarded = AdmissionControlMiddleware(
+            make_backend(capacity, service_time), limits={"read": capacity},
+            max_wait=timeout / 2,
+        )
+        for queue in guarded.queues.values():
+            queue.codel = CoDel(target=service_time, interval=10 * service_time)
+        results["admission"].append(await drive(guarded, rate, duration, timeout))
+        print(f"x{multiple}: bare {results['bare'][-1]['goodput_rps']} rps, "
+              f"admission {results['admission'][-1]['goodput_rps']} rps")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--capacity", type=int, default=4)
+    parser.add_argument("--service-ms", type=float, default=20)
+    parser.add_argument("--duration", type=float, default=3)
+    parser.add_argument("--timeout", type=float, default=0.5, help="client timeout in seconds")
+    parser.add_argument("--multiples", default="0.5,1,1.5,2,3", help="offered load as multiples of capacity")
+    args = parser.parse_args()
+
+    multiples = [float(m) for m in args.multiples.split(",")]
+    results = asyncio.run(run(args.capacity, args.service_ms, args.duration, args.timeout, multiples))
+    print(write_result("overload", results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Requests per second of ``GET /users/me/`` under the default and the tuned server runtime.
+
+Usage::
+
+    python -m benchmarks.seed --users 1 --contacts 0 --reset
+    python -m benchmarks.serving --duration 10 --concurrency 64
+
+Starts ``serve.py`` once per runtime on ``--port``, waits for ``/ops/ready``, logs in as
+the first seeded user and keeps ``--concurrency`` keep-alive connections busy with
+``GET /users/me/`` for ``--duration`` seconds. The runtimes are:
+
+``default``
+    one worker on asyncio and h11, what ``python main.py`` runs;
+``tuned``
+    ``--workers`` workers (default one per CPU) on uvloop and httptools where installed;
+``tuned-reuseport``
+    the same with one ``SO_REUSEPORT`` socket per worker.
+
+The server needs Redis (``REDIS_HOST``/``REDIS_PORT``, e.g. from docker-compose); the
+database is ``--db-url`` or the local SQLite file. The load generator runs in this
+process, so on small machines it competes with the workers for CPU; compare runs made
+on the same host.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import OFFLINE_DATABASE_URL, configure_offline_env, percentiles, write_result
+from benchmarks.load import _headers
+from benchmarks.seed import PASSWORD, user_email
+
+RUNTIMES = {
+    "default": ["--runtime", "default", "--workers", "1"],
+    "tuned": ["--runtime", "tuned"],
+    "tuned-reuseport": ["--runtime", "tuned", "--reuse-port"],
+}
+
+
+def start_server(runtime: str, port: int, workers: int | None) -> subprocess.Popen:
+    args = [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port), "--max-requests", "0",
+            *RUNTIMES[runtime]]
+    if workers and runtime != "default":
+        args += ["--workers", str(workers)]
+    return subprocess.Popen(args, env=os.environ.copy())
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 60) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if (await client.get("/ops/ready")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("server did not become ready")
+
+
+async def drive(base_url: str, concurrency: int, duration: float) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        await wait_ready(client)
+        response = await client.post("/auth/login", data={"username": user_email(0), "password": PASSWORD},
+                                     headers=_headers())
+        response.raise_for_status()
+        token = response.json()["access_token"]
+        samples, errors = [], 0
+
+        async def connection(deadline):
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    ok = (await client.get("/users/me/", headers=_headers(token))).status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                samples.append(time.perf_counter() - started)
+                errors += not ok
+
+        # a short warm-up, so every worker has connected and compiled its statements
+        await asyncio.gather(*(connection(time.perf_counter() + 1) for _ in range(concurrency)))
+        samples.clear()
+        errors = 0
+        started = time.perf_counter()
+        await asyncio.gather(*(connection(started + duration) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {"requests": len(samples), "errors": errors, "rps": round(len(samples) / elapsed, 1),
+            "latency": percentiles(samples)}
+
+
+def run(runtimes: list[str], port: int, workers: int | None, concurrency: int, duration: float) -> dict:
+    results = {"config": {"concurrency": concurrency, "duration_s": duration, "workers": workers}}
+    for runtime in runtimes:
+        server = start_server(runtime, port, workers)
+        try:
+            results[runtime] = asyncio.run(drive(f"http://127.0.0.1:{port}", concurrency, duration))
+        finally:
+            server.terminate()
+            server.wait(60)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runtimes", default="default,tuned,tuned-reuseport")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--workers", type=int, default=None, help="workers of the tuned runtimes")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--db-url", default=None, help=f"defaults to DATABASE_URL or {OFFLINE_DATABASE_URL}")
+    args = parser.parse_args()
+
+    configure_offline_env(args.db_url)
+    results = run(args.runtimes.split(","), args.port, args.workers, args.concurrency, args.duration)
+    for runtime in args.runtimes.split(","):
+        summary = results[runtime]
+        print(f"{runtime:16} {summary['rps']:9} rps  p50 {summary['latency'].get('p50_ms')} ms  "
+              f"p99 {summary['latency'].get('p99_ms')} ms  errors {summary['errors']}")
+    print(write_result("serving", results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Memory per idle Server-Sent Events stream, and the time to fan one event out to all of
+them, in one worker process.
+
+Usage::
+
+    python -m benchmarks.streams --connections 10000
+
+Starts a uvicorn worker (uvloop and httptools where installed, as ``serve.py`` runs)
+serving :meth:`src.services.events.EventHub.stream` for a single user, with the hub on
+fakeredis, so no Redis server is needed. Authentication and the database are left out:
+they cost a stream once when it opens, not while it idles. The driver opens
+``--connections`` streams in batches, waits for each stream's first line, reads the
+worker's resident memory, then publishes ``--events`` events and times until every
+stream has received each one.
+
+Both processes need a file descriptor per connection; the soft ``RLIMIT_NOFILE`` is
+raised to the hard limit, which must exceed the connection count.
+"""
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks.common import percentiles, write_result
+
+
+def raise_file_limit() -> int:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+def rss_kb(pid: int | str = "self") -> int:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def make_app():
+    import fakeredis
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, StreamingResponse
+    from starlette.routing import Route
+
+    from src.services.events import EventHub
+
+    hub = EventHub()
+
+    async def stream(request):
+        return StreamingResponse(hub.stream(1, heartbeat=3600), media_type="text/event-stream")
+
+    async def publish(request):
+        return JSONResponse({"id": await hub.publish(1, "updated", {"id": 1, "first_name": "Ann"})})
+
+    async def stats(request):
+        return JSONResponse({"rss_kb": rss_kb(), "streams": sum(len(s) for s in hub.subscribers.values())})
+
+    async def startup():
+        hub.use(fakeredis.FakeAsyncRedis(decode_responses=True))
+
+    return Starlette(routes=[Route("/stream", stream), Route("/publish", publish, methods=["POST"]),
+                             Route("/stats", stats)], on_startup=[startup])
+
+
+def serve(port: int) -> None:
+    import uvicorn
+
+    from serve import runtime_options
+
+    raise_file_limit()
+    options = runtime_options("tuned")
+    uvicorn.run(make_app(), host="127.0.0.1", port=port, loop=options["loop"], http=options["http"],
+                log_level="warning", backlog=4096, timeout_keep_alive=3600)
+
+
+async def request(port: int, method: str, path: str) -> bytes:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+    body = await reader.read()
+    writer.close()
+    return body.split(b"\r\n\r\n", 1)[1]
+
+
+async def stats(port: int) -> dict:
+    import json
+    return json.loads(await request(port, "GET", "/stats"))
+
+
+async def open_stream(port: int):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /stream HTTP/1.1\r\nHost: bench\r\nAccept: text/event-stream\r\n\r\n")
+    await reader.readuntil(b"\r\n\r\n")
+    # the first chunk, "retry: ...", once the stream is subscribed
+    await reader.readuntil(b"\n\n")
+    return reader, writer
+
+
+async def wait_ready(port: int, timeout: float = 30) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            await stats(port)
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def drive(port: int, connections: int, batch: int, events: int) -> dict:
+    await wait_ready(port)
+    baseline = await stats(port)
+    streams = []
+    started = time.perf_counter()
+    for start in range(0, connections, batch):
+        streams += await asyncio.gather(*(open_stream(port) for _ in range(min(batch, connections - start))))
+    connect_seconds = time.perf_counter() - started
+    await asyncio.sleep(1)
+    loaded = await stats(port)
+
+    fanout = []
+    for _ in range(events):
+        started = time.perf_counter()
+        await request(port, "POST", "/publish")
+        # chunked transfer encoding: a size line, then the event
+        await asyncio.gather(*(reader.readuntil(b"\n\n") for reader, _ in streams))
+        fanout.append(time.perf_counter() - started)
+
+    for _, writer in streams:
+        writer.close()
+    per_stream = (loaded["rss_kb"] - baseline["rss_kb"]) / max(loaded["streams"], 1)
+    return {
+        "connections": connections,
+        "open_streams": loaded["streams"],
+        "connect_seconds": round(connect_seconds, 2),
+        "rss_baseline_mb": round(baseline["rss_kb"] / 1024, 1),
+        "rss_loaded_mb": round(loaded["rss_kb"] / 1024, 1),
+        "kb_per_stream": round(per_stream, 2),
+        "fanout": percentiles(fanout),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=500, help="streams opened concurrently")
+    parser.add_argument("--events", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        return
+    limit = raise_file_limit()
+    if limit < args.connections + 100:
+        parser.error(f"the file descriptor limit ({limit}) is below --connections")
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.streams", "--serve", "--port", str(args.port)],
+                              env=os.environ.copy())
+    try:
+        results = asyncio.run(drive(args.port, args.connections, args.batch, args.events))
+    finally:
+        server.terminate()
+        server.wait(60)
+    print(f"{results['open_streams']} streams, {results['kb_per_stream']} KB each "
+          f"(worker {results['rss_baseline_mb']} -> {results['rss_loaded_mb']} MB), "
+          f"fan-out p50 {results['fanout'].get('p50_ms')} ms max {results['fanout'].get('max_ms')} ms")
+    print(write_result("streams", results))
+
+
+if __name__ == "__main__":
+    main()
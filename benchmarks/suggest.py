@@ -0,0 +1,98 @@
+"""
+Per-keystroke latency of the type-ahead endpoint against the substring search.
+
+Usage::
+
+    python -m benchmarks.seed --users 5 --contacts 20000 --reset
+    python -m benchmarks.suggest --in-process --words 50
+    python -m benchmarks.suggest --base-url http://127.0.0.1:8000 --words 50
+
+Logs in as the first seeded user and "types" ``--words`` random names and email
+addresses one character at a time. Every keystroke sends
+``/contact/contacts/suggest?q=<prefix>`` and, for comparison, the request the UI
+would otherwise make, ``/contact/contacts/search?first_name=<prefix>``. Latency is
+reported per prefix length, since the shortest prefixes match the most rows; the
+target is p95 under 20 ms for the suggestions.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+from benchmarks.common import configure_offline_env, percentiles, write_result
+from benchmarks.seed import FIRST_NAMES, LAST_NAMES, PASSWORD, user_email
+
+MAX_PREFIX = 8
+
+
+def _headers(token: str | None = None) -> dict:
+    # a random client address per request keeps the per-IP rate limiter out of the measurement
+    headers = {"X-Forwarded-For": f"10.{random.randrange(256)}.{random.randrange(256)}.{random.randrange(256)}"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    return headers
+
+
+async def run(base_url: str | None, words: int, seed: int) -> dict:
+    if base_url is None:
+        from benchmarks.common import init_local_app
+        transport = httpx.ASGITransport(app=await init_local_app())
+        base_url = "http://bench"
+    else:
+        transport = None
+
+    rng = random.Random(seed)
+    latencies = {"suggest": {}, "search": {}}
+    hits = {}
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, timeout=30) as client:
+        response = await client.post("/auth/login", data={"username": user_email(0), "password": PASSWORD},
+                                     headers=_headers())
+        response.raise_for_status()
+        token = response.json()["access_token"]
+        for _ in range(words):
+            word = rng.choice([rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES),
+                               f"{rng.choice(FIRST_NAMES)}.{rng.choice(LAST_NAMES)}".lower()])
+            for length in range(1, min(len(word), MAX_PREFIX) + 1):
+                prefix = word[:length]
+                for name, path, params in (("suggest", "/contact/contacts/suggest", {"q": prefix}),
+                                           ("search", "/contact/contacts/search", {"first_name": prefix})):
+                    started = time.perf_counter()
+                    response = await client.get(path, params=params, headers=_headers(token))
+                    latencies[name].setdefault(length, []).append(time.perf_counter() - started)
+                    response.raise_for_status()
+                    hits.setdefault(name, {}).setdefault(length, []).append(len(response.json()))
+
+    return {
+        name: {
+            length: {**percentiles(samples), "mean_hits": round(sum(hits[name][length]) / len(samples), 1)}
+            for length, samples in sorted(by_length.items())
+        }
+        for name, by_length in latencies.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--base-url")
+    target.add_argument("--in-process", action="store_true")
+    parser.add_argument("--db-url", default=None, help="database for --in-process runs")
+    parser.add_argument("--words", type=int, default=50, help="words to type")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.in_process:
+        configure_offline_env(args.db_url)
+    results = asyncio.run(run(args.base_url, args.words, args.seed))
+    for length, suggest in results["suggest"].items():
+        search = results["search"][length]
+        print(f"prefix {length}: suggest p50 {suggest['p50_ms']} ms p95 {suggest['p95_ms']} ms "
+              f"({suggest['mean_hits']} hits)   search p50 {search['p50_ms']} ms p95 {search['p95_ms']} ms "
+              f"({search['mean_hits']} hits)")
+    print(write_result("suggest", results))
+
+
+if __name__ == "__main__":
+    main()
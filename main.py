@@ -1,12 +1,28 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 import uvicorn
 import redis.asyncio as redis
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi_limiter import FastAPILimiter
-from src.routers.contacts import router as contact_rout
+from src.routers.contacts import router as contact_rout, stream_router as contact_stream_rout
 from src.routers.auth import router as auth_rout
 from src.routers.users import router as users_rout
+from src.routers.ops import router as ops_rout
+from src.services.admission import AdmissionControlMiddleware
+from src.services.compression import CompressionMiddleware
+from src.services.deadline import DeadlineExceeded, DisconnectMiddleware, deadline_exceeded_handler
+from src.services.events import event_hub
+from src.services.invalidation import invalidation_bus
+from src.services.idempotency import IdempotencyMiddleware
+from src.services.lifecycle import READY, STARTING, STOPPED, InFlightMiddleware, lifecycle, warm_db_pool, warm_up
+from src.services.memory import MEMORY_DIAGNOSTICS, AllocationSamplingMiddleware, memory_profiler
+from src.services.queue import RedisStreamBroker, job_queue
+from src.services.tracing import TracingMiddleware, configure_tracing, instrument_engine, instrument_redis
+from src.db.db import engine, shard_engines
+from src.db.sharding import ShardFenced, shard_fenced_handler, shard_router
 
 
 import os
@@ -14,11 +30,57 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI()
+TRACING = configure_tracing("contacts-api")
+for shard_engine in shard_engines:
+    instrument_engine(shard_engine)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Opens Redis, subscribes to cache invalidations and warms the database pools and crypto
+    backends before the first request. uvicorn runs the shutdown half only after it has
+    stopped accepting connections and waited for the open ones, so readiness is switched
+    to draining earlier, on SIGTERM (see ``serve.DrainingServer``); here the requests
+    still in flight after uvicorn's graceful timeout get their own, then Redis is closed
+    and the pools disposed.
+    """
+    lifecycle.set_state(STARTING)
+    if MEMORY_DIAGNOSTICS:
+        memory_profiler.start()
+    r = redis.Redis(host=os.getenv('REDIS_HOST'), port=os.getenv('REDIS_PORT'), db=0, encoding="utf-8",
+                    decode_responses=True)
+    instrument_redis(r)
+    await warm_up(engine, r)
+    for shard_engine in shard_engines[1:]:
+        await asyncio.to_thread(warm_db_pool, shard_engine)
+    shard_router.use(r)
+    event_hub.use(r)
+    await invalidation_bus.start(r)
+    await FastAPILimiter.init(r)
+    app.state.redis = r
+    job_queue.use(RedisStreamBroker(r))
+    lifecycle.set_state(READY)
+    try:
+        yield
+    finally:
+        # open event streams would hold the drain until its timeout; their clients reconnect elsewhere
+        await event_hub.close()
+        await lifecycle.drain()
+        await invalidation_bus.close()
+        await r.aclose()
+        for shard_engine in shard_engines:
+            shard_engine.dispose()
+        lifecycle.set_state(STOPPED)
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(contact_rout)
+app.include_router(contact_stream_rout)
 app.include_router(auth_rout)
 app.include_router(users_rout)
+app.include_router(ops_rout)
 
 origins = [ 
     "http://localhost:3000"
@@ -32,13 +94,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.on_event("startup")
-async def startup():
-    r = await redis.Redis(host=os.getenv('REDIS_HOST'), port=os.getenv('REDIS_PORT'), db=0, encoding="utf-8",
-                          decode_responses=True)
-    await FastAPILimiter.init(r)
+if MEMORY_DIAGNOSTICS:
+    # innermost, so the sample sees the matched route
+    app.add_middleware(AllocationSamplingMiddleware)
+app.add_middleware(DisconnectMiddleware)
+app.add_middleware(IdempotencyMiddleware)
+# outside the idempotency store, which keeps plain bodies, so replays are negotiated per client
+app.add_middleware(CompressionMiddleware)
+# ahead of routing, so shed requests cost no routing or dependency work
+app.add_middleware(AdmissionControlMiddleware)
+# counts every request, shed or not, so shutdown waits for all of them
+app.add_middleware(InFlightMiddleware)
+if TRACING:
+    # outermost, so the request span covers admission and compression as well
+    app.add_middleware(TracingMiddleware)
+
+app.add_exception_handler(DeadlineExceeded, deadline_exceeded_handler)
+app.add_exception_handler(ShardFenced, shard_fenced_handler)
 
 if __name__ == "__main__":
+    # single-process development server; production runs serve.py
     uvicorn.run(
         "main:app", host="0.0.0.0", port=8000,
     )
\ No newline at end of file
@@ -0,0 +1,252 @@
+"""
+Production server.
+
+Usage::
+
+    python serve.py [--workers 4] [--port 8000] [--max-requests 10000] [--reuse-port] [--metrics-port 9200]
+
+Runs ``--workers`` uvicorn processes (default ``WEB_CONCURRENCY``, else one per CPU the
+process may run on) under a small supervisor. Each worker uses uvloop and httptools when
+they are installed (``--runtime default`` forces asyncio and h11) and builds its own
+database pool and Redis client on startup, so nothing is shared across processes.
+
+A worker exits gracefully after ``--max-requests`` requests plus a random jitter of up to
+``--max-requests-jitter`` and is replaced, which bounds slow memory growth without all
+workers restarting at once. With ``--reuse-port`` every worker binds its own
+``SO_REUSEPORT`` socket and the kernel spreads connections across them; otherwise the
+supervisor binds one socket that the workers share. SIGINT/SIGTERM stop the workers,
+which finish their in-flight requests first.
+
+On SIGTERM a worker first reports not ready on ``/ops/ready`` for
+``WEB_READINESS_GRACE`` seconds while it keeps serving, so the load balancer stops
+routing to it before it stops accepting connections. Under Kubernetes the pod's
+``terminationGracePeriodSeconds`` must cover the grace plus ``WEB_GRACEFUL_TIMEOUT``.
+A server started any other way (``uvicorn main:app``) has no grace and needs a preStop
+delay of at least the readiness probe's period times its failure threshold.
+
+Metrics are kept per process. With ``--metrics-port`` each worker serves its own on an
+internal port, worker slot ``n`` on ``--metrics-port + n`` (a recycled worker's
+replacement takes over its slot), and Prometheus scrapes every port as a separate
+target; summing across targets gives the server's totals.
+"""
+import argparse
+import importlib.util
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import threading
+import time
+
+import uvicorn
+from dotenv import load_dotenv
+
+from src.services.metrics import serve_metrics
+
+load_dotenv()
+
+# a worker is recycled after this many requests, 0 never recycles
+WEB_MAX_REQUESTS = int(os.getenv('WEB_MAX_REQUESTS', '10000'))
+WEB_MAX_REQUESTS_JITTER = int(os.getenv('WEB_MAX_REQUESTS_JITTER', '1000'))
+# seconds a stopping worker waits for open connections before closing them
+WEB_GRACEFUL_TIMEOUT = int(os.getenv('WEB_GRACEFUL_TIMEOUT', '30'))
+# seconds a worker keeps serving after SIGTERM while /ops/ready reports draining
+WEB_READINESS_GRACE = float(os.getenv('WEB_READINESS_GRACE', '5'))
+# internal port of the first worker's metrics, the others follow it; 0 serves none
+WEB_METRICS_PORT = int(os.getenv('WEB_METRICS_PORT', '0'))
+
+
+def default_workers() -> int:
+    """
+    Returns ``WEB_CONCURRENCY`` if set, else the number of CPUs this process may run on.
+
+    The application is async and spends most of its time waiting on the database and
+    Redis, so one worker per core keeps every core busy.
+
+    :return: Number of worker processes.
+    :rtype: int
+    """
+    if os.getenv('WEB_CONCURRENCY'):
+        return int(os.getenv('WEB_CONCURRENCY'))
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def runtime_options(runtime: str) -> dict:
+    """
+    Returns the uvicorn event loop and HTTP parser for a runtime.
+
+    :param runtime: ``tuned`` for uvloop and httptools where installed, ``default`` for
+        asyncio and h11.
+    :type runtime: str
+    :return: ``loop`` and ``http`` settings for :class:`uvicorn.Config`.
+    :rtype: dict
+    """
+    if runtime == "default":
+        return {"loop": "asyncio", "http": "h11"}
+    return {
+        "loop": "uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        "http": "httptools" if importlib.util.find_spec("httptools") else "h11",
+    }
+
+
+def max_requests_for_worker(max_requests: int, jitter: int, rng=random) -> int | None:
+    """
+    Returns the request limit of one worker, spread so workers do not recycle together.
+
+    :param max_requests: Base limit, 0 for none.
+    :type max_requests: int
+    :param jitter: Largest random amount added to the limit.
+    :type jitter: int
+    :return: The limit, None for no limit.
+    :rtype: int, optional
+    """
+    if max_requests <= 0:
+        return None
+    return max_requests + rng.randint(0, max(0, jitter))
+
+
+def bind_socket(host: str, port: int, reuse_port: bool = False) -> socket.socket:
+    """
+    Returns a listening TCP socket.
+
+    :param reuse_port: Set ``SO_REUSEPORT``, so several processes can bind the same port.
+    :type reuse_port: bool
+    """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+class DrainingServer(uvicorn.Server):
+    """
+    uvicorn server that, on SIGTERM, reports draining and keeps serving for ``grace``
+    seconds before it starts its shutdown. A second signal, or SIGINT, stops it at once.
+
+    :param config: The uvicorn configuration.
+    :type config: uvicorn.Config
+    :param grace: Seconds between the signal and the shutdown.
+    :type grace: float
+    """
+
+    def __init__(self, config: uvicorn.Config, grace: float = WEB_READINESS_GRACE):
+        super().__init__(config)
+        self.grace = grace
+        self.draining = None
+
+    def handle_exit(self, sig: int, frame) -> None:
+        if sig != signal.SIGTERM or self.grace <= 0 or self.draining is not None:
+            super().handle_exit(sig, frame)
+            return
+        # a thread, so the signal handler neither logs nor waits
+        self.draining = threading.Thread(target=self._drain, args=(sig, frame), daemon=True)
+        self.draining.start()
+
+    def _drain(self, sig: int, frame) -> None:
+        from src.services.lifecycle import DRAINING, lifecycle
+
+        lifecycle.set_state(DRAINING)
+        time.sleep(self.grace)
+        super().handle_exit(sig, frame)
+
+
+def run_worker(options: dict, sock: socket.socket | None, metrics_port: int = 0) -> None:
+    # runs in a freshly spawned process: importing main creates this worker's engine,
+    # and the lifespan opens its Redis client and warms its pool
+    if metrics_port:
+        serve_metrics(metrics_port)
+    if sock is None:
+        sock = bind_socket(options["host"], options["port"], reuse_port=True)
+    config = uvicorn.Config(**options, timeout_graceful_shutdown=WEB_GRACEFUL_TIMEOUT)
+    DrainingServer(config).run(sockets=[sock])
+
+
+class Supervisor:
+    """
+    Keeps ``workers`` worker processes running, replacing those that exit.
+
+    :param options: Settings for :class:`uvicorn.Config` including ``app``, except ``limit_max_requests``.
+    :type options: dict
+    :param metrics_port: Metrics port of the first worker slot, 0 for none.
+    :type metrics_port: int
+    """
+
+    def __init__(self, options: dict, workers: int, max_requests: int, jitter: int, reuse_port: bool,
+                 metrics_port: int = WEB_METRICS_PORT):
+        self.options = options
+        self.metrics_port = metrics_port
+        self.workers = workers
+        self.max_requests = max_requests
+        self.jitter = jitter
+        # spawned, not forked, so no worker inherits connections or threads of the supervisor
+        self.context = multiprocessing.get_context("spawn")
+        self.sock = None if reuse_port else bind_socket(options["host"], options["port"])
+        self.processes = []
+        self.stopping = False
+
+    def worker_metrics_port(self, slot: int) -> int:
+        return self.metrics_port + slot if self.metrics_port else 0
+
+    def spawn(self, slot: int) -> multiprocessing.Process:
+        limit = max_requests_for_worker(self.max_requests, self.jitter)
+        process = self.context.Process(target=run_worker, args=({**self.options, "limit_max_requests": limit},
+                                                                self.sock, self.worker_metrics_port(slot)))
+        process.start()
+        return process
+
+    def stop(self, *args) -> None:
+        self.stopping = True
+
+    def run(self) -> None:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, self.stop)
+        self.processes = [self.spawn(slot) for slot in range(self.workers)]
+        print(f"serving on {self.options['host']}:{self.options['port']} with {self.workers} workers "
+              f"({self.options['loop']}, {self.options['http']})", flush=True)
+        while not self.stopping:
+            time.sleep(0.5)
+            for index, process in enumerate(self.processes):
+                if not process.is_alive() and not self.stopping:
+                    # recycled after its request limit, or crashed
+                    process.join()
+                    self.processes[index] = self.spawn(index)
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            process.join(WEB_READINESS_GRACE + WEB_GRACEFUL_TIMEOUT + 5)
+        if self.sock is not None:
+            self.sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--runtime", choices=("tuned", "default"), default="tuned")
+    parser.add_argument("--max-requests", type=int, default=WEB_MAX_REQUESTS)
+    parser.add_argument("--max-requests-jitter", type=int, default=WEB_MAX_REQUESTS_JITTER)
+    parser.add_argument("--reuse-port", action="store_true")
+    parser.add_argument("--access-log", action="store_true")
+    parser.add_argument("--metrics-port", type=int, default=WEB_METRICS_PORT,
+                        help="serve each worker's metrics on this port plus its slot")
+    args = parser.parse_args()
+
+    options = {"app": "main:app", "host": args.host, "port": args.port, "access_log": args.access_log,
+               **runtime_options(args.runtime)}
+    Supervisor(options, args.workers, args.max_requests, args.max_requests_jitter, args.reuse_port,
+               args.metrics_port).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from sqlalchemy import create_engine, Column, Integer, String, Date
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, sessionmaker
 
 import os
 from dotenv import load_dotenv
@@ -16,14 +17,76 @@ DATABASE = {
     'PORT': os.getenv('DB_PORT'),
 }
 
-CONNECTION_STRING = f"{DATABASE['ENGINE']}://{DATABASE['USER']}:{DATABASE['PASSWORD']}@{DATABASE['HOST']}:{DATABASE['PORT']}/{DATABASE['NAME']}"
+# DATABASE_URL overrides the individual settings, e.g. "sqlite:///./bench.db" for offline benchmarks
+CONNECTION_STRING = os.getenv('DATABASE_URL') or f"{DATABASE['ENGINE']}://{DATABASE['USER']}:{DATABASE['PASSWORD']}@{DATABASE['HOST']}:{DATABASE['PORT']}/{DATABASE['NAME']}"
 
-engine = create_engine(CONNECTION_STRING)
+# further PostgreSQL databases, comma separated; the database above is shard 0 and keeps the
+# shard directory (see src.db.sharding), without any the application is not sharded
+SHARD_URLS = [url.strip() for url in os.getenv('DATABASE_SHARDS', '').split(',') if url.strip()]
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def make_engine(url: str):
+    """
+    Creates the engine of one database with the configured pool and statement settings.
+
+    :param url: The database URL.
+    :type url: str
+    :return: The engine.
+    :rtype: Engine
+    """
+    if url.startswith('sqlite'):
+        engine_args = {"connect_args": {"check_same_thread": False}}
+    else:
+        # the pool is warmed to DB_POOL_WARM connections at startup (see src.services.lifecycle)
+        engine_args = {"pool_size": int(os.getenv('DB_POOL_SIZE', '5')),
+                       "max_overflow": int(os.getenv('DB_MAX_OVERFLOW', '10'))}
+        # psycopg 3 (postgresql+psycopg://) prepares a statement on the server once it has run
+        # this many times on a connection; psycopg2 has no server-side prepared statements
+        if url.startswith('postgresql+psycopg:') and os.getenv('DB_PREPARE_THRESHOLD'):
+            threshold = os.getenv('DB_PREPARE_THRESHOLD')
+            engine_args["connect_args"] = {"prepare_threshold": None if threshold == "none" else int(threshold)}
+    # compiled SQL per statement shape; the hot statements are built once and always hit it
+    return create_engine(url, query_cache_size=int(os.getenv('DB_QUERY_CACHE_SIZE', '500')), **engine_args)
+
+
+engine = make_engine(CONNECTION_STRING)
+shard_engines = [engine, *(make_engine(url) for url in SHARD_URLS)]
+
+# a forked process must not reuse the parent's pooled connections, it opens its own
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=lambda: [shard.dispose(close=False) for shard in shard_engines])
+
+
+class ShardSession(Session):
+    """
+    Session that sends its statements to the shard in ``info["shard"]``, shard 0 until
+    the request is routed (see :class:`src.db.sharding.ShardRouter`).
+    """
+    engines = shard_engines
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        return self.engines[self.info.get("shard", 0)]
+
+
+if len(shard_engines) > 1:
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, class_=ShardSession)
+else:
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+def dialect_insert(db: Session, table):
+    """
+    Returns a dialect-specific INSERT that supports ``ON CONFLICT`` and ``RETURNING``.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table)
+    if dialect == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"Upserts are not supported on {dialect}")
+
+
 def get_db():
     db = SessionLocal()
     try:
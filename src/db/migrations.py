@@ -0,0 +1,300 @@
+"""
+Schema changes that keep the ``contact`` table serving while a migration runs.
+
+Plain ``op.create_index`` and ``op.add_column`` take locks that block reads or writes
+for as long as the statement runs, and a DDL statement queued behind a long transaction
+blocks every query that arrives after it. The helpers here avoid both: indexes are built
+concurrently, backfills run in short committed batches, constraints are added
+``NOT VALID`` and validated separately, and every statement that needs a strong lock
+gives up after ``MIGRATION_LOCK_TIMEOUT_MS`` and is retried.
+
+They run outside the migration's transaction, in an Alembic autocommit block::
+
+    def upgrade() -> None:
+        op.execute("ALTER TABLE contact ADD COLUMN nickname varchar")
+        with op.get_context().autocommit_block():
+            conn = op.get_bind()
+            backfill(conn, "contact", "nickname = first_name", "nickname IS NULL", key=("user_id", "id"))
+            create_index_concurrently(conn, "ix_contact_user_nickname", "contact", "(user_id, nickname)")
+
+Statements that are not PostgreSQL specific also run on SQLite, for tests.
+"""
+import os
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+
+load_dotenv()
+
+# longest a DDL statement waits for its lock before giving up, and how often it is retried
+MIGRATION_LOCK_TIMEOUT_MS = int(os.getenv('MIGRATION_LOCK_TIMEOUT_MS', '2000'))
+MIGRATION_LOCK_RETRIES = int(os.getenv('MIGRATION_LOCK_RETRIES', '10'))
+# rows per backfill batch, and the pause between batches
+MIGRATION_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', '1000'))
+MIGRATION_BATCH_PAUSE_MS = int(os.getenv('MIGRATION_BATCH_PAUSE_MS', '50'))
+
+# lock_not_available, raised when lock_timeout expires
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+def is_lock_timeout(err: Exception) -> bool:
+    """
+    Tells whether a database error means a lock could not be taken in time.
+    """
+    orig = getattr(err, "orig", None)
+    return getattr(orig, "pgcode", None) == LOCK_NOT_AVAILABLE or "database is locked" in str(orig)
+
+
+def _require_autocommit(conn: Connection) -> None:
+    # each statement must commit on its own: concurrent builds refuse to run in a transaction,
+    # and a backfill batch or lock held until the migration commits would block traffic
+    if conn.get_execution_options().get("isolation_level") != "AUTOCOMMIT":
+        raise RuntimeError("online migration helpers must run in op.get_context().autocommit_block()")
+
+
+def run_with_lock_timeout(conn: Connection, statement: str, params: dict | None = None,
+                          timeout_ms: int = MIGRATION_LOCK_TIMEOUT_MS, retries: int = MIGRATION_LOCK_RETRIES):
+    """
+    Runs a statement that waits at most ``timeout_ms`` for its locks, retrying with a
+    growing pause when it times out.
+
+    While a statement waits for an ``ACCESS EXCLUSIVE`` lock, every query on the table
+    queues behind it; giving up quickly lets that traffic through until the next attempt.
+
+    :param conn: A connection in autocommit mode.
+    :type conn: Connection
+    :param statement: The SQL statement.
+    :type statement: str
+    :param params: Bound parameters.
+    :type params: dict, optional
+    :param timeout_ms: Lock wait per attempt, in milliseconds.
+    :type timeout_ms: int
+    :param retries: Attempts after the first.
+    :type retries: int
+    :return: The statement's result.
+    :raises OperationalError: If the lock could not be taken in any attempt.
+    """
+    _require_autocommit(conn)
+    postgres = conn.dialect.name == "postgresql"
+    for attempt in range(retries + 1):
+        if postgres:
+            conn.exec_driver_sql(f"SET lock_timeout = {int(timeout_ms)}")
+        try:
+            return conn.execute(text(statement), params or {})
+        except OperationalError as err:
+            if not is_lock_timeout(err) or attempt == retries:
+                raise
+            time.sleep(min(timeout_ms * (attempt + 1), 10_000) / 1000)
+        finally:
+            if postgres:
+                conn.exec_driver_sql("RESET lock_timeout")
+
+
+def _index_is_invalid(conn: Connection, name: str) -> bool:
+    return bool(conn.execute(text("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"),
+                             {"name": name}).scalar())
+
+
+def _partitions(conn: Connection, table: str) -> list[str]:
+    return list(conn.execute(text(
+        "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(:table) ORDER BY 1"
+    ), {"table": table}).scalars())
+
+
+def create_index_concurrently(conn: Connection, name: str, table: str, columns: str, where: str | None = None,
+                              unique: bool = False) -> None:
+    """
+    Builds an index without blocking writes.
+
+    ``CREATE INDEX CONCURRENTLY`` cannot run on a partitioned table, so there the index
+    is created on the parent only (invalid, no data), built concurrently on each partition
+    and attached; the parent index becomes valid once every partition's is attached. An
+    invalid index left by an interrupted build is dropped and rebuilt.
+
+    :param conn: A connection in autocommit mode.
+    :type conn: Connection
+    :param name: The index name.
+    :type name: str
+    :param table: The table, optionally schema qualified.
+    :type table: str
+    :param columns: The indexed columns or expressions in parentheses, e.g. ``(user_id, birthday)``.
+    :type columns: str
+    :param where: Predicate of a partial index.
+    :type where: str, optional
+    :param unique: Create a unique index.
+    :type unique: bool
+    """
+    _require_autocommit(conn)
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    predicate = f" WHERE {where}" if where else ""
+    if conn.dialect.name != "postgresql":
+        conn.exec_driver_sql(f"CREATE {kind} IF NOT EXISTS {name} ON {table} {columns}{predicate}")
+        return
+    schema = table[:-len(table.rsplit(".", 1)[-1])]
+    partitions = _partitions(conn, table)
+    if not partitions:
+        if _index_is_invalid(conn, f"{schema}{name}"):
+            conn.exec_driver_sql(f"DROP INDEX CONCURRENTLY {schema}{name}")
+        conn.exec_driver_sql(f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {name} ON {table} {columns}{predicate}")
+        return
+    # ON ONLY takes a brief lock on the parent and builds nothing
+    run_with_lock_timeout(conn, f"CREATE {kind} IF NOT EXISTS {name} ON ONLY {table} {columns}{predicate}")
+    for partition in partitions:
+        # regclass text is schema qualified when the schema is not on the search path
+        partition_name = partition.rsplit(".", 1)[-1]
+        index = f"{partition_name}_{name}"[:63]
+        if _index_is_invalid(conn, f"{schema}{index}"):
+            conn.exec_driver_sql(f"DROP INDEX CONCURRENTLY {schema}{index}")
+        conn.exec_driver_sql(f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {index} ON {partition} {columns}{predicate}")
+        attached = conn.execute(text("SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(:index)"),
+                                {"index": f"{schema}{index}"}).first()
+        if attached is None:
+            run_with_lock_timeout(conn, f"ALTER INDEX {schema}{name} ATTACH PARTITION {schema}{index}")
+
+
+def drop_index_concurrently(conn: Connection, name: str) -> None:
+    """
+    Drops an index without blocking reads or writes. An index on a partitioned table is
+    dropped with a short lock timeout instead, concurrent drops are not supported there.
+
+    :param conn: A connection in autocommit mode.
+    :type conn: Connection
+    :param name: The index name, optionally schema qualified.
+    :type name: str
+    """
+    _require_autocommit(conn)
+    if conn.dialect.name != "postgresql":
+        conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+        return
+    partitioned = conn.execute(text("SELECT relkind = 'I' FROM pg_class WHERE oid = to_regclass(:name)"),
+                               {"name": name}).scalar()
+    if partitioned:
+        run_with_lock_timeout(conn, f"DROP INDEX IF EXISTS {name}")
+    else:
+        conn.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def backfill(conn: Connection, table: str, assignments: str, where: str, key: str | tuple[str, ...] = "id",
+             batch_size: int = MIGRATION_BATCH_SIZE, pause_ms: int = MIGRATION_BATCH_PAUSE_MS,
+             timeout_ms: int = MIGRATION_LOCK_TIMEOUT_MS) -> dict:
+    """
+    Updates the rows matching ``where`` in batches of at most ``batch_size`` rows, each
+    committed on its own, pausing between batches.
+
+    Batches are paged by keyset: each one takes the next ``batch_size`` rows in ``key``
+    order after the last row of the previous batch, so a batch is bounded by rows, not by
+    a span of key values that may be sparse or crowded, and is found through the index
+    instead of a rescan from the start. Each batch holds its row locks for a few
+    milliseconds, so application writes to the same rows wait at most one batch.
+
+    ``key`` must be unique and lead an index: ``id`` for most tables, the primary key
+    ``("user_id", "id")`` for the partitioned contact table. ``where`` must stop matching
+    a row once it is updated, so a backfill that was interrupted resumes where it stopped.
+
+    :param conn: A connection in autocommit mode.
+    :type conn: Connection
+    :param table: The table.
+    :type table: str
+    :param assignments: The SET clause, e.g. ``nickname = first_name``.
+    :type assignments: str
+    :param where: Rows still to update, e.g. ``nickname IS NULL``.
+    :type where: str
+    :param key: Column, or columns, that batches are pages of.
+    :type key: str | tuple[str, ...]
+    :param batch_size: Rows per batch.
+    :type batch_size: int
+    :param pause_ms: Pause between batches, in milliseconds.
+    :type pause_ms: int
+    :param timeout_ms: Row lock wait per batch before the batch is retried.
+    :type timeout_ms: int
+    :return: Rows updated, batches run and elapsed seconds.
+    :rtype: dict
+    """
+    _require_autocommit(conn)
+    started = time.perf_counter()
+    result = {"rows": 0, "batches": 0}
+    keys = (key,) if isinstance(key, str) else tuple(key)
+    columns = ", ".join(keys)
+    after = f"({columns}) > ({', '.join(f':last_{n}' for n in range(len(keys)))}) AND "
+    last = None
+    while True:
+        page = (f"SELECT {columns} FROM {table} WHERE {after if last else ''}({where}) "
+                f"ORDER BY {columns} LIMIT :batch_size")
+        statement = f"UPDATE {table} SET {assignments} WHERE ({columns}) IN ({page}) RETURNING {columns}"
+        params = {"batch_size": batch_size, **{f"last_{n}": value for n, value in enumerate(last or ())}}
+        updated = run_with_lock_timeout(conn, statement, params, timeout_ms).all()
+        if not updated:
+            break
+        last = max(tuple(row) for row in updated)
+        result["rows"] += len(updated)
+        result["batches"] += 1
+        if len(updated) < batch_size:
+            break
+        if pause_ms:
+            time.sleep(pause_ms / 1000)
+    return {**result, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def add_constraint_not_valid(conn: Connection, table: str, name: str, definition: str,
+                             timeout_ms: int = MIGRATION_LOCK_TIMEOUT_MS) -> None:
+    """
+    Adds a ``CHECK`` or ``FOREIGN KEY`` constraint without checking the existing rows,
+    which takes its lock only briefly; new and updated rows are checked right away.
+    Follow with :func:`validate_constraint`.
+
+    :param conn: A connection in autocommit mode.
+    :type conn: Connection
+    :param table: The table.
+    :type table: str
+    :param name: The constraint name.
+    :type name: str
+    :param definition: E.g. ``CHECK (birthday > '1900-01-01')``.
+    :type definition: str
+    :param timeout_ms: Lock wait per attempt, in milliseconds.
+    :type timeout_ms: int
+    """
+    run_with_lock_timeout(conn, f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition} NOT VALID",
+                          timeout_ms=timeout_ms)
+
+
+def validate_constraint(conn: Connection, table: str, name: str,
+                        timeout_ms: int = MIGRATION_LOCK_TIMEOUT_MS) -> None:
+    """
+    Checks the existing rows against a ``NOT VALID`` constraint. Validation scans the
+    table under a ``SHARE UPDATE EXCLUSIVE`` lock, which reads and writes do not wait for.
+
+    :param conn: A connection in autocommit mode.
+    :type conn: Connection
+    :param table: The table.
+    :type table: str
+    :param name: The constraint name.
+    :type name: str
+    :param timeout_ms: Lock wait per attempt, in milliseconds.
+    :type timeout_ms: int
+    """
+    run_with_lock_timeout(conn, f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}", timeout_ms=timeout_ms)
+
+
+def set_not_null(conn: Connection, table: str, column: str, timeout_ms: int = MIGRATION_LOCK_TIMEOUT_MS) -> None:
+    """
+    Makes a column ``NOT NULL`` without a full-table scan under an exclusive lock: a
+    validated ``CHECK (column IS NOT NULL)`` lets PostgreSQL skip the scan, after which
+    the check is dropped.
+
+    :param conn: A connection in autocommit mode.
+    :type conn: Connection
+    :param table: The table.
+    :type table: str
+    :param column: The column, backfilled beforehand.
+    :type column: str
+    :param timeout_ms: Lock wait per attempt, in milliseconds.
+    :type timeout_ms: int
+    """
+    check = f"{table.rsplit('.', 1)[-1]}_{column}_not_null"
+    add_constraint_not_valid(conn, table, check, f"CHECK ({column} IS NOT NULL)", timeout_ms)
+    validate_constraint(conn, table, check, timeout_ms)
+    run_with_lock_timeout(conn, f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL", timeout_ms=timeout_ms)
+    run_with_lock_timeout(conn, f"ALTER TABLE {table} DROP CONSTRAINT {check}", timeout_ms=timeout_ms)
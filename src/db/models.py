@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Date, DateTime, ForeignKey, Boolean, func
+from sqlalchemy import create_engine, Column, Integer, String, Date, DateTime, ForeignKey, Boolean, func, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 
@@ -7,16 +7,48 @@ Base = declarative_base()
 class Contact(Base):
     __tablename__ = "contact"
 
-    id = Column(Integer, primary_key=True, index=True)
-    first_name = Column(String, index=True)
-    last_name = Column(String, index=True)
-    email = Column(String, unique=True, index=True)
-    phone_number = Column(String, unique=True, index=True)
+    id = Column(Integer, primary_key=True)
+    first_name = Column(String)
+    last_name = Column(String)
+    email = Column(String)
+    phone_number = Column(String)
+    # lowercased email and E.164 phone, unique per user so formatting variants collide
+    email_normalized = Column(String, nullable=True)
+    phone_normalized = Column(String, nullable=True)
     birthday = Column(Date)
     additional_info = Column(String, nullable=True)
-    user_id = Column(Integer, ForeignKey('users.id')) 
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    # set when the contact is deleted; the purge job removes the row once retention has passed
+    deleted_at = Column(DateTime, nullable=True)
     user = relationship("User", back_populates="contacts") 
 
+    # every query is scoped to a user, so every index leads with user_id; on PostgreSQL
+    # the table is hash partitioned by user_id (see src.db.partitioning). Indexes only
+    # cover live rows (deleted_at IS NULL), which every contact query filters on
+    __table_args__ = (
+        Index('uq_contact_user_email', 'user_id', 'email_normalized', unique=True,
+              postgresql_where=deleted_at.is_(None), sqlite_where=deleted_at.is_(None)),
+        Index('uq_contact_user_phone', 'user_id', 'phone_normalized', unique=True,
+              postgresql_where=deleted_at.is_(None), sqlite_where=deleted_at.is_(None)),
+        Index('ix_contact_user_birthday', 'user_id', 'birthday',
+              postgresql_where=deleted_at.is_(None), sqlite_where=deleted_at.is_(None)),
+        Index('ix_contact_user_name', 'user_id', 'last_name', 'first_name',
+              postgresql_where=deleted_at.is_(None), sqlite_where=deleted_at.is_(None)),
+        # prefix lookups for suggestions; text_pattern_ops makes LIKE 'abc%' indexable under any collation
+        Index('ix_contact_user_first_name_prefix', user_id, func.lower(first_name).label('first_name_lower'),
+              postgresql_ops={'first_name_lower': 'text_pattern_ops'}, postgresql_where=deleted_at.is_(None)),
+        Index('ix_contact_user_last_name_prefix', user_id, func.lower(last_name).label('last_name_lower'),
+              postgresql_ops={'last_name_lower': 'text_pattern_ops'}, postgresql_where=deleted_at.is_(None)),
+        Index('ix_contact_user_email_prefix', user_id, func.lower(email).label('email_lower'),
+              postgresql_ops={'email_lower': 'text_pattern_ops'}, postgresql_where=deleted_at.is_(None)),
+        # tombstones, for the purge job
+        Index('ix_contact_deleted_at', 'deleted_at',
+              postgresql_where=deleted_at.is_not(None), sqlite_where=deleted_at.is_not(None)),
+    )
+    # identity includes the partition key, so the UPDATE and DELETE statements the ORM
+    # emits filter on user_id and touch a single partition
+    __mapper_args__ = {"primary_key": [id, user_id]}
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True)
@@ -27,4 +59,44 @@ class User(Base):
     avatar = Column(String(255), nullable=True)
     refresh_token = Column(String(255), nullable=True)
     confirmed = Column(Boolean, default=False)
-    contacts = relationship("Contact", back_populates="user")
\ No newline at end of file
+    contacts = relationship("Contact", back_populates="user")
+
+
+class ContactStats(Base):
+    """
+    Per-user contact counters, one row per birthday month (0 when the birthday is unknown).
+
+    Rows are maintained incrementally in the same transaction as every contact write, so
+    reading a user's statistics never scans the contact table.
+    """
+    __tablename__ = "contact_stats"
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    birth_month = Column(Integer, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    missing_phone = Column(Integer, nullable=False, default=0)
+    missing_email = Column(Integer, nullable=False, default=0)
+
+
+class JobCheckpoint(Base):
+    """
+    Progress of a daily batch job: the last user id it finished, so an interrupted run
+    resumes where it stopped and a finished run is not repeated the same day.
+    """
+    __tablename__ = "job_checkpoints"
+    name = Column(String(50), primary_key=True)
+    run_date = Column(Date, primary_key=True)
+    last_user_id = Column(Integer, nullable=False, default=0)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class ShardDirectory(Base):
+    """
+    Which database shard holds each user, kept on the catalog shard (shard 0).
+
+    ``user_id`` is allocated here, so user ids stay unique across shards and a user keeps
+    their id when moved to another shard.
+    """
+    __tablename__ = "shard_directory"
+    user_id = Column(Integer, primary_key=True)
+    email = Column(String(250), nullable=False, unique=True)
+    shard = Column(Integer, nullable=False)
@@ -0,0 +1,180 @@
+"""
+Hash partitioning of the ``contact`` table by ``user_id`` on PostgreSQL.
+
+Every contact query is scoped to one user, so with the table split into
+``CONTACT_PARTITIONS`` hash partitions the planner prunes all partitions but one and
+each query only touches that partition's (smaller) composite indexes. The DDL here
+builds the current schema for the benchmark and the pruning test; the migrations keep
+their own frozen copies of the schema they each created.
+"""
+import json
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import and_, func, select, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Connection
+
+from src.db.models import Contact
+
+load_dotenv()
+
+CONTACT_PARTITIONS = int(os.getenv('CONTACT_PARTITIONS', '16'))
+
+# column order shared by the partitioned and the plain table, used to copy rows between them
+COLUMNS = ("id", "first_name", "last_name", "email", "phone_number", "email_normalized", "phone_normalized",
+           "birthday", "additional_info", "user_id")
+
+# per-user indexes; the primary key (user_id, id) and the unique keys cover lookups by id,
+# pagination and duplicate checks
+COMPOSITE_INDEXES = {
+    "ix_contact_user_birthday": "(user_id, birthday)",
+    "ix_contact_user_name": "(user_id, last_name, first_name)",
+}
+
+# soft-deleted contacts stay in the table until the purge job removes them; the indexes only
+# cover live rows, so tombstones cost live queries nothing and free their email and phone
+LIVE = "deleted_at IS NULL"
+UNIQUE_KEYS = {
+    "uq_contact_user_email": "(user_id, email_normalized)",
+    "uq_contact_user_phone": "(user_id, phone_normalized)",
+}
+
+
+def partitioned_contact_ddl(table: str = "contact", partitions: int = CONTACT_PARTITIONS,
+                            sequence: str = "contact_id_seq", users_table: str | None = "users") -> list[str]:
+    """
+    Returns the statements that create ``table`` hash partitioned by ``user_id``.
+
+    PostgreSQL requires the partition key in every unique constraint, so the primary key
+    becomes ``(user_id, id)``; ids still come from ``sequence`` and stay unique.
+
+    :param table: Name of the parent table, optionally schema qualified.
+    :type table: str
+    :param partitions: Number of hash partitions.
+    :type partitions: int
+    :param sequence: Sequence that supplies ids.
+    :type sequence: str
+    :param users_table: Table referenced by ``user_id``, None for no foreign key.
+    :type users_table: str, optional
+    :return: SQL statements to run in order.
+    :rtype: list[str]
+    """
+    name = table.rsplit(".", 1)[-1]
+    schema = table[:-len(name)]
+    foreign_key = f" REFERENCES {users_table} (id)" if users_table else ""
+    statements = [f"""
+        CREATE TABLE {table} (
+            id integer NOT NULL DEFAULT nextval('{sequence}'),
+            first_name varchar,
+            last_name varchar,
+            email varchar,
+            phone_number varchar,
+            email_normalized varchar,
+            phone_normalized varchar,
+            birthday date,
+            additional_info varchar,
+            user_id integer NOT NULL{foreign_key},
+            CONSTRAINT {name}_pkey PRIMARY KEY (user_id, id),
+            CONSTRAINT uq_{name}_user_email UNIQUE (user_id, email_normalized),
+            CONSTRAINT uq_{name}_user_phone UNIQUE (user_id, phone_normalized)
+        ) PARTITION BY HASH (user_id)
+    """]
+    statements += [
+        f"CREATE TABLE {schema}{name}_p{remainder} PARTITION OF {table} "
+        f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+        for remainder in range(partitions)
+    ]
+    # indexes on the parent are created on every partition
+    statements += [
+        f"CREATE INDEX {index.replace('contact', name, 1)} ON {table} {columns}"
+        for index, columns in COMPOSITE_INDEXES.items()
+    ]
+    statements += soft_delete_ddl(table)
+    return statements
+
+
+def soft_delete_ddl(table: str = "contact") -> list[str]:
+    """
+    Returns the statements that add soft deletes to the partitioned ``table``: a
+    ``deleted_at`` column, the unique keys and composite indexes rebuilt as partial
+    indexes over live rows, and a partial index over tombstones for the purge job.
+
+    :param table: Name of the parent table, optionally schema qualified.
+    :type table: str
+    :return: SQL statements to run in order.
+    :rtype: list[str]
+    """
+    name = table.rsplit(".", 1)[-1]
+    schema = table[:-len(name)]
+    statements = [f"ALTER TABLE {table} ADD COLUMN deleted_at timestamp"]
+    for index, columns in UNIQUE_KEYS.items():
+        index = index.replace('contact', name, 1)
+        statements += [f"ALTER TABLE {table} DROP CONSTRAINT {index}",
+                       f"CREATE UNIQUE INDEX {index} ON {table} {columns} WHERE {LIVE}"]
+    for index, columns in COMPOSITE_INDEXES.items():
+        index = index.replace('contact', name, 1)
+        statements += [f"DROP INDEX {schema}{index}",
+                       f"CREATE INDEX {index} ON {table} {columns} WHERE {LIVE}"]
+    statements.append(f"CREATE INDEX ix_{name}_deleted_at ON {table} (deleted_at) WHERE deleted_at IS NOT NULL")
+    return statements
+
+
+def route_statements(user_id: int, contact_id: int) -> dict:
+    """
+    The queries the contact routes run, keyed by route, for checking their plans.
+
+    :param user_id: The user the queries are scoped to.
+    :type user_id: int
+    :param contact_id: A contact id for the single-contact routes.
+    :type contact_id: int
+    :return: Route name to SQLAlchemy statement.
+    :rtype: dict
+    """
+    own = and_(Contact.user_id == user_id, Contact.deleted_at.is_(None))
+    return {
+        "list": select(Contact).where(own).offset(0).limit(10),
+        "search": select(Contact).where(own, Contact.first_name.ilike("%jo%")),
+        "suggest": select(Contact.id, Contact.first_name, Contact.last_name, Contact.email).where(
+            own, func.lower(Contact.first_name).like("jo%")).order_by(Contact.last_name).limit(8),
+        "upcoming_birthdays": select(Contact).where(own, Contact.birthday.between("2024-01-01", "2024-01-08")),
+        "duplicates": select(Contact.id, Contact.first_name, Contact.last_name, Contact.email,
+                             Contact.phone_number).where(own),
+        "read": select(Contact).where(Contact.id == contact_id, own),
+        "update": update(Contact).where(Contact.id == contact_id, own).values(additional_info="x"),
+        "delete": update(Contact).where(Contact.id == contact_id, own).values(deleted_at=func.now()),
+        "merge": select(Contact).where(Contact.id.in_([contact_id, contact_id + 1]), own),
+    }
+
+
+def scanned_relations(connection: Connection, statement) -> set[str]:
+    """
+    Returns the tables and partitions a statement's plan reads.
+
+    Parameters are inlined, as psycopg2 does, so pruning happens at plan time and
+    pruned partitions are absent from the plan. The connection's ``schema_translate_map``
+    is honoured.
+
+    :param connection: A PostgreSQL connection.
+    :type connection: Connection
+    :param statement: The statement to explain.
+    :return: Relation names in the plan.
+    :rtype: set[str]
+    """
+    sql = statement.compile(
+        dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True},
+        schema_translate_map=connection.get_execution_options().get("schema_translate_map"),
+        render_schema_translate=True,
+    )
+    plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}").scalar()
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    relations = set()
+
+    def walk(node):
+        if "Relation Name" in node:
+            relations.add(node["Relation Name"])
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan[0]["Plan"])
+    return relations
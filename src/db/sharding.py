@@ -0,0 +1,261 @@
+"""
+Horizontal sharding of users and their contacts across several databases.
+
+Each user lives, with their contacts and statistics, on exactly one shard. New users
+are placed by a hash of their email; the directory on the catalog shard (shard 0)
+records the placement and allocates user ids, so ids stay unique across shards and a
+user can later be moved (see :mod:`src.jobs.move_user`). Request sessions are
+:class:`~src.db.db.ShardSession` objects that :class:`ShardRouter` points at the user's
+shard before the first statement. With a single database the directory still allocates
+user ids, everything else here is a no-op.
+"""
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from src.db.db import dialect_insert, shard_engines
+from src.db.models import ShardDirectory
+from src.services.invalidation import invalidation_bus
+
+load_dotenv()
+
+# directory entries cached per process; a stale entry is refreshed when the user is not
+# found on the cached shard, so the TTL only bounds memory and refreshes of idle entries
+SHARD_CACHE_SIZE = int(os.getenv('SHARD_CACHE_SIZE', '100000'))
+SHARD_CACHE_TTL = float(os.getenv('SHARD_CACHE_TTL', '300'))
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class ShardFenced(Exception):
+    """
+    Raised for a write to a user who is being moved to another shard.
+    """
+
+
+async def shard_fenced_handler(request: Request, err: ShardFenced):
+    """
+    Turns a fenced write into ``503 Service Unavailable``; the move takes about a second.
+    """
+    return JSONResponse(status_code=503, content={"detail": "Account is being moved, retry shortly"},
+                        headers={"Retry-After": "1"})
+
+
+def fence_key(key: str | int) -> str:
+    # a move fences the user under both their email and their id
+    return f"shard:fence:{key}"
+
+
+def shard_for_email(email: str, shards: int) -> int:
+    """
+    Returns the shard a new user is placed on: a stable hash of the email.
+
+    :param email: The user's email.
+    :type email: str
+    :param shards: Number of shards.
+    :type shards: int
+    :return: The shard index.
+    :rtype: int
+    """
+    digest = hashlib.blake2b(email.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards
+
+
+def add_results(results: list[dict]) -> dict:
+    """
+    Adds up the per-shard results of a batch job.
+
+    :param results: The result of each shard.
+    :type results: list[dict]
+    :return: The totals.
+    :rtype: dict
+    """
+    total = {}
+    for result in results:
+        for key, value in result.items():
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+class ShardRouter:
+    """
+    Resolves a user's shard from the directory and points sessions at it.
+
+    :param engines: One engine per shard, the first holds the directory.
+    :type engines: list
+    :param cache_size: Directory entries cached.
+    :type cache_size: int
+    :param cache_ttl: Seconds a cached entry is used.
+    :type cache_ttl: float
+    """
+
+    def __init__(self, engines: list = shard_engines, cache_size: int = SHARD_CACHE_SIZE,
+                 cache_ttl: float = SHARD_CACHE_TTL):
+        self.engines = engines
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.cache = OrderedDict()
+        # off while cross-process invalidations may be missed (see src.services.invalidation)
+        self.enabled = True
+        self.redis = None
+
+    @property
+    def sharded(self) -> bool:
+        return len(self.engines) > 1
+
+    def use(self, redis) -> None:
+        """
+        Sets the Redis client the write fences are kept in.
+        """
+        self.redis = redis
+
+    def _remember(self, key, shard: int) -> None:
+        self.cache[key] = (shard, time.monotonic() + self.cache_ttl)
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def forget(self, email: str, user_id: int | None = None) -> None:
+        self.cache.pop(email, None)
+        self.cache.pop(user_id, None)
+
+    def invalidate(self, key: str, version: int | None = None) -> None:
+        # invalidations carry keys as text, user ids included
+        self.forget(key, int(key) if key.isdigit() else None)
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+    def _read_entry(self, key: str | int):
+        column = ShardDirectory.user_id if isinstance(key, int) else ShardDirectory.email
+        with Session(bind=self.engines[0]) as catalog:
+            return catalog.execute(select(ShardDirectory.user_id, ShardDirectory.email, ShardDirectory.shard)
+                                   .where(column == key)).first()
+
+    async def lookup(self, key: str | int, refresh: bool = False) -> int | None:
+        """
+        Returns the shard of a user, by email or by id, None if the directory has no entry.
+        The directory is read in a thread, off the event loop.
+
+        :param key: The user's email or id.
+        :type key: str | int
+        :param refresh: Read the directory even if the entry is cached.
+        :type refresh: bool
+        :return: The shard index.
+        :rtype: int, optional
+        """
+        cached = self.cache.get(key)
+        if cached is not None and not refresh and self.enabled and cached[1] > time.monotonic():
+            return cached[0]
+        row = await asyncio.to_thread(self._read_entry, key)
+        if row is None:
+            self.cache.pop(key, None)
+            return None
+        self._remember(row.email, row.shard)
+        self._remember(row.user_id, row.shard)
+        return row.shard
+
+    @staticmethod
+    def allocate(db: Session, email: str, shard: int):
+        """
+        Creates the directory entry of a new user, or returns the existing one, so a
+        retried signup gets the same answer. One statement, not committed.
+
+        :param db: A session on the catalog shard.
+        :type db: Session
+        :param email: The new user's email.
+        :type email: str
+        :param shard: The shard the user is placed on, unless they already have an entry.
+        :type shard: int
+        :return: The entry's ``user_id`` and ``shard``.
+        """
+        stmt = dialect_insert(db, ShardDirectory).values(email=email, shard=shard)
+        # the no-op update makes RETURNING answer for an existing entry as well
+        stmt = stmt.on_conflict_do_update(index_elements=[ShardDirectory.email], set_={"email": stmt.excluded.email})
+        return db.execute(stmt.returning(ShardDirectory.user_id, ShardDirectory.shard)).one()
+
+    def _allocate_on_catalog(self, email: str):
+        with Session(bind=self.engines[0]) as catalog:
+            row = self.allocate(catalog, email, shard_for_email(email, len(self.engines)))
+            catalog.commit()
+        return row
+
+    async def assign(self, email: str, db: Session) -> tuple[int, int]:
+        """
+        Returns the id and shard of a new user, allocated by the directory.
+
+        Ids come from the directory whether or not the application is sharded, so every
+        user has an entry and the directory's sequence never falls behind ``users.id``:
+        sharding can be switched on later without moving or renumbering anyone. Unsharded,
+        the catalog is the user's own database and the entry is written in ``db``, to be
+        committed (or rolled back) with the user; sharded, it is committed on the catalog
+        shard in a thread, off the event loop.
+
+        :param email: The new user's email.
+        :type email: str
+        :param db: The request's session.
+        :type db: Session
+        :return: The user id and the shard.
+        :rtype: tuple[int, int]
+        """
+        if not self.sharded:
+            row = self.allocate(db, email, 0)
+            return row.user_id, row.shard
+        row = await asyncio.to_thread(self._allocate_on_catalog, email)
+        self._remember(email, row.shard)
+        self._remember(row.user_id, row.shard)
+        return row.user_id, row.shard
+
+    @staticmethod
+    def bind(db: Session, shard: int) -> None:
+        """
+        Points a session at a shard. A transaction already open on another shard (only
+        ever a lookup) is rolled back first.
+        """
+        if db.info.get("shard", 0) != shard and db.in_transaction():
+            db.rollback()
+        db.info["shard"] = shard
+
+    async def fenced(self, key: str | int) -> bool:
+        return self.redis is not None and bool(await self.redis.exists(fence_key(key)))
+
+    async def route(self, db: Session, key: str | int, write: bool = False, refresh: bool = False) -> int:
+        """
+        Points the session at the shard of a user.
+
+        Users without a directory entry are routed to their hash placement, where lookups
+        simply find nothing.
+
+        :param db: The session.
+        :type db: Session
+        :param key: The user's email or id.
+        :type key: str | int
+        :param write: The caller may write; refused while the user is being moved.
+        :type write: bool
+        :param refresh: Bypass the cached directory entry.
+        :type refresh: bool
+        :return: The shard index.
+        :rtype: int
+        :raises ShardFenced: If ``write`` is set and the user is being moved.
+        """
+        if not self.sharded:
+            return 0
+        shard = await self.lookup(key, refresh)
+        if shard is None:
+            shard = shard_for_email(key, len(self.engines)) if isinstance(key, str) else 0
+        if write and await self.fenced(key):
+            raise ShardFenced()
+        self.bind(db, shard)
+        return shard
+
+
+shard_router = ShardRouter()
+invalidation_bus.register("shards", shard_router)
@@ -0,0 +1,122 @@
+"""
+Queues a birthday reminder email for every user with contacts whose birthday is coming up.
+
+Run once a day (e.g. from cron)::
+
+    python -m src.jobs.birthday_reminders
+    python -m src.jobs.birthday_reminders --days 7 --chunk-size 5000
+
+Users are processed in ranges of ``--chunk-size`` user ids; each range is one query over
+the contact table, streamed with a server-side cursor. After every range the last user
+id is saved in ``job_checkpoints``, so a run that is interrupted resumes after the last
+finished range, and a finished run does nothing when started again the same day.
+Reminders are queued with a per-user, per-day dedupe key, so the range that was in
+progress when a run crashed does not email anyone twice.
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import date, datetime
+
+import redis.asyncio as redis
+from dotenv import load_dotenv
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from src.db.db import SessionLocal, shard_engines
+from src.db.sharding import add_results
+from src.db.models import JobCheckpoint, User
+from src.repository.birthdays import birthday_window, iter_upcoming_birthdays
+from src.services.queue import RedisStreamBroker, job_queue
+
+load_dotenv()
+
+JOB_NAME = "birthday_reminders"
+# users per range query
+BIRTHDAY_CHUNK_SIZE = int(os.getenv('BIRTHDAY_CHUNK_SIZE', '5000'))
+BIRTHDAY_WINDOW_DAYS = int(os.getenv('BIRTHDAY_WINDOW_DAYS', '7'))
+
+
+def _checkpoint(db: Session, run_date: date) -> JobCheckpoint:
+    checkpoint = db.get(JobCheckpoint, (JOB_NAME, run_date))
+    if checkpoint is None:
+        checkpoint = JobCheckpoint(name=JOB_NAME, run_date=run_date, last_user_id=0)
+        db.add(checkpoint)
+        db.commit()
+    return checkpoint
+
+
+async def run(db: Session, today: date | None = None, days: int = BIRTHDAY_WINDOW_DAYS,
+              chunk_size: int = BIRTHDAY_CHUNK_SIZE) -> dict:
+    """
+    Queues today's birthday reminders, resuming from the last checkpoint.
+
+    :param db: The database session.
+    :type db: Session
+    :param today: The run date, defaults to today.
+    :type today: date, optional
+    :param days: How many days ahead a birthday counts as upcoming.
+    :type days: int
+    :param chunk_size: Users per range query.
+    :type chunk_size: int
+    :return: Queued reminders, contacts they list, range queries run and elapsed seconds.
+    :rtype: dict
+    """
+    today = today or date.today()
+    started = time.perf_counter()
+    result = {"reminders": 0, "contacts": 0, "chunks": 0}
+    checkpoint = _checkpoint(db, today)
+    if checkpoint.finished_at is not None:
+        return {**result, "seconds": 0.0}
+
+    window = birthday_window(today, days)
+    while True:
+        # start at the next existing id, so gaps in the id sequence cost no empty ranges
+        first = db.scalar(select(func.min(User.id)).where(User.id > checkpoint.last_user_id))
+        if first is None:
+            break
+        last = first + chunk_size - 1
+        for (user_id, email, username), contacts in iter_upcoming_birthdays(db, first, last, window):
+            queued = await job_queue.enqueue("send_birthday_reminder", dedupe_key=f"{today}:{user_id}",
+                                             email=email, username=username, contacts=contacts)
+            if queued:
+                result["reminders"] += 1
+                result["contacts"] += len(contacts)
+        checkpoint.last_user_id = last
+        db.commit()
+        result["chunks"] += 1
+
+    checkpoint.finished_at = datetime.now()
+    db.commit()
+    return {**result, "seconds": round(time.perf_counter() - started, 3)}
+
+
+async def main_async(days: int, chunk_size: int) -> dict:
+    r = redis.Redis(host=os.getenv('REDIS_HOST'), port=os.getenv('REDIS_PORT'), db=0, encoding="utf-8",
+                    decode_responses=True)
+    job_queue.use(RedisStreamBroker(r))
+    results = []
+    try:
+        # each shard keeps its own users and checkpoint
+        for shard in range(len(shard_engines)):
+            db = SessionLocal(info={"shard": shard})
+            try:
+                results.append(await run(db, days=days, chunk_size=chunk_size))
+            finally:
+                db.close()
+    finally:
+        await r.aclose()
+    return add_results(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=BIRTHDAY_WINDOW_DAYS)
+    parser.add_argument("--chunk-size", type=int, default=BIRTHDAY_CHUNK_SIZE)
+    args = parser.parse_args()
+    print(asyncio.run(main_async(args.days, args.chunk_size)))
+
+
+if __name__ == "__main__":
+    main()
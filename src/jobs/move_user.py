@@ -0,0 +1,153 @@
+"""
+Moves a user, with their contacts and statistics, to another database shard.
+
+Run while the application is serving::
+
+    python -m src.jobs.move_user --email user@example.com --to 2
+
+The user is write-fenced first: their writes answer 503 with ``Retry-After`` (and their
+queued jobs are retried later) while reads continue from the source shard. After a
+grace period for writes that were already past the fence, the rows are copied to the
+target shard in one transaction, the directory is switched, the source rows are
+deleted and the fence is lifted. The fence lasts about as long as copying one user's
+rows. Cached placements are invalidated in every process; a worker that missed the
+invalidation finds no user on the source shard and refreshes it from the directory.
+
+A move that fails before the directory switch leaves the user on the source shard; the
+partial copy on the target is replaced by the next attempt.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import redis.asyncio as redis
+from dotenv import load_dotenv
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from src.db.models import Contact, ContactStats, ShardDirectory, User
+from src.db.sharding import ShardRouter, fence_key, shard_router
+from src.services.invalidation import invalidation_bus
+
+load_dotenv()
+
+# longest a fence can outlive a crashed move, in seconds
+SHARD_FENCE_TTL = int(os.getenv('SHARD_FENCE_TTL', '60'))
+# wait after fencing for writes that passed the fence check just before it was set
+SHARD_FENCE_GRACE_MS = int(os.getenv('SHARD_FENCE_GRACE_MS', '500'))
+
+# parents first; deleted in reverse
+USER_TABLES = ((User.__table__, User.__table__.c.id), (ContactStats.__table__, ContactStats.__table__.c.user_id),
+               (Contact.__table__, Contact.__table__.c.user_id))
+
+
+def copy_user(source: Session, target: Session, user_id: int) -> int:
+    """
+    Replaces the user's rows on the target shard with those on the source shard, without
+    committing.
+
+    On PostgreSQL contact ids are kept, the contact key is ``(user_id, id)``; where the id
+    alone is the key they are renumbered by the target.
+
+    :param source: Session on the source shard.
+    :type source: Session
+    :param target: Session on the target shard.
+    :type target: Session
+    :param user_id: The user.
+    :type user_id: int
+    :return: Number of contacts copied.
+    :rtype: int
+    """
+    keep_contact_ids = target.get_bind().dialect.name == "postgresql"
+    for table, owner in reversed(USER_TABLES):
+        target.execute(delete(table).where(owner == user_id))
+    contacts = 0
+    for table, owner in USER_TABLES:
+        rows = [dict(row) for row in source.execute(select(table).where(owner == user_id)).mappings()]
+        if table is Contact.__table__:
+            contacts = len(rows)
+            if not keep_contact_ids:
+                rows = [{key: value for key, value in row.items() if key != "id"} for row in rows]
+        if rows:
+            target.execute(insert(table), rows)
+    return contacts
+
+
+async def move_user(email: str, target: int, router: ShardRouter = shard_router, fence_ttl: int = SHARD_FENCE_TTL,
+                    grace_ms: int = SHARD_FENCE_GRACE_MS) -> dict:
+    """
+    Moves a user to another shard behind a write fence.
+
+    :param email: The user's email.
+    :type email: str
+    :param target: The destination shard.
+    :type target: int
+    :param router: The shard router; its Redis client holds the fence.
+    :type router: ShardRouter
+    :param fence_ttl: Seconds the fence survives a crashed move.
+    :type fence_ttl: int
+    :param grace_ms: Wait after fencing, in milliseconds.
+    :type grace_ms: int
+    :return: User id, source and target shard, contacts copied and how long writes were fenced.
+    :rtype: dict
+    :raises LookupError: If the user is not in the directory.
+    :raises ValueError: If the target shard does not exist.
+    """
+    if not 0 <= target < len(router.engines):
+        raise ValueError(f"No shard {target}, there are {len(router.engines)}")
+    with Session(bind=router.engines[0]) as catalog:
+        entry = catalog.scalars(select(ShardDirectory).where(ShardDirectory.email == email)).first()
+    if entry is None:
+        raise LookupError(f"No user {email} in the shard directory")
+    result = {"user_id": entry.user_id, "source": entry.shard, "target": target, "contacts": 0, "fenced_ms": 0}
+    if entry.shard == target:
+        return result
+
+    keys = (fence_key(email), fence_key(entry.user_id))
+    fenced = time.perf_counter()
+    for key in keys:
+        await router.redis.set(key, 1, ex=fence_ttl)
+    try:
+        await asyncio.sleep(grace_ms / 1000)
+        with Session(bind=router.engines[entry.shard]) as source, Session(bind=router.engines[target]) as dest:
+            result["contacts"] = copy_user(source, dest, entry.user_id)
+            dest.commit()
+            with Session(bind=router.engines[0]) as catalog:
+                catalog.execute(update(ShardDirectory).where(ShardDirectory.user_id == entry.user_id)
+                                .values(shard=target))
+                catalog.commit()
+            router.forget(email, entry.user_id)
+            # the other processes drop their cached placement too
+            await invalidation_bus.invalidate("shards", email)
+            await invalidation_bus.invalidate("shards", entry.user_id)
+            for table, owner in reversed(USER_TABLES):
+                source.execute(delete(table).where(owner == entry.user_id))
+            source.commit()
+    finally:
+        await router.redis.delete(*keys)
+        result["fenced_ms"] = round((time.perf_counter() - fenced) * 1000, 1)
+    return result
+
+
+async def main_async(email: str, target: int) -> dict:
+    r = redis.Redis(host=os.getenv('REDIS_HOST'), port=os.getenv('REDIS_PORT'), db=0, encoding="utf-8",
+                    decode_responses=True)
+    shard_router.use(r)
+    invalidation_bus.use(r)
+    try:
+        return await move_user(email, target)
+    finally:
+        await r.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--to", type=int, required=True, help="destination shard index")
+    args = parser.parse_args()
+    print(asyncio.run(main_async(args.email, args.to)))
+
+
+if __name__ == "__main__":
+    main()
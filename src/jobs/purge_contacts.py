@@ -0,0 +1,105 @@
+"""
+Hard-deletes contacts that were soft-deleted longer ago than the retention period.
+
+Run periodically (e.g. hourly from cron)::
+
+    python -m src.jobs.purge_contacts
+    python -m src.jobs.purge_contacts --retention-days 7 --batch-size 1000 --pause-ms 50
+
+Tombstones are removed in batches of ``--batch-size`` rows, each batch its own short
+transaction, with a pause of ``--pause-ms`` between batches so the purge never holds many
+row locks or writes a burst of WAL while requests are being served. Progress is printed
+and exported as metrics after every batch, and an interrupted run simply continues with
+the remaining tombstones next time.
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from src.db.db import SessionLocal, shard_engines
+from src.db.sharding import add_results
+from src.repository import contacts as repository_contacts
+from src.services.metrics import registry
+
+load_dotenv()
+
+# how long a deleted contact can still be restored
+CONTACT_RETENTION_DAYS = int(os.getenv('CONTACT_RETENTION_DAYS', '30'))
+# rows per DELETE statement and transaction
+PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', '500'))
+# pause between batches, gives replicas and concurrent writers room
+PURGE_PAUSE_MS = int(os.getenv('PURGE_PAUSE_MS', '100'))
+
+contacts_purged = registry.counter("contacts_purged_total", "Soft-deleted contacts removed by the purge job")
+purge_batches = registry.counter("contact_purge_batches_total", "DELETE batches run by the purge job")
+purge_batch_seconds = registry.histogram("contact_purge_batch_seconds", "Duration of one purge DELETE batch")
+
+
+async def run(db: Session, retention_days: int = CONTACT_RETENTION_DAYS, batch_size: int = PURGE_BATCH_SIZE,
+              pause_ms: int = PURGE_PAUSE_MS, max_batches: int | None = None, now: datetime | None = None) -> dict:
+    """
+    Purges expired tombstones batch by batch until none are left.
+
+    :param db: The database session.
+    :type db: Session
+    :param retention_days: Days a deleted contact is kept.
+    :type retention_days: int
+    :param batch_size: Rows per batch.
+    :type batch_size: int
+    :param pause_ms: Pause between batches, in milliseconds.
+    :type pause_ms: int
+    :param max_batches: Stop after this many batches, None to run until done.
+    :type max_batches: int, optional
+    :param now: The current time, defaults to the database clock.
+    :type now: datetime, optional
+    :return: Purged contacts, batches run and elapsed seconds.
+    :rtype: dict
+    """
+    if now is None:
+        cutoff = repository_contacts.purge_cutoff(db, retention_days)
+    else:
+        cutoff = now - timedelta(days=retention_days)
+    started = time.perf_counter()
+    result = {"purged": 0, "batches": 0}
+    while max_batches is None or result["batches"] < max_batches:
+        batch_started = time.perf_counter()
+        purged = repository_contacts.purge_batch(db, cutoff, batch_size)
+        purge_batch_seconds.observe(time.perf_counter() - batch_started)
+        purge_batches.inc()
+        contacts_purged.inc(purged)
+        result["purged"] += purged
+        result["batches"] += 1
+        print(f"purge: batch {result['batches']} removed {purged}, {result['purged']} so far", flush=True)
+        if purged < batch_size:
+            break
+        await asyncio.sleep(pause_ms / 1000)
+    return {**result, "seconds": round(time.perf_counter() - started, 3)}
+
+
+async def main_async(retention_days: int, batch_size: int, pause_ms: int) -> dict:
+    results = []
+    for shard in range(len(shard_engines)):
+        db = SessionLocal(info={"shard": shard})
+        try:
+            results.append(await run(db, retention_days, batch_size, pause_ms))
+        finally:
+            db.close()
+    return add_results(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--retention-days", type=int, default=CONTACT_RETENTION_DAYS)
+    parser.add_argument("--batch-size", type=int, default=PURGE_BATCH_SIZE)
+    parser.add_argument("--pause-ms", type=int, default=PURGE_PAUSE_MS)
+    args = parser.parse_args()
+    print(asyncio.run(main_async(args.retention_days, args.batch_size, args.pause_ms)))
+
+
+if __name__ == "__main__":
+    main()
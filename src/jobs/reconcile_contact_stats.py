@@ -0,0 +1,55 @@
+"""
+Repairs drift between the ``contact_stats`` summary table and the contact table.
+
+Run periodically (e.g. nightly from cron)::
+
+    python -m src.jobs.reconcile_contact_stats
+    python -m src.jobs.reconcile_contact_stats --user-id 42
+"""
+import argparse
+import asyncio
+import os
+
+from dotenv import load_dotenv
+
+from src.db.db import SessionLocal, shard_engines
+from src.repository import contact_stats as repository_stats
+
+load_dotenv()
+
+# users reconciled per transaction; their statistics rows stay locked until it commits
+RECONCILE_BATCH_SIZE = int(os.getenv('RECONCILE_BATCH_SIZE', '500'))
+
+
+async def run(user_id: int | None = None, batch_size: int = RECONCILE_BATCH_SIZE) -> int:
+    """
+    Reconciles the statistics of one user or of every user, on every shard.
+
+    :param user_id: Limit the job to one user.
+    :type user_id: int, optional
+    :param batch_size: Users reconciled per transaction.
+    :type batch_size: int
+    :return: The number of repaired statistics rows.
+    :rtype: int
+    """
+    repaired = 0
+    for shard in range(len(shard_engines)):
+        db = SessionLocal(info={"shard": shard})
+        try:
+            repaired += await repository_stats.reconcile(db, user_id, batch_size)
+        finally:
+            db.close()
+    return repaired
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=RECONCILE_BATCH_SIZE)
+    args = parser.parse_args()
+    repaired = asyncio.run(run(args.user_id, args.batch_size))
+    print(f"Repaired {repaired} contact_stats rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import asyncio
+import base64
+import io
+import os
+
+import cloudinary
+import cloudinary.uploader
+from dotenv import load_dotenv
+
+from src.db.db import dialect_insert
+from src.db.models import Contact
+from src.db.sharding import shard_router
+from src.repository import contact_stats as repository_stats
+from src.repository import users as repository_users
+from src.schemas import ContactCreate
+from src.services.email import send_birthday_reminder as deliver_birthday_reminder
+from src.services.email import send_email as deliver_email
+from src.services.events import event_hub
+from src.services.normalization import normalized_fields
+from src.services.queue import job_queue
+from src.services.tracing import span
+
+load_dotenv()
+
+# contacts inserted per statement by the import task
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '500'))
+
+
+@job_queue.task("send_email")
+async def send_email(email: str, username: str, host: str) -> None:
+    """
+    Sends the email confirmation message.
+
+    :param email: The recipient's email address.
+    :type email: str
+    :param username: The recipient's username.
+    :type username: str
+    :param host: The base URL of the application.
+    :type host: str
+    """
+    await deliver_email(email, username, host)
+
+
+@job_queue.task("send_birthday_reminder")
+async def send_birthday_reminder(email: str, username: str, contacts: list[dict]) -> None:
+    """
+    Sends a user the list of their contacts with upcoming birthdays.
+
+    :param email: The recipient's email address.
+    :type email: str
+    :param username: The recipient's username.
+    :type username: str
+    :param contacts: first_name, last_name and birthday of each contact.
+    :type contacts: list[dict]
+    """
+    await deliver_birthday_reminder(email, username, contacts)
+
+
+@job_queue.task("process_avatar")
+async def process_avatar(email: str, username: str, image: str) -> None:
+    """
+    Uploads an avatar to Cloudinary and stores its URL on the user.
+
+    :param email: The user's email address.
+    :type email: str
+    :param username: The user's username, used as the Cloudinary public id.
+    :type username: str
+    :param image: The uploaded image, base64 encoded.
+    :type image: str
+    """
+    cloudinary.config(
+        cloud_name=os.getenv('CLOUDINARY_NAME'),
+        api_key=os.getenv('CLOUDINARY_API_KEY'),
+        api_secret=os.getenv('CLOUDINARY_API_SECRET'),
+        secure=True
+    )
+    with span("cloudinary.upload"):
+        # blocking HTTP call, in a thread so the worker's other jobs keep running
+        r = await asyncio.to_thread(cloudinary.uploader.upload, io.BytesIO(base64.b64decode(image)),
+                                    public_id=f'NotesApp/{username}', overwrite=True)
+    src_url = cloudinary.CloudinaryImage(f'NotesApp/{username}')\
+                        .build_url(width=250, height=250, crop='fill', version=r.get('version'))
+    with job_queue.session() as db:
+        # a user being moved to another shard fails the job, which is retried after the move
+        await shard_router.route(db, email, write=True)
+        await repository_users.update_avatar(email, src_url, db)
+
+
+@job_queue.task("import_contacts")
+async def import_contacts(user_id: int, contacts: list[dict]) -> int:
+    """
+    Inserts contacts in batches, skipping those whose email or phone number the user
+    already has. Each batch is one ``INSERT ... ON CONFLICT DO NOTHING RETURNING`` plus
+    the statistics upsert, committed together, so a retried job only inserts what is missing.
+
+    :param user_id: The owner of the contacts.
+    :type user_id: int
+    :param contacts: Contact data in the shape of :class:`ContactCreate`.
+    :type contacts: list[dict]
+    :return: The number of inserted contacts.
+    :rtype: int
+    """
+    inserted = 0
+    with job_queue.session() as db:
+        await shard_router.route(db, user_id, write=True)
+        for start in range(0, len(contacts), IMPORT_BATCH_SIZE):
+            # the statements block, so each batch runs in a thread and other jobs keep running
+            inserted += await asyncio.to_thread(_import_batch, user_id, contacts[start:start + IMPORT_BATCH_SIZE], db)
+    if inserted:
+        # one event for the whole import; streams reload the list rather than receive every contact
+        await event_hub.publish(user_id, "imported", {"inserted": inserted})
+    return inserted
+
+
+def _import_batch(user_id: int, contacts: list[dict], db) -> int:
+    rows = []
+    for data in contacts:
+        contact = ContactCreate.model_validate(data)
+        rows.append({**contact.model_dump(), "user_id": user_id,
+                     **normalized_fields(contact.email, contact.phone_number)})
+    stmt = dialect_insert(db, Contact).values(rows).on_conflict_do_nothing().returning(
+        Contact.birthday, Contact.phone_number, Contact.email
+    )
+    deltas = None
+    inserted = 0
+    for row in db.execute(stmt):
+        deltas = repository_stats.contact_delta(row, deltas=deltas)
+        inserted += 1
+    if deltas:
+        stats = repository_stats.deltas_upsert(user_id, deltas, db)
+        if stats is not None:
+            db.execute(stats)
+    db.commit()
+    return inserted
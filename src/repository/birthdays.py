@@ -0,0 +1,80 @@
+from datetime import date, timedelta
+from itertools import groupby
+from typing import Iterator
+
+from sqlalchemy import extract, select
+from sqlalchemy.orm import Session
+
+from src.db.models import Contact, User
+
+# rows fetched from the server-side cursor at a time
+FETCH_SIZE = 1000
+
+
+def birthday_window(today: date, days: int) -> list[int]:
+    """
+    Returns the birthdays that fall within the next ``days`` days as ``month * 100 + day``
+    keys, so the window can wrap around the new year.
+
+    February 29 birthdays are celebrated on March 1 in non-leap years.
+
+    :param today: The first day of the window.
+    :type today: date
+    :param days: Length of the window after today.
+    :type days: int
+    :return: The sorted ``month * 100 + day`` keys of the window.
+    :rtype: list[int]
+    """
+    keys = set()
+    for offset in range(days + 1):
+        day = today + timedelta(days=offset)
+        keys.add(day.month * 100 + day.day)
+        if day.month == 3 and day.day == 1 and (day - timedelta(days=1)).day == 28:
+            keys.add(229)
+    return sorted(keys)
+
+
+def birthday_key(column):
+    """
+    SQL expression for the ``month * 100 + day`` key of a date column.
+    """
+    return extract("month", column) * 100 + extract("day", column)
+
+
+def iter_upcoming_birthdays(db: Session, first_user_id: int, last_user_id: int,
+                            window: list[int]) -> Iterator[tuple[tuple[int, str, str], list[dict]]]:
+    """
+    Streams the contacts with a birthday in ``window`` for a range of users, with one
+    query over the contact table and a server-side cursor, grouped by user.
+
+    Only confirmed users are included. Memory is bounded by :data:`FETCH_SIZE` rows plus
+    the birthdays of one user.
+
+    :param db: The database session.
+    :type db: Session
+    :param first_user_id: First user id of the range, inclusive.
+    :type first_user_id: int
+    :param last_user_id: Last user id of the range, inclusive.
+    :type last_user_id: int
+    :param window: Keys from :func:`birthday_window`.
+    :type window: list[int]
+    :return: ``(user_id, email, username)`` and that user's contacts, in user id order.
+    :rtype: Iterator
+    """
+    stmt = (
+        select(User.id, User.email, User.username, Contact.first_name, Contact.last_name, Contact.birthday)
+        .join(Contact, Contact.user_id == User.id)
+        .where(
+            User.id.between(first_user_id, last_user_id),
+            User.confirmed.is_(True),
+            birthday_key(Contact.birthday).in_(window),
+            Contact.deleted_at.is_(None),
+        )
+        .order_by(User.id, birthday_key(Contact.birthday))
+        .execution_options(yield_per=FETCH_SIZE)
+    )
+    for user, rows in groupby(db.execute(stmt), key=lambda row: (row.id, row.email, row.username)):
+        yield user, [
+            {"first_name": row.first_name, "last_name": row.last_name, "birthday": row.birthday.isoformat()}
+            for row in rows
+        ]
@@ -0,0 +1,175 @@
+from collections import defaultdict
+from datetime import date
+
+from sqlalchemy import case, delete, extract, func, select
+from sqlalchemy.orm import Session
+
+from src.db.db import dialect_insert
+from src.db.models import Contact, ContactStats, User
+
+COUNTERS = ("total", "missing_phone", "missing_email")
+
+
+def birth_month(birthday: date | None) -> int:
+    """
+    Returns the statistics bucket for a birthday.
+
+    :param birthday: The contact's birthday.
+    :type birthday: date, optional
+    :return: The month number, or 0 when the birthday is unknown.
+    :rtype: int
+    """
+    return birthday.month if birthday else 0
+
+
+def contact_delta(contact, sign: int = 1, deltas: dict | None = None) -> dict:
+    """
+    Adds the contribution of one contact to a set of statistics deltas.
+
+    :param contact: Any object with ``birthday``, ``phone_number`` and ``email`` attributes.
+    :type contact: Contact
+    :param sign: 1 when the contact is added, -1 when it is removed.
+    :type sign: int
+    :param deltas: Deltas to accumulate into, a new dict when omitted.
+    :type deltas: dict, optional
+    :return: Mapping of birth month to ``[total, missing_phone, missing_email]`` changes.
+    :rtype: dict
+    """
+    deltas = defaultdict(lambda: [0, 0, 0]) if deltas is None else deltas
+    row = deltas[birth_month(contact.birthday)]
+    row[0] += sign
+    row[1] += sign * (not (contact.phone_number or "").strip())
+    row[2] += sign * (not (contact.email or "").strip())
+    return deltas
+
+
+def deltas_upsert(user_id: int, deltas: dict, db: Session):
+    """
+    Builds the multi-row upsert that applies statistics deltas.
+
+    :param user_id: The owner of the contacts.
+    :type user_id: int
+    :param deltas: Deltas built with :func:`contact_delta`.
+    :type deltas: dict
+    :param db: The database session.
+    :type db: Session
+    :return: The statement, None when the deltas change nothing.
+    :rtype: Insert, optional
+    """
+    rows = [
+        {"user_id": user_id, "birth_month": month, **dict(zip(COUNTERS, values))}
+        for month, values in deltas.items() if any(values)
+    ]
+    if not rows:
+        return None
+    stmt = dialect_insert(db, ContactStats).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[ContactStats.user_id, ContactStats.birth_month],
+        set_={name: getattr(ContactStats, name) + getattr(stmt.excluded, name) for name in COUNTERS},
+    )
+
+
+async def apply_deltas(user_id: int, deltas: dict, db: Session) -> None:
+    """
+    Applies statistics deltas with a single multi-row upsert. Does not commit, so the
+    change lands in the caller's transaction together with the contact write.
+
+    :param user_id: The owner of the contacts.
+    :type user_id: int
+    :param deltas: Deltas built with :func:`contact_delta`.
+    :type deltas: dict
+    :param db: The database session.
+    :type db: Session
+    :return: None
+    """
+    stmt = deltas_upsert(user_id, deltas, db)
+    if stmt is not None:
+        db.execute(stmt)
+
+
+async def get_stats(user_id: int, db: Session, today: date | None = None) -> dict:
+    """
+    Reads a user's statistics from the summary table, at most 13 rows by primary key.
+
+    :param user_id: The owner of the contacts.
+    :type user_id: int
+    :param db: The database session.
+    :type db: Session
+    :param today: The date that defines "this month", defaults to today.
+    :type today: date, optional
+    :return: total, birthdays_this_month, missing_phone and missing_email counts.
+    :rtype: dict
+    """
+    month = (today or date.today()).month
+    rows = db.execute(select(ContactStats).where(ContactStats.user_id == user_id)).scalars().all()
+    return {
+        "total": sum(row.total for row in rows),
+        "birthdays_this_month": sum(row.total for row in rows if row.birth_month == month),
+        "missing_phone": sum(row.missing_phone for row in rows),
+        "missing_email": sum(row.missing_email for row in rows),
+    }
+
+
+def _blank(column):
+    return case((func.coalesce(func.trim(column), "") == "", 1), else_=0)
+
+
+async def reconcile(db: Session, user_id: int | None = None, batch_size: int = 500) -> int:
+    """
+    Recomputes the statistics from the contact table and repairs rows that drifted.
+    Users are processed ``batch_size`` at a time, each batch in its own transaction.
+
+    :param db: The database session.
+    :type db: Session
+    :param user_id: Limit the check to one user, all users when omitted.
+    :type user_id: int, optional
+    :param batch_size: Users checked per transaction.
+    :type batch_size: int
+    :return: The number of statistics rows that were inserted, corrected or removed.
+    :rtype: int
+    """
+    if user_id is not None:
+        return _reconcile_users(db, [user_id])
+    repaired, last = 0, 0
+    while True:
+        user_ids = db.scalars(select(User.id).where(User.id > last).order_by(User.id).limit(batch_size)).all()
+        if not user_ids:
+            return repaired
+        repaired += _reconcile_users(db, user_ids)
+        last = user_ids[-1]
+
+
+def _reconcile_users(db: Session, user_ids: list[int]) -> int:
+    # the stored rows are locked before the contacts are counted: a write that already
+    # updated them is waited for and then counted, a later one waits and adds its delta
+    # to the repaired row, so no increment is lost between the count and the fix-up
+    stored = {(row.user_id, row.birth_month): row for row in db.scalars(
+        select(ContactStats).where(ContactStats.user_id.in_(user_ids))
+        .with_for_update().execution_options(populate_existing=True))}
+    month = func.coalesce(extract("month", Contact.birthday), 0)
+    query = select(
+        Contact.user_id, month, func.count(), func.sum(_blank(Contact.phone_number)), func.sum(_blank(Contact.email))
+    ).where(Contact.user_id.in_(user_ids), Contact.deleted_at.is_(None)).group_by(Contact.user_id, month)
+    expected = {(row[0], int(row[1])): tuple(int(v) for v in row[2:]) for row in db.execute(query)}
+
+    repaired = 0
+    for key, row in stored.items():
+        if key not in expected:
+            db.execute(delete(ContactStats).where(
+                ContactStats.user_id == key[0], ContactStats.birth_month == key[1]))
+            repaired += 1
+    missing = []
+    for key, values in expected.items():
+        row = stored.get(key)
+        if row is None:
+            missing.append({"user_id": key[0], "birth_month": key[1], **dict(zip(COUNTERS, values))})
+        elif (row.total, row.missing_phone, row.missing_email) != values:
+            row.total, row.missing_phone, row.missing_email = values
+            repaired += 1
+    if missing:
+        # a concurrent write may create the same row first; its counters are left to the next run
+        stmt = dialect_insert(db, ContactStats).values(missing).on_conflict_do_nothing(
+            index_elements=[ContactStats.user_id, ContactStats.birth_month])
+        repaired += db.execute(stmt).rowcount
+    db.commit()
+    return repaired
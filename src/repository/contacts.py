@@ -0,0 +1,307 @@
+from datetime import timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import bindparam, delete, func, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from src.db.db import dialect_insert
+from src.db.models import Contact
+from src.repository import contact_stats as repository_stats
+from src.schemas import ContactCreate
+from src.services.duplicates import merge_values
+from src.services.normalization import normalized_fields
+
+# the columns the statistics deltas are computed from
+STATS_COLUMNS = ("birthday", "phone_number", "email")
+
+# built once; executions reuse SQLAlchemy's cached compilation and only bind new values
+CONTACT_BY_ID = select(Contact).where(Contact.id == bindparam("contact_id"), Contact.user_id == bindparam("user_id"),
+                                      Contact.deleted_at.is_(None)).limit(1)
+
+
+class DuplicateContact(Exception):
+    """
+    Raised when the user already has a contact with the same email or phone number.
+    """
+
+
+def contact_values(body: ContactCreate) -> dict:
+    """
+    Returns the column values of a contact, including the normalized email and phone.
+
+    :param body: The contact data.
+    :type body: ContactCreate
+    :return: Column name to value.
+    :rtype: dict
+    """
+    return {**body.model_dump(), **normalized_fields(body.email, body.phone_number)}
+
+
+async def get_contact(contact_id: int, user_id: int, db: Session) -> Contact | None:
+    """
+    Returns one of the user's contacts by id.
+
+    :param contact_id: The contact to read.
+    :type contact_id: int
+    :param user_id: The owner of the contact.
+    :type user_id: int
+    :param db: The database session.
+    :type db: Session
+    :return: The contact, None if the user has no such contact.
+    :rtype: Contact | None
+    """
+    return db.scalars(CONTACT_BY_ID, {"contact_id": contact_id, "user_id": user_id}).first()
+
+
+async def create_contact(body: ContactCreate, user_id: int, db: Session) -> Contact:
+    """
+    Inserts a contact with ``INSERT ... ON CONFLICT DO NOTHING RETURNING`` and updates the
+    statistics in the same transaction, then commits.
+
+    :param body: The contact data.
+    :type body: ContactCreate
+    :param user_id: The owner of the contact.
+    :type user_id: int
+    :param db: The database session.
+    :type db: Session
+    :return: The new contact.
+    :rtype: Contact
+    :raises DuplicateContact: If the user already has the email or phone number.
+    """
+    stmt = (
+        dialect_insert(db, Contact)
+        .values(**contact_values(body), user_id=user_id)
+        .on_conflict_do_nothing()
+        .returning(Contact)
+    )
+    contact = db.scalars(stmt).first()
+    if contact is None:
+        raise DuplicateContact()
+    await repository_stats.apply_deltas(user_id, repository_stats.contact_delta(contact), db)
+    return _commit_loaded(contact, db)
+
+
+def _commit_loaded(contact: Contact, db: Session) -> Contact:
+    # RETURNING already loaded every column; detached, the commit does not expire them,
+    # so serializing the response needs no refresh query
+    db.expunge(contact)
+    db.commit()
+    return contact
+
+
+def _update_statement(dialect: str, contact_id: int, user_id: int, values: dict):
+    own = (Contact.id == contact_id, Contact.user_id == user_id, Contact.deleted_at.is_(None))
+    if dialect != "postgresql":
+        stmt = update(Contact).where(*own).values(**values).returning(Contact)
+    else:
+        # the locked pre-update row is read in the same statement, RETURNING yields old and new values
+        previous = select(Contact.id, *(getattr(Contact, name).label(f"old_{name}") for name in STATS_COLUMNS)) \
+            .where(*own).with_for_update().cte("previous")
+        stmt = (
+            update(Contact).add_cte(previous).where(Contact.id == previous.c.id, Contact.user_id == user_id)
+            .values(**values)
+            .returning(Contact, *(previous.c[f"old_{name}"] for name in STATS_COLUMNS))
+        )
+    return stmt.execution_options(synchronize_session=False, populate_existing=True)
+
+
+async def update_contact(contact_id: int, body: ContactCreate, user_id: int, db: Session) -> Contact | None:
+    """
+    Replaces a contact's values and adjusts the statistics by the difference, then commits.
+
+    On PostgreSQL the old values come back from the ``UPDATE ... RETURNING`` itself, so the
+    write is one statement. SQLite cannot return columns of a joined table, so the old
+    values are read first; it has no network round-trip to save.
+
+    :param contact_id: The contact to update.
+    :type contact_id: int
+    :param body: The new contact data.
+    :type body: ContactCreate
+    :param user_id: The owner of the contact.
+    :type user_id: int
+    :param db: The database session.
+    :type db: Session
+    :return: The updated contact, None if the user has no such contact.
+    :rtype: Contact | None
+    :raises DuplicateContact: If another contact of the user has the email or phone number.
+    """
+    dialect = db.get_bind().dialect.name
+    old = None
+    if dialect != "postgresql":
+        old = db.execute(select(*(getattr(Contact, name) for name in STATS_COLUMNS))
+                         .where(Contact.id == contact_id, Contact.user_id == user_id,
+                                Contact.deleted_at.is_(None))).first()
+        if old is None:
+            return None
+    try:
+        row = db.execute(_update_statement(dialect, contact_id, user_id, contact_values(body))).first()
+    except IntegrityError:
+        db.rollback()
+        raise DuplicateContact()
+    if row is None:
+        return None
+    contact = row[0]
+    if old is None:
+        old = SimpleNamespace(**dict(zip(STATS_COLUMNS, row[1:])))
+    deltas = repository_stats.contact_delta(old, -1)
+    await repository_stats.apply_deltas(user_id, repository_stats.contact_delta(contact, 1, deltas), db)
+    return _commit_loaded(contact, db)
+
+
+async def delete_contact(contact_id: int, user_id: int, db: Session) -> bool:
+    """
+    Soft-deletes a contact with ``UPDATE ... SET deleted_at RETURNING`` and removes it from
+    the statistics, then commits. The row is hard-deleted later by the purge job.
+
+    :param contact_id: The contact to delete.
+    :type contact_id: int
+    :param user_id: The owner of the contact.
+    :type user_id: int
+    :param db: The database session.
+    :type db: Session
+    :return: False if the user has no such contact.
+    :rtype: bool
+    """
+    stmt = (
+        update(Contact).where(Contact.id == contact_id, Contact.user_id == user_id, Contact.deleted_at.is_(None))
+        .values(deleted_at=func.now())
+        .returning(*(getattr(Contact, name) for name in STATS_COLUMNS))
+        .execution_options(synchronize_session=False)
+    )
+    deleted = db.execute(stmt).first()
+    if deleted is None:
+        return False
+    await repository_stats.apply_deltas(user_id, repository_stats.contact_delta(deleted, -1), db)
+    db.commit()
+    return True
+
+
+async def restore_contact(contact_id: int, user_id: int, db: Session) -> Contact | None:
+    """
+    Brings back a soft-deleted contact that has not been purged yet, then commits.
+
+    :param contact_id: The contact to restore.
+    :type contact_id: int
+    :param user_id: The owner of the contact.
+    :type user_id: int
+    :param db: The database session.
+    :type db: Session
+    :return: The restored contact, None if the user has no such deleted contact.
+    :rtype: Contact | None
+    :raises DuplicateContact: If a live contact of the user has taken the email or phone number.
+    """
+    stmt = (
+        update(Contact).where(Contact.id == contact_id, Contact.user_id == user_id, Contact.deleted_at.is_not(None))
+        .values(deleted_at=None)
+        .returning(Contact)
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+    try:
+        contact = db.scalars(stmt).first()
+    except IntegrityError:
+        db.rollback()
+        raise DuplicateContact()
+    if contact is None:
+        return None
+    await repository_stats.apply_deltas(user_id, repository_stats.contact_delta(contact), db)
+    return _commit_loaded(contact, db)
+
+
+async def merge_contacts(contact_id: int, duplicate_ids: set[int], user_id: int,
+                         db: Session) -> tuple[Contact, list[int]] | None:
+    """
+    Merges duplicate contacts into one, then commits. The primary contact keeps its values,
+    empty fields are filled from the duplicates, and the duplicates are soft-deleted.
+
+    The primary is read ``FOR UPDATE``, so a concurrent update waits and the deltas start
+    from its current values. The duplicates are deleted with a guarded
+    ``UPDATE ... WHERE deleted_at IS NULL RETURNING``, as in :func:`delete_contact`: a
+    contact deleted concurrently is not returned, so it leaves the statistics only once.
+
+    :param contact_id: The contact to keep.
+    :type contact_id: int
+    :param duplicate_ids: The contacts to merge into it.
+    :type duplicate_ids: set[int]
+    :param user_id: The owner of the contacts.
+    :type user_id: int
+    :param db: The database session.
+    :type db: Session
+    :return: The merged contact and the ids of the deleted duplicates, None (nothing
+        changed) if the user does not have all of these contacts.
+    :rtype: tuple[Contact, list[int]] | None
+    :raises DuplicateContact: If another contact of the user has the merged email or phone number.
+    """
+    duplicate_ids = set(duplicate_ids) - {contact_id}
+    primary = db.scalars(CONTACT_BY_ID.with_for_update().execution_options(populate_existing=True),
+                         {"contact_id": contact_id, "user_id": user_id}).first()
+    if primary is None:
+        db.rollback()
+        return None
+    stmt = (
+        update(Contact).where(Contact.id.in_(duplicate_ids), Contact.user_id == user_id, Contact.deleted_at.is_(None))
+        .values(deleted_at=func.now())
+        .returning(Contact)
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+    duplicates = sorted(db.scalars(stmt).all(), key=lambda contact: contact.id)
+    if len(duplicates) != len(duplicate_ids):
+        db.rollback()
+        return None
+    deltas = repository_stats.contact_delta(primary, -1)
+    for duplicate in duplicates:
+        repository_stats.contact_delta(duplicate, -1, deltas)
+    values = merge_values(primary, duplicates)
+    for key, value in {**values, **normalized_fields(values["email"], values["phone_number"])}.items():
+        setattr(primary, key, value)
+    try:
+        # the duplicates' email and phone were released by the UPDATE above
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise DuplicateContact()
+    await repository_stats.apply_deltas(user_id, repository_stats.contact_delta(primary, 1, deltas), db)
+    return _commit_loaded(primary, db), [duplicate.id for duplicate in duplicates]
+
+
+def purge_cutoff(db: Session, retention_days: int):
+    """
+    Returns the SQL for the time before which tombstones are expired, read from the
+    database clock that ``deleted_at`` is stamped with, so the app server's clock and
+    timezone play no part.
+
+    :param db: The database session.
+    :type db: Session
+    :param retention_days: Days a deleted contact is kept.
+    :type retention_days: int
+    :return: A SQL expression.
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        # CURRENT_TIMESTAMP, which func.now() stamps with on SQLite, is in UTC like datetime('now')
+        return func.datetime("now", f"-{int(retention_days)} days")
+    return func.now() - timedelta(days=retention_days)
+
+
+def purge_batch(db: Session, cutoff, batch_size: int) -> int:
+    """
+    Hard-deletes up to ``batch_size`` contacts soft-deleted before ``cutoff`` and commits,
+    so each batch holds its row locks briefly and writes a bounded amount of WAL.
+
+    The batch is picked through the partial ``ix_contact_deleted_at`` index and deleted by
+    primary key; ``ctid`` is not used because it is only unique within one partition.
+
+    :param db: The database session.
+    :type db: Session
+    :param cutoff: Tombstones older than this are removed, see :func:`purge_cutoff`.
+    :type cutoff: datetime | ColumnElement
+    :param batch_size: Most rows deleted by the statement.
+    :type batch_size: int
+    :return: The number of contacts deleted.
+    :rtype: int
+    """
+    expired = select(Contact.user_id, Contact.id).where(Contact.deleted_at < cutoff).limit(batch_size)
+    stmt = delete(Contact).where(tuple_(Contact.user_id, Contact.id).in_(expired)) \
+        .execution_options(synchronize_session=False)
+    purged = db.execute(stmt).rowcount
+    db.commit()
+    return purged
@@ -0,0 +1,102 @@
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import and_, func, literal, literal_column, or_, select
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import Session
+
+from src.db.models import Contact
+
+load_dotenv()
+
+# text search configuration; "simple" lowercases without stemming, which suits names,
+# addresses and notes written in several languages
+SEARCH_CONFIG = os.getenv('SEARCH_TS_CONFIG', 'simple')
+
+# generated column maintained by PostgreSQL (see the full_text_search migration); names
+# weigh most, then email and phone, then the free-text notes. The email local part is
+# also indexed split on . _ - + so "doe" finds "john.doe@example.com"
+SEARCH_VECTOR_SQL = f"""
+    setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(first_name, '') || ' ' || coalesce(last_name, '')), 'A') ||
+    setweight(to_tsvector('{SEARCH_CONFIG}',
+        coalesce(email, '') || ' ' || translate(split_part(coalesce(email, ''), '@', 1), '._-+', '    ') || ' ' ||
+        coalesce(phone_number, '') || ' ' || coalesce(phone_normalized, '')), 'B') ||
+    setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(additional_info, '')), 'C')
+"""
+
+SEARCHED_COLUMNS = (Contact.first_name, Contact.last_name, Contact.email, Contact.phone_number,
+                    Contact.additional_info)
+
+# the column is not mapped, SQLite (tests, offline benchmarks) has no tsvector
+search_vector = literal_column("contact.search_vector", TSVECTOR)
+
+
+def search_statement(dialect: str, user_id: int, q: str, limit: int, highlight: bool = False):
+    """
+    Builds the full-text search over all contact fields.
+
+    On PostgreSQL ``q`` is parsed with ``websearch_to_tsquery`` (quoted phrases, ``or``,
+    ``-word``), matched against the GIN-indexed ``search_vector`` and ranked with
+    ``ts_rank_cd``. Other databases fall back to requiring every word of ``q`` as a
+    substring of some field, unranked.
+
+    :param dialect: Name of the database dialect.
+    :type dialect: str
+    :param user_id: The owner of the contacts.
+    :type user_id: int
+    :param q: The search query.
+    :type q: str
+    :param limit: Maximum number of results.
+    :type limit: int
+    :param highlight: Add a snippet with the matched words wrapped in ``<b>``.
+    :type highlight: bool
+    :return: A select of ``Contact``, ``rank`` and ``snippet`` columns.
+    """
+    if dialect == "postgresql":
+        query = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+        rank = func.ts_rank_cd(search_vector, query)
+        if highlight:
+            document = func.concat_ws(" ", *SEARCHED_COLUMNS)
+            snippet = func.ts_headline(SEARCH_CONFIG, document, query,
+                                       "StartSel=<b>, StopSel=</b>, MaxFragments=2, MaxWords=12, MinWords=3")
+        else:
+            snippet = literal(None)
+        return (
+            select(Contact, rank.label("rank"), snippet.label("snippet"))
+            .where(Contact.user_id == user_id, Contact.deleted_at.is_(None), search_vector.op("@@")(query))
+            .order_by(rank.desc(), Contact.id)
+            .limit(limit)
+        )
+
+    terms = [term.replace("%", "\\%").replace("_", "\\_") for term in q.lower().split()]
+    match = and_(*(
+        or_(*(func.lower(column).like(f"%{term}%", escape="\\") for column in SEARCHED_COLUMNS))
+        for term in terms
+    ))
+    return (
+        select(Contact, literal(None).label("rank"), literal(None).label("snippet"))
+        .where(Contact.user_id == user_id, Contact.deleted_at.is_(None), match)
+        .order_by(Contact.last_name, Contact.first_name, Contact.id)
+        .limit(limit)
+    )
+
+
+def search(db: Session, user_id: int, q: str, limit: int, highlight: bool = False) -> list[dict]:
+    """
+    Runs :func:`search_statement` for the session's database.
+
+    :param db: The database session.
+    :type db: Session
+    :param user_id: The owner of the contacts.
+    :type user_id: int
+    :param q: The search query.
+    :type q: str
+    :param limit: Maximum number of results.
+    :type limit: int
+    :param highlight: Add highlighted snippets.
+    :type highlight: bool
+    :return: Matching contacts, best first, each with ``rank`` and ``snippet``.
+    :rtype: list[dict]
+    """
+    stmt = search_statement(db.get_bind().dialect.name, user_id, q, limit, highlight)
+    return [{"contact": contact, "rank": rank, "snippet": snippet} for contact, rank, snippet in db.execute(stmt)]
@@ -1,28 +1,65 @@
 
+import asyncio
+
+from sqlalchemy import bindparam, select, update
 from sqlalchemy.orm import Session
 
+from src.db.db import dialect_insert
 from src.db.models import User
 from src.schemas import UserModel
+from src.services.invalidation import invalidation_bus
+from src.services.tracing import traced
+
+
+# built once; executions reuse SQLAlchemy's cached compilation and only bind new values
+USER_BY_EMAIL = select(User).where(User.email == bindparam("email")).limit(1)
 
 
 async def get_user_by_email(email: str, db: Session) -> User:
-    return db.query(User).filter(User.email == email).first()
+    return db.scalars(USER_BY_EMAIL, {"email": email}).first()
 
 
-async def create_user(body: UserModel, db: Session) -> User:
-    avatar = None
-    new_user = User(**body.dict(), avatar=avatar)
-    db.add(new_user)
+async def create_user(body: UserModel, db: Session, user_id: int | None = None) -> User | None:
+    # one INSERT ... ON CONFLICT DO NOTHING RETURNING: no existence check to race with,
+    # and no refresh after the commit; None when the email is taken. Signup passes the id
+    # allocated by the shard directory
+    values = {"id": user_id} if user_id is not None else {}
+    stmt = dialect_insert(db, User).values(**body.model_dump(), avatar=None, **values) \
+        .on_conflict_do_nothing(index_elements=[User.email]).returning(User)
+    new_user = db.scalars(stmt).first()
+    if new_user is None:
+        return None
+    db.expunge(new_user)
     db.commit()
-    db.refresh(new_user)
     return new_user
 
 
+@traced("repository.update_token")
 async def update_token(user: User, token: str | None, db: Session) -> None:
+    email = user.email
     user.refresh_token = token
     db.commit()
+    await invalidation_bus.invalidate("users", email)
+
+async def confirmed_email(email: str, db: Session) -> bool:
+    # True when this call confirmed the email, False if it was already confirmed or is unknown
+    stmt = update(User).where(User.email == email, User.confirmed.is_not(True)).values(confirmed=True) \
+        .returning(User.id).execution_options(synchronize_session=False)
+    confirmed = db.execute(stmt).first() is not None
+    db.commit()
+    if confirmed:
+        await invalidation_bus.invalidate("users", email)
+    return confirmed
+
+def _set_avatar(email: str, url: str, db: Session) -> User:
+    user = db.scalars(USER_BY_EMAIL, {"email": email}).first()
+    user.avatar = url
+    db.commit()
+    return user
+
 
-async def confirmed_email(email:str, db:Session)-> None:
-    user = await get_user_by_email(email, db)
-    user.confirmed = True
-    db.commit()
\ No newline at end of file
+async def update_avatar(email: str, url: str, db: Session) -> User:
+    # called by the worker, whose event loop runs other jobs meanwhile
+    user = await asyncio.to_thread(_set_avatar, email, url, db)
+    await invalidation_bus.invalidate("users", email)
+    return user
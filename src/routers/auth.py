@@ -1,31 +1,32 @@
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request
+from fastapi import APIRouter, HTTPException, Depends, status, Security, Request
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy.orm import Session
 from fastapi_limiter.depends import RateLimiter
 
 from src.db.db import get_db
+from src.db.sharding import shard_router
 from src.schemas import UserModel, UserResponse, TokenModel, RequestEmail
 from src.repository import users as repository_users
 from src.services.auth import auth_service
-from src.services.email import send_email
+from src.services.compression import skip_compression
+from src.services.deadline import RequestDeadline
+from src.services.queue import job_queue
 
 
-router = APIRouter(prefix='/auth', tags=["auth"])
+router = APIRouter(prefix='/auth', tags=["auth"], dependencies=[Depends(RequestDeadline()), Depends(skip_compression)])
 security = HTTPBearer()
 
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED, description='No more than 10 requests per minute',
             dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+async def signup(body: UserModel, request: Request, db: Session = Depends(get_db)):
     """
-    Registers a new user, hashes their password, and sends a confirmation email.
+    Registers a new user, hashes their password, and queues a confirmation email.
 
     :param body: The user data provided during signup.
     :type body: UserModel
-    :param background_tasks: Background tasks to execute, such as sending email.
-    :type background_tasks: BackgroundTasks
     :param request: The current request, used for building the base URL.
     :type request: Request
     :param db: The database session.
@@ -33,12 +34,13 @@ async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Re
     :return: A dictionary containing the user data and a confirmation message.
     :rtype: dict
     """
-    exist_user = await repository_users.get_user_by_email(body.email, db)
-    if exist_user:
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
     body.password = auth_service.get_password_hash(body.password)
-    new_user = await repository_users.create_user(body, db)
-    background_tasks.add_task(send_email, new_user.email, new_user.username, request.base_url)
+    user_id, shard = await shard_router.assign(body.email, db)
+    shard_router.bind(db, shard)
+    new_user = await repository_users.create_user(body, db, user_id=user_id)
+    if new_user is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
+    await job_queue.enqueue("send_email", email=new_user.email, username=new_user.username, host=str(request.base_url))
     return {"user": new_user, "detail": "User successfully created. Check your email for confirmation."}
 
 
@@ -55,6 +57,7 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
     :return: A dictionary containing access and refresh tokens.
     :rtype: dict
     """
+    await shard_router.route(db, body.username, write=True)
     user = await repository_users.get_user_by_email(body.username, db)
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
@@ -82,25 +85,23 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
     :rtype: dict
     """
     email = await auth_service.get_email_from_token(token)
-    user = await repository_users.get_user_by_email(email, db)
-    if user is None:
+    await shard_router.route(db, email, write=True)
+    if await repository_users.confirmed_email(email, db):
+        return {"message": "Email confirmed"}
+    # only a repeated or invalid confirmation needs to look the user up
+    if await repository_users.get_user_by_email(email, db) is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Verification error")
-    if user.confirmed:
-        return {"message": "Your email is already confirmed"}
-    await repository_users.confirmed_email(email, db)
-    return {"message": "Email confirmed"}
+    return {"message": "Your email is already confirmed"}
 
 @router.post('/request_email', description='No more than 10 requests per minute',
             dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
+async def request_email(body: RequestEmail, request: Request,
                         db: Session = Depends(get_db)):
     """
     Sends a new email confirmation request if the user has not yet confirmed their email.
 
     :param body: The email address for which to request confirmation.
     :type body: RequestEmail
-    :param background_tasks: Background tasks to execute, such as sending email.
-    :type background_tasks: BackgroundTasks
     :param request: The current request, used for building the base URL.
     :type request: Request
     :param db: The database session.
@@ -108,12 +109,13 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
     :return: A message indicating the status of the email confirmation request.
     :rtype: dict
     """
+    await shard_router.route(db, body.email)
     user = await repository_users.get_user_by_email(body.email, db)
 
     if user.confirmed:
         return {"message": "Your email is already confirmed"}
     if user:
-        background_tasks.add_task(send_email, user.email, user.username, request.base_url)
+        await job_queue.enqueue("send_email", email=user.email, username=user.username, host=str(request.base_url))
     return {"message": "Check your email for confirmation."}
 
 @router.get('/refresh_token', response_model=TokenModel, description='No more than 10 requests per minute',
@@ -131,6 +133,7 @@ async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(sec
     """
     token = credentials.credentials
     email = await auth_service.decode_refresh_token(token)
+    await shard_router.route(db, email, write=True)
     user = await repository_users.get_user_by_email(email, db)
     if user.refresh_token != token:
         await repository_users.update_token(user, None, db)
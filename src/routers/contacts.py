@@ -1,4 +1,6 @@
-from fastapi import Depends, HTTPException, status, Query, APIRouter
+from fastapi import Depends, HTTPException, status, Query, APIRouter, Header
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, func, or_
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime, timedelta
@@ -6,13 +8,94 @@ from fastapi_limiter.depends import RateLimiter
 
 from src.db.db import get_db
 from src.db.models import Contact, User
-from src.schemas import ContactCreate, ContactResponse
+from src.schemas import ContactCreate, ContactResponse, ContactStatsResponse, ContactMerge, DuplicateGroup, \
+    ContactImport, JobAccepted, ContactSuggestion, ContactSearchResult
+from src.repository import contact_stats as repository_stats
+from src.repository import contacts as repository_contacts
+from src.repository import search as repository_search
+from src.services.duplicates import find_duplicates
+from src.services.events import event_hub
+from src.services.queue import job_queue
+from src.services.singleflight import SingleFlight
 
 from src.services.auth import auth_service
+from src.services.deadline import RequestDeadline, SEARCH_TIMEOUT, SUGGEST_TIMEOUT
 
 
 
-router =  APIRouter(prefix='/contact', tags=["contact"])
+router =  APIRouter(prefix='/contact', tags=["contact"], dependencies=[Depends(RequestDeadline())])
+# long-lived responses, outside the request deadline
+stream_router = APIRouter(prefix='/contact', tags=["contact"])
+
+contacts_flight = SingleFlight("contacts")
+
+
+def _contact_page(db: Session, user_id: int, skip: int, limit: int) -> List[ContactResponse]:
+    contacts = db.query(Contact).filter(Contact.user_id == user_id, Contact.deleted_at.is_(None)) \
+        .offset(skip).limit(limit).all()
+    return [ContactResponse.model_validate(contact, from_attributes=True) for contact in contacts]
+
+
+def _contact_search(db: Session, user_id: int, first_name: str | None, last_name: str | None,
+                    email: str | None) -> List[ContactResponse]:
+    query = db.query(Contact).filter(Contact.user_id == user_id, Contact.deleted_at.is_(None))
+    if first_name:
+        query = query.filter(Contact.first_name.ilike(f"%{first_name}%"))
+    if last_name:
+        query = query.filter(Contact.last_name.ilike(f"%{last_name}%"))
+    if email:
+        query = query.filter(Contact.email.ilike(f"%{email}%"))
+    return [ContactResponse.model_validate(contact, from_attributes=True) for contact in query.all()]
+
+
+def _contact_fulltext(db: Session, user_id: int, q: str, limit: int, highlight: bool) -> List[ContactSearchResult]:
+    return [
+        ContactSearchResult.model_validate(hit["contact"], from_attributes=True).model_copy(
+            update={"rank": hit["rank"], "snippet": hit["snippet"]}
+        )
+        for hit in repository_search.search(db, user_id, q, limit, highlight)
+    ]
+
+
+def _like_prefix(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _contact_suggest(db: Session, user_id: int, q: str, limit: int) -> List[ContactSuggestion]:
+    # prefix matches on lowercased columns, served by the (user_id, lower(...) text_pattern_ops) indexes
+    terms = q.lower().split()
+    first_name, last_name, email = (func.lower(column) for column in (Contact.first_name, Contact.last_name,
+                                                                      Contact.email))
+    if len(terms) == 1:
+        pattern = _like_prefix(terms[0])
+        match = or_(*(column.like(pattern, escape="\\") for column in (first_name, last_name, email)))
+    else:
+        # "john do" completes either order of first and last name
+        head, tail = _like_prefix(terms[0]), _like_prefix(" ".join(terms[1:]))
+        match = or_(
+            and_(first_name.like(head, escape="\\"), last_name.like(tail, escape="\\")),
+            and_(last_name.like(head, escape="\\"), first_name.like(tail, escape="\\")),
+        )
+    rows = db.query(Contact.id, Contact.first_name, Contact.last_name, Contact.email).filter(
+        Contact.user_id == user_id, Contact.deleted_at.is_(None), match
+    ).order_by(Contact.last_name, Contact.first_name, Contact.id).limit(limit).all()
+    return [ContactSuggestion.model_validate(row, from_attributes=True) for row in rows]
+
+
+def duplicate_contact() -> HTTPException:
+    """
+    The 409 returned when the user already has a contact with the same email or phone number.
+    """
+    return HTTPException(status_code=status.HTTP_409_CONFLICT,
+                         detail="Contact with this email or phone number already exists")
+
+
+def contact_event(contact: Contact) -> dict:
+    """
+    The payload of a contact event: the contact as the API returns it.
+    """
+    return ContactResponse.model_validate(contact, from_attributes=True).model_dump(mode="json")
+
 
 @router.post("/contacts", status_code=201, description='No more than 10 requests per minute',
             dependencies=[Depends(RateLimiter(times=10, seconds=60))])
@@ -29,22 +112,50 @@ async def create_note(contact: ContactCreate, db: Session = Depends(get_db), use
     :return: The newly created contact.
     :rtype: Contact
     """
-    new_contact = Contact(
-        first_name=contact.first_name,
-        last_name=contact.last_name,
-        email=contact.email,
-        phone_number=contact.phone_number,
-        birthday=contact.birthday,
-        additional_info=contact.additional_info,
-        user_id=user.id  # Прив'язка контакту до користувача
-    )
-    db.add(new_contact)
-    db.commit()
-    db.refresh(new_contact)
+    try:
+        new_contact = await repository_contacts.create_contact(contact, user.id, db)
+    except repository_contacts.DuplicateContact:
+        raise duplicate_contact()
+    await event_hub.publish(user.id, "created", contact_event(new_contact))
     return new_contact
 
 
-@router.get("/contacts", description='No more than 10 requests per minute',
+@router.post("/contacts/import", response_model=JobAccepted, status_code=status.HTTP_202_ACCEPTED,
+             description='No more than 2 requests per minute', dependencies=[Depends(RateLimiter(times=2, seconds=60))])
+async def import_contacts(body: ContactImport, user: User = Depends(auth_service.get_current_user)):
+    """
+    Queues a bulk import of contacts. Contacts whose email or phone number the user
+    already has are skipped.
+
+    :param body: The contacts to import.
+    :type body: ContactImport
+    :param user: The current authenticated user.
+    :type user: User
+    :return: The id of the queued job.
+    :rtype: dict
+    """
+    job_id = await job_queue.enqueue("import_contacts", user_id=user.id,
+                                     contacts=[contact.model_dump(mode="json") for contact in body.contacts])
+    return {"job_id": job_id}
+
+
+@router.get("/stats", response_model=ContactStatsResponse, description='No more than 10 requests per minute',
+            dependencies=[Depends(RateLimiter(times=10, seconds=60))])
+async def read_contact_stats(db: Session = Depends(get_db), user: User = Depends(auth_service.get_current_user)):
+    """
+    Returns the current user's contact statistics from the precomputed summary table.
+
+    :param db: The database session.
+    :type db: Session
+    :param user: The current authenticated user.
+    :type user: User
+    :return: Total contacts, birthdays this month and contacts missing a phone or email.
+    :rtype: dict
+    """
+    return await repository_stats.get_stats(user.id, db)
+
+
+@router.get("/contacts", response_model=List[ContactResponse], description='No more than 10 requests per minute',
             dependencies=[Depends(RateLimiter(times=10, seconds=60))])
 async def read_contacts(skip: int = 0, limit: int = Query(default=10, le=100, ge=10), db: Session = Depends(get_db), user: User = Depends(auth_service.get_current_user)):
     """
@@ -61,45 +172,79 @@ async def read_contacts(skip: int = 0, limit: int = Query(default=10, le=100, ge
     :return: A list of contacts.
     :rtype: List[Contact]
     """
-    contacts = db.query(Contact).filter(Contact.user_id == user.id).offset(skip).limit(limit).all()
-    return contacts
+    # identical concurrent page requests (retries, several tabs) share one query
+    return await contacts_flight.do(("page", user.id, skip, limit), _contact_page, db, user.id, skip, limit)
 
 
-@router.get("/contacts/search", response_model=List[ContactResponse], description='No more than 10 requests per minute',
-            dependencies=[Depends(RateLimiter(times=10, seconds=60))])
+@router.get("/contacts/search", response_model=List[ContactSearchResult], description='No more than 10 requests per minute',
+            dependencies=[Depends(RateLimiter(times=10, seconds=60)), Depends(RequestDeadline(SEARCH_TIMEOUT))])
 async def search_contacts(
+    q: Optional[str] = Query(None, max_length=200, description="Full-text search over all fields"),
     first_name: Optional[str] = Query(None, description="Search by first name"),
     last_name: Optional[str] = Query(None, description="Search by last name"),
     email: Optional[str] = Query(None, description="Search by email"),
+    limit: int = Query(default=50, ge=1, le=100, description="Maximum results of a full-text search"),
+    highlight: bool = Query(False, description="Add snippets with the matched words in <b> tags"),
     db: Session = Depends(get_db), user: User = Depends(auth_service.get_current_user)
 ):
     """
-    Searches for contacts based on first name, last name, or email.
+    Searches for contacts. With ``q``, runs a ranked full-text search over names, email,
+    phone number and additional info; otherwise filters by first name, last name or email
+    substrings.
 
+    :param q: Full-text query, supports quoted phrases, ``or`` and ``-word``.
+    :type q: str, optional
     :param first_name: Filter contacts by first name.
     :type first_name: str, optional
     :param last_name: Filter contacts by last name.
     :type last_name: str, optional
     :param email: Filter contacts by email.
     :type email: str, optional
+    :param limit: Maximum number of full-text results (between 1 and 100).
+    :type limit: int
+    :param highlight: Return highlighted snippets with full-text results.
+    :type highlight: bool
     :param db: The database session.
     :type db: Session
     :param user: The current authenticated user.
     :type user: User
-    :return: A list of contacts matching the search criteria.
-    :rtype: List[Contact]
+    :return: A list of contacts matching the search criteria, best match first for ``q``.
+    :rtype: List[ContactSearchResult]
     """
-    query = db.query(Contact).filter(Contact.user_id == user.id)
-    
-    if first_name:
-        query = query.filter(Contact.first_name.ilike(f"%{first_name}%"))
-    if last_name:
-        query = query.filter(Contact.last_name.ilike(f"%{last_name}%"))
-    if email:
-        query = query.filter(Contact.email.ilike(f"%{email}%"))
-    
-    contacts = query.all()
-    return contacts
+    if q is not None and q.strip():
+        key = ("fulltext", user.id, q, limit, highlight)
+        return await contacts_flight.do(key, _contact_fulltext, db, user.id, q, limit, highlight)
+    key = ("search", user.id, first_name, last_name, email)
+    return await contacts_flight.do(key, _contact_search, db, user.id, first_name, last_name, email)
+
+
+@router.get("/contacts/suggest", response_model=List[ContactSuggestion],
+            description='No more than 20 requests per second',
+            dependencies=[Depends(RateLimiter(times=20, seconds=1)), Depends(RequestDeadline(SUGGEST_TIMEOUT))])
+async def suggest_contacts(
+    q: str = Query(min_length=1, max_length=100, description="What the user has typed so far"),
+    limit: int = Query(default=8, ge=1, le=20),
+    db: Session = Depends(get_db), user: User = Depends(auth_service.get_current_user)
+):
+    """
+    Type-ahead lookup: the first contacts whose first name, last name or email starts
+    with ``q``, or whose first and last name start with the two words of ``q``.
+
+    :param q: The typed prefix.
+    :type q: str
+    :param limit: Maximum number of suggestions (between 1 and 20).
+    :type limit: int
+    :param db: The database session.
+    :type db: Session
+    :param user: The current authenticated user.
+    :type user: User
+    :return: Matching contacts, ordered by name, with only the fields needed to display them.
+    :rtype: List[ContactSuggestion]
+    """
+    if not q.strip():
+        return []
+    return await contacts_flight.do(("suggest", user.id, q, limit), _contact_suggest, db, user.id, q, limit)
+
 
 @router.get("/contacts/upcoming-birthdays", response_model=List[ContactResponse], description='No more than 10 requests per minute',
             dependencies=[Depends(RateLimiter(times=10, seconds=60))])
@@ -119,6 +264,7 @@ async def get_upcoming_birthdays(db: Session = Depends(get_db), user: User = Dep
 
     contacts = db.query(Contact).filter(
         Contact.user_id == user.id,
+        Contact.deleted_at.is_(None),
         Contact.birthday.between(today, next_week)
     ).all()
 
@@ -127,6 +273,26 @@ async def get_upcoming_birthdays(db: Session = Depends(get_db), user: User = Dep
     return contacts
 
 
+@router.get("/contacts/duplicates", response_model=List[DuplicateGroup], description='No more than 10 requests per minute',
+            dependencies=[Depends(RateLimiter(times=10, seconds=60))])
+async def get_duplicate_contacts(db: Session = Depends(get_db), user: User = Depends(auth_service.get_current_user)):
+    """
+    Finds groups of contacts that are probably the same person: similar sounding names,
+    the same phone number written differently, or the same email address.
+
+    :param db: The database session.
+    :type db: Session
+    :param user: The current authenticated user.
+    :type user: User
+    :return: Groups of candidate duplicate contact ids with the reasons that linked them.
+    :rtype: List[DuplicateGroup]
+    """
+    contacts = db.query(
+        Contact.id, Contact.first_name, Contact.last_name, Contact.email, Contact.phone_number
+    ).filter(Contact.user_id == user.id, Contact.deleted_at.is_(None)).yield_per(1000)
+    return find_duplicates(contacts)
+
+
 @router.get("/contacts/{contact_id}", description='No more than 10 requests per minute',
             dependencies=[Depends(RateLimiter(times=10, seconds=60))])
 async def read_contact(contact_id: int, db: Session = Depends(get_db), user: User = Depends(auth_service.get_current_user)):
@@ -142,7 +308,7 @@ async def read_contact(contact_id: int, db: Session = Depends(get_db), user: Use
     :return: The requested contact.
     :rtype: Contact
     """
-    contact = db.query(Contact).filter(Contact.id == contact_id, Contact.user_id == user.id).first()
+    contact = await repository_contacts.get_contact(contact_id, user.id, db)
     if contact is None:
         raise HTTPException(status_code=404, detail="Contact not found or does not belong to you")
     return contact
@@ -165,13 +331,13 @@ async def update_contact(contact_id: int, contact: ContactCreate, db: Session =
     :return: The updated contact.
     :rtype: Contact
     """
-    db_contact = db.query(Contact).filter(Contact.id == contact_id, Contact.user_id == user.id).first()
+    try:
+        db_contact = await repository_contacts.update_contact(contact_id, contact, user.id, db)
+    except repository_contacts.DuplicateContact:
+        raise duplicate_contact()
     if db_contact is None:
         raise HTTPException(status_code=404, detail="Contact not found or does not belong to you")
-    for key, value in contact.dict().items():
-        setattr(db_contact, key, value)
-    db.commit()
-    db.refresh(db_contact)
+    await event_hub.publish(user.id, "updated", contact_event(db_contact))
     return db_contact
 
 
@@ -190,9 +356,92 @@ async def delete_contact(contact_id: int, db: Session = Depends(get_db), user: U
     :return: None
     :rtype: None
     """
-    db_contact = db.query(Contact).filter(Contact.id == contact_id, Contact.user_id == user.id).first()
-    if db_contact is None:
+    if not await repository_contacts.delete_contact(contact_id, user.id, db):
         raise HTTPException(status_code=404, detail="Contact not found or does not belong to you")
-    db.delete(db_contact)
-    db.commit()
+    await event_hub.publish(user.id, "deleted", {"id": contact_id})
     return None
+
+
+@router.post("/contacts/{contact_id}/restore", response_model=ContactResponse, description='No more than 10 requests per minute',
+            dependencies=[Depends(RateLimiter(times=10, seconds=60))])
+async def restore_contact(contact_id: int, db: Session = Depends(get_db), user: User = Depends(auth_service.get_current_user)):
+    """
+    Restores a deleted contact of the current user that has not been purged yet.
+
+    :param contact_id: The ID of the deleted contact.
+    :type contact_id: int
+    :param db: The database session.
+    :type db: Session
+    :param user: The current authenticated user.
+    :type user: User
+    :return: The restored contact.
+    :rtype: Contact
+    """
+    try:
+        contact = await repository_contacts.restore_contact(contact_id, user.id, db)
+    except repository_contacts.DuplicateContact:
+        raise duplicate_contact()
+    if contact is None:
+        raise HTTPException(status_code=404, detail="Deleted contact not found or does not belong to you")
+    await event_hub.publish(user.id, "restored", contact_event(contact))
+    return contact
+
+
+@router.post("/contacts/{contact_id}/merge", response_model=ContactResponse, description='No more than 10 requests per minute',
+            dependencies=[Depends(RateLimiter(times=10, seconds=60))])
+async def merge_contacts(contact_id: int, body: ContactMerge, db: Session = Depends(get_db), user: User = Depends(auth_service.get_current_user)):
+    """
+    Merges duplicate contacts into one. The primary contact keeps its values, empty
+    fields are filled from the duplicates, and the duplicates are deleted (restorable
+    until they are purged).
+
+    :param contact_id: The ID of the contact to keep.
+    :type contact_id: int
+    :param body: The IDs of the contacts to merge into it.
+    :type body: ContactMerge
+    :param db: The database session.
+    :type db: Session
+    :param user: The current authenticated user.
+    :type user: User
+    :return: The merged contact.
+    :rtype: Contact
+    """
+    try:
+        merged = await repository_contacts.merge_contacts(contact_id, set(body.duplicate_ids), user.id, db)
+    except repository_contacts.DuplicateContact:
+        raise duplicate_contact()
+    if merged is None:
+        raise HTTPException(status_code=404, detail="Contact not found or does not belong to you")
+    primary, deleted_ids = merged
+    for deleted_id in deleted_ids:
+        await event_hub.publish(user.id, "deleted", {"id": deleted_id})
+    await event_hub.publish(user.id, "updated", contact_event(primary))
+    return primary
+
+
+@stream_router.get("/stream", response_class=StreamingResponse, description='No more than 10 requests per minute',
+            dependencies=[Depends(RateLimiter(times=10, seconds=60))])
+async def stream_changes(db: Session = Depends(get_db), user: User = Depends(auth_service.get_current_user),
+                         last_event_id: Optional[str] = Header(None),
+                         since: Optional[str] = Query(None, description="Event id to resume after, "
+                                                                        "for clients that cannot send Last-Event-ID")):
+    """
+    Streams the current user's contact changes as Server-Sent Events: ``created``,
+    ``updated``, ``deleted``, ``restored`` and ``imported``, each with an ``id`` to resume
+    after. A ``reset`` event means changes were missed and the contacts should be reloaded.
+
+    :param db: The database session, released before streaming.
+    :type db: Session
+    :param user: The current authenticated user.
+    :type user: User
+    :param last_event_id: The ``Last-Event-ID`` header a reconnecting ``EventSource`` sends.
+    :type last_event_id: str, optional
+    :param since: The same as a query parameter.
+    :type since: str, optional
+    :return: The event stream.
+    :rtype: StreamingResponse
+    """
+    # an idle stream must not hold a pooled connection
+    db.close()
+    return StreamingResponse(event_hub.stream(user.id, last_event_id or since), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
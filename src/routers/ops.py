@@ -0,0 +1,168 @@
+import hmac
+import os
+
+from dotenv import load_dotenv
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from src.services import memory
+from src.services.auth import get_current_admin
+from src.services.lifecycle import lifecycle
+from src.services.memory import memory_profiler
+from src.services.metrics import registry
+
+load_dotenv()
+
+# static bearer token Prometheus scrapes /ops/metrics with; unset, the endpoint does not exist
+# and metrics are only served on the internal ports (serve.py --metrics-port)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+router = APIRouter(prefix="/ops", tags=["ops"])
+
+
+async def metrics_scraper(authorization: str | None = Header(None)):
+    # read at request time, like the memory diagnostics switch
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest((authorization or "").encode(), f"Bearer {METRICS_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Invalid scrape token", headers={"WWW-Authenticate": "Bearer"})
+
+
+async def memory_diagnostics():
+    # read at request time, the endpoints do not exist unless diagnostics are enabled
+    if not memory.MEMORY_DIAGNOSTICS:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+memory_router = APIRouter(prefix="/memory", dependencies=[Depends(memory_diagnostics), Depends(get_current_admin)])
+KEY_TYPE = Query("lineno", pattern="^(lineno|filename|traceback)$")
+
+
+@router.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(metrics_scraper)])
+async def metrics():
+    """
+    Exposes this worker's metrics in the Prometheus text format to scrapers presenting
+    ``METRICS_TOKEN`` as a bearer token.
+
+    The metrics are per process: with several workers a scrape reaches whichever worker
+    accepts the connection, so counters would jump between processes. Scrape each
+    worker on its own internal port (``serve.py --metrics-port``) instead; this endpoint
+    suits a single-process server.
+
+    :return: The rendered metrics.
+    :rtype: str
+    """
+    return registry.render()
+
+
+@router.get("/live")
+async def live():
+    """
+    Liveness probe: answers as long as the event loop is serving requests.
+
+    :return: The lifecycle state.
+    :rtype: dict
+    """
+    return {"status": lifecycle.state}
+
+
+@router.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 once startup warm-up has finished, 503 while starting and
+    from the moment shutdown begins draining in-flight requests.
+
+    :return: The lifecycle state and the number of requests in flight.
+    :rtype: JSONResponse
+    """
+    return JSONResponse(status_code=200 if lifecycle.ready else 503,
+                        content={"status": lifecycle.state, "in_flight": lifecycle.in_flight})
+
+
+@memory_router.get("")
+async def memory_summary():
+    """
+    Reports this worker's RSS, traced memory, object count and the kept snapshots.
+
+    :return: The summary.
+    :rtype: dict
+    """
+    return memory_profiler.summary()
+
+
+@memory_router.post("/snapshots", status_code=201)
+async def take_memory_snapshot():
+    """
+    Records a ``tracemalloc`` snapshot of this worker.
+
+    :return: The snapshot id, when it was taken and the traced bytes.
+    :rtype: dict
+    """
+    return memory_profiler.take_snapshot()
+
+
+@memory_router.get("/snapshots/{snapshot_id}")
+async def memory_snapshot_top(snapshot_id: int, limit: int = Query(20, ge=1, le=200), key_type: str = KEY_TYPE):
+    """
+    Lists the largest allocation sites of a snapshot.
+
+    :param snapshot_id: The snapshot.
+    :type snapshot_id: int
+    :param limit: Number of sites.
+    :type limit: int
+    :param key_type: Group by ``lineno``, ``filename`` or ``traceback``.
+    :type key_type: str
+    :return: Location, bytes and blocks per site.
+    :rtype: list[dict]
+    """
+    try:
+        return memory_profiler.top(snapshot_id, limit, key_type)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+
+
+@memory_router.get("/diff")
+async def memory_diff(base: int, current: int, limit: int = Query(20, ge=1, le=200), key_type: str = KEY_TYPE):
+    """
+    Lists the allocation sites that grew the most between two snapshots.
+
+    :param base: The earlier snapshot.
+    :type base: int
+    :param current: The later snapshot.
+    :type current: int
+    :param limit: Number of sites.
+    :type limit: int
+    :param key_type: Group by ``lineno``, ``filename`` or ``traceback``.
+    :type key_type: str
+    :return: Location, bytes, blocks and their growth per site.
+    :rtype: list[dict]
+    """
+    try:
+        return memory_profiler.diff(base, current, limit, key_type)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+
+
+@memory_router.get("/orm")
+async def memory_orm_objects():
+    """
+    Counts live sessions, those inside a transaction, and identity-map objects per class.
+
+    :return: The counts.
+    :rtype: dict
+    """
+    return memory.orm_objects()
+
+
+@memory_router.get("/requests")
+async def memory_requests():
+    """
+    Lists the memory sampled requests left allocated, per route.
+
+    :return: Route, samples, mean and largest bytes.
+    :rtype: list[dict]
+    """
+    return memory_profiler.request_report()
+
+
+router.include_router(memory_router)
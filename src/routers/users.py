@@ -1,19 +1,21 @@
-from fastapi import APIRouter, Depends, status, UploadFile, File
-from sqlalchemy.orm import Session
-import cloudinary
-import cloudinary.uploader
+import base64
 import os
+
 from dotenv import load_dotenv
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
 
-from src.db.db import get_db
 from src.db.models import User
-from src.repository import users as repository_users
 from src.services.auth import auth_service
-from src.schemas import UserDb
+from src.services.deadline import RequestDeadline
+from src.services.queue import job_queue
+from src.schemas import UserDb, JobAccepted
 
 load_dotenv()
 
-router = APIRouter(prefix="/users", tags=["users"])
+# largest avatar accepted; the image travels base64 encoded in the job payload
+AVATAR_MAX_BYTES = int(os.getenv('AVATAR_MAX_BYTES', '1048576'))
+
+router = APIRouter(prefix="/users", tags=["users"], dependencies=[Depends(RequestDeadline())])
 
 
 @router.get("/me/", response_model=UserDb)
@@ -29,30 +31,24 @@ async def read_users_me(current_user: User = Depends(auth_service.get_current_us
     return current_user
 
 
-@router.patch('/avatar', response_model=UserDb)
-async def update_avatar_user(file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user),
-                             db: Session = Depends(get_db)):
+@router.patch('/avatar', response_model=JobAccepted, status_code=status.HTTP_202_ACCEPTED)
+async def update_avatar_user(file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user)):
     """
-    Updates the user's avatar by uploading a new image to Cloudinary and updating the user record.
+    Queues the upload of a new avatar. A worker resizes it on Cloudinary and updates the user record.
 
     :param file: The new avatar image file.
     :type file: UploadFile
     :param current_user: The current authenticated user.
     :type current_user: User
-    :param db: The database session.
-    :type db: Session
-    :return: The updated user with the new avatar URL.
-    :rtype: UserDb
+    :return: The id of the queued job.
+    :rtype: dict
+    :raises HTTPException: 413 if the image is larger than ``AVATAR_MAX_BYTES``.
     """
-    cloudinary.config(
-        cloud_name=os.getenv('CLOUDINARY_NAME'),
-        api_key=os.getenv('CLOUDINARY_API_KEY'),
-        api_secret=os.getenv('CLOUDINARY_API_SECRET'),
-        secure=True
-    )
-
-    r = cloudinary.uploader.upload(file.file, public_id=f'NotesApp/{current_user.username}', overwrite=True)
-    src_url = cloudinary.CloudinaryImage(f'NotesApp/{current_user.username}')\
-                        .build_url(width=250, height=250, crop='fill', version=r.get('version'))
-    user = await repository_users.update_avatar(current_user.email, src_url, db)
-    return user
\ No newline at end of file
+    data = await file.read(AVATAR_MAX_BYTES + 1)
+    if len(data) > AVATAR_MAX_BYTES:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"Avatar larger than {AVATAR_MAX_BYTES} bytes")
+    image = base64.b64encode(data).decode()
+    job_id = await job_queue.enqueue("process_avatar", email=current_user.email, username=current_user.username,
+                                     image=image)
+    return {"job_id": job_id}
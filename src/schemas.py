@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import date, datetime
 
 
@@ -19,6 +19,42 @@ class ContactResponse(ContactCreate):
         orm_mode = True
 
 
+class ContactSearchResult(ContactResponse):
+    rank: Optional[float] = None
+    snippet: Optional[str] = None
+
+
+class ContactSuggestion(BaseModel):
+    id: int
+    first_name: str
+    last_name: str
+    email: Optional[str] = None
+
+
+class ContactMerge(BaseModel):
+    duplicate_ids: List[int] = Field(min_length=1)
+
+
+class ContactImport(BaseModel):
+    contacts: List[ContactCreate] = Field(min_length=1, max_length=10000)
+
+
+class JobAccepted(BaseModel):
+    job_id: str
+
+
+class DuplicateGroup(BaseModel):
+    contact_ids: List[int]
+    reasons: List[str]
+
+
+class ContactStatsResponse(BaseModel):
+    total: int
+    birthdays_this_month: int
+    missing_phone: int
+    missing_email: int
+
+
 class UserModel(BaseModel):
     username: str = Field(min_length=5, max_length=16)
     email: str
@@ -0,0 +1,248 @@
+import asyncio
+import json
+import math
+import os
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+from src.services.metrics import registry
+
+load_dotenv()
+
+
+def _parse_limits(value: str) -> dict[str, int]:
+    return {name.strip(): int(limit) for name, _, limit in (part.partition("=") for part in value.split(",")) if name}
+
+
+# concurrent in-flight requests per route class
+ADMISSION_LIMITS = _parse_limits(os.getenv('ADMISSION_LIMITS', 'auth=8,read=64,write=32'))
+# CoDel: acceptable standing queue delay, and the window it may be exceeded for before shedding starts
+ADMISSION_TARGET = float(os.getenv('ADMISSION_TARGET_MS', '50')) / 1000
+ADMISSION_INTERVAL = float(os.getenv('ADMISSION_INTERVAL_MS', '500')) / 1000
+# longest a request may wait for a slot, and the longest queue per route class
+ADMISSION_MAX_WAIT = float(os.getenv('ADMISSION_MAX_WAIT_MS', '1000')) / 1000
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', '256'))
+
+in_flight = registry.gauge("admission_in_flight", "Requests currently being handled, by route class")
+queued = registry.gauge("admission_queued", "Requests waiting for a slot, by route class")
+shed_total = registry.counter("admission_shed_total", "Requests rejected with 503, by route class and reason")
+queue_wait = registry.histogram("admission_queue_wait_seconds", "Time requests spent waiting for a slot",
+                                buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request is shed instead of admitted.
+    """
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CoDel:
+    """
+    Controlled Delay (RFC 8289) decision for one queue.
+
+    The queue is healthy while requests wait less than ``target``. Once every request
+    has waited longer than ``target`` for a whole ``interval`` there is a standing
+    queue, and requests are dropped at dequeue time at an increasing rate
+    (``interval / sqrt(count)``) until the wait falls below ``target`` again.
+    """
+
+    def __init__(self, target: float = ADMISSION_TARGET, interval: float = ADMISSION_INTERVAL):
+        self.target = target
+        self.interval = interval
+        self.first_above_time = 0.0
+        self.dropping = False
+        self.drop_next = 0.0
+        self.count = 0
+
+    def _control_law(self, t: float) -> float:
+        return t + self.interval / math.sqrt(self.count)
+
+    def _ok_to_drop(self, sojourn: float, now: float) -> bool:
+        if sojourn < self.target:
+            self.first_above_time = 0.0
+            return False
+        if self.first_above_time == 0.0:
+            self.first_above_time = now + self.interval
+            return False
+        return now >= self.first_above_time
+
+    def should_drop(self, sojourn: float, now: float) -> bool:
+        """
+        Decides the fate of a request leaving the queue.
+
+        :param sojourn: How long the request waited, in seconds.
+        :type sojourn: float
+        :param now: Current monotonic time.
+        :type now: float
+        :return: True if the request should be shed.
+        :rtype: bool
+        """
+        ok_to_drop = self._ok_to_drop(sojourn, now)
+        if self.dropping:
+            if not ok_to_drop:
+                self.dropping = False
+                return False
+            if now >= self.drop_next:
+                self.count += 1
+                self.drop_next = self._control_law(self.drop_next)
+                return True
+            return False
+        if ok_to_drop:
+            self.dropping = True
+            # resume close to the previous drop rate if we were dropping recently
+            recently = now - self.drop_next < 16 * self.interval
+            self.count = max(1, self.count - 2) if recently and self.count > 2 else 1
+            self.drop_next = self._control_law(now)
+            return True
+        return False
+
+
+class AdmissionQueue:
+    """
+    Caps the concurrent requests of one route class; excess requests wait in FIFO order
+    until a slot frees up, their deadline passes, or CoDel sheds them.
+    """
+
+    def __init__(self, name: str, limit: int, max_wait: float = ADMISSION_MAX_WAIT,
+                 max_queue: int = ADMISSION_MAX_QUEUE, codel: CoDel | None = None):
+        self.name = name
+        self.limit = limit
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.codel = codel or CoDel()
+        self.active = 0
+        self._waiters: deque[tuple[float, asyncio.Future]] = deque()
+
+    async def acquire(self) -> None:
+        """
+        Waits for a slot.
+
+        :raises Overloaded: If the request is shed.
+        """
+        if self.active < self.limit and not self._waiters:
+            self._admit(0.0)
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise Overloaded("queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (time.monotonic(), future)
+        self._waiters.append(entry)
+        queued.inc(route_class=self.name)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+        except asyncio.TimeoutError:
+            if future.done() and not future.exception():
+                # a slot was handed over just as the deadline passed
+                return
+            self._discard(entry)
+            raise Overloaded("timeout")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and not future.exception():
+                self.release()
+            else:
+                self._discard(entry)
+            raise
+
+    def _discard(self, entry):
+        try:
+            self._waiters.remove(entry)
+            queued.dec(route_class=self.name)
+        except ValueError:
+            pass
+
+    def _admit(self, waited: float) -> None:
+        self.active += 1
+        in_flight.inc(route_class=self.name)
+        queue_wait.observe(waited, route_class=self.name)
+
+    def release(self) -> None:
+        """
+        Frees a slot and hands it to the oldest waiter that CoDel does not shed.
+        """
+        self.active -= 1
+        in_flight.dec(route_class=self.name)
+        while self._waiters and self.active < self.limit:
+            enqueued, future = self._waiters.popleft()
+            queued.dec(route_class=self.name)
+            if future.done():
+                continue
+            now = time.monotonic()
+            sojourn = now - enqueued
+            if self.codel.should_drop(sojourn, now):
+                future.set_exception(Overloaded("codel"))
+                continue
+            self._admit(sojourn)
+            future.set_result(None)
+
+
+def classify(scope: dict) -> str | None:
+    """
+    Maps a request to its route class.
+
+    :param scope: The ASGI scope.
+    :type scope: dict
+    :return: "auth", "read" or "write", or None for requests that are never queued.
+    :rtype: str | None
+    """
+    path = scope.get("path", "")
+    # event streams stay open while idle, they would hold a slot for their whole life
+    if path.startswith("/ops") or path == "/contact/stream":
+        return None
+    if path.startswith("/auth"):
+        return "auth"
+    if scope.get("method") in ("GET", "HEAD", "OPTIONS"):
+        return "read"
+    return "write"
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware that bounds in-flight requests per route class and sheds load with
+    ``503 Service Unavailable`` and ``Retry-After`` once queueing delay exceeds its target,
+    so that under overload the requests that are admitted still finish in time.
+    """
+
+    def __init__(self, app, limits: dict[str, int] | None = None, retry_after: int = 1, **queue_options):
+        self.app = app
+        self.retry_after = retry_after
+        self.queues = {
+            name: AdmissionQueue(name, limit, **queue_options)
+            for name, limit in (limits or ADMISSION_LIMITS).items()
+        }
+
+    async def __call__(self, scope, receive, send):
+        route_class = classify(scope) if scope["type"] == "http" else None
+        queue = self.queues.get(route_class)
+        if queue is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await queue.acquire()
+        except Overloaded as err:
+            shed_total.inc(route_class=route_class, reason=err.reason)
+            await self._reject(send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            queue.release()
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": "Server is overloaded, retry later"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(self.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -2,14 +2,20 @@ import os
 from typing import Optional
 
 from jose import JWTError, jwt
-from fastapi import HTTPException, status, Depends
+from fastapi import HTTPException, status, Depends, Request
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
+from sqlalchemy import inspect
 from sqlalchemy.orm import Session
 
 from src.db.db import get_db
+from src.db.models import User
+from src.db.sharding import SAFE_METHODS, shard_router
 from src.repository import users as repository_users
+from src.services.invalidation import CACHE_USERS_SIZE, LocalCache, invalidation_bus
+from src.services.singleflight import SingleFlight
+from src.services.tracing import span, traced
 
 
 class Auth:
@@ -21,7 +27,10 @@ class Auth:
     SECRET_KEY = os.getenv('SECRET_KEY')
     ALGORITHM = os.getenv('JWT_ALGORITHM')
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+    user_flight = SingleFlight("users")
+    users_cache = LocalCache("users", CACHE_USERS_SIZE)
 
+    @traced("bcrypt.verify")
     def verify_password(self, plain_password, hashed_password):
         """
         Verifies a plain-text password against a hashed password.
@@ -35,6 +44,7 @@ class Auth:
         """
         return self.pwd_context.verify(plain_password, hashed_password)
 
+    @traced("bcrypt.hash")
     def get_password_hash(self, password: str):
         """
         Hashes a plain-text password using bcrypt.
@@ -47,6 +57,7 @@ class Auth:
         return self.pwd_context.hash(password)
 
     # define a function to generate a new access token
+    @traced("jwt.sign")
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
         """
         Creates a new JWT access token with an expiration time.
@@ -70,6 +81,7 @@ class Auth:
         return encoded_access_token
 
     # define a function to generate a new refresh token
+    @traced("jwt.sign")
     async def create_refresh_token(self, data: dict, expires_delta: Optional[float] = None):
         """
         Creates a new JWT refresh token with an expiration time.
@@ -111,10 +123,14 @@ class Auth:
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    async def get_current_user(self, request: Request, token: str = Depends(oauth2_scheme),
+                               db: Session = Depends(get_db)):
         """
-        Retrieves the current authenticated user based on the provided JWT token.
+        Retrieves the current authenticated user based on the provided JWT token, and
+        points the session at the user's shard.
 
+        :param request: The current request; writes are refused while the user is moved.
+        :type request: Request
         :param token: The JWT token provided by the OAuth2 scheme.
         :type token: str
         :param db: The database session.
@@ -122,6 +138,7 @@ class Auth:
         :return: The current authenticated user.
         :rtype: User
         :raises HTTPException: If the token is invalid or the user does not exist.
+        :raises ShardFenced: If the request writes and the user is being moved.
         """
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -131,7 +148,8 @@ class Auth:
 
         try:
             # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            with span("jwt.verify"):
+                payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
             if payload['scope'] == 'access_token':
                 email = payload["sub"]
                 if email is None:
@@ -141,11 +159,43 @@ class Auth:
         except JWTError as e:
             raise credentials_exception
 
-        user = await repository_users.get_user_by_email(email, db)
+        write = request.method not in SAFE_METHODS
+        shard = await shard_router.route(db, email, write=write)
+        user = self.users_cache.get(email)
+        if user is not None:
+            return self._copy_user(user)
+        token = self.users_cache.token(email)
+        # concurrent requests of the same user share one lookup
+        user = await self.user_flight.do(email, self._load_user, email, db)
+        if user is None and shard_router.sharded:
+            # the cached placement is stale when the user was moved to another shard
+            if await shard_router.route(db, email, write=write, refresh=True) != shard:
+                user = self._load_user(email, db)
         if user is None:
             raise credentials_exception
+        self.users_cache.set(email, user, token)
+        return self._copy_user(user)
+
+    @staticmethod
+    def _load_user(email: str, db: Session) -> User | None:
+        """
+        Loads a user detached from the session, so the instance can be shared by
+        concurrent requests and is not expired by the leader's commits.
+        """
+        user = db.scalars(repository_users.USER_BY_EMAIL, {"email": email}).first()
+        if user is not None:
+            db.expunge(user)
         return user
 
+    @staticmethod
+    def _copy_user(user: User) -> User:
+        """
+        Returns a private copy of a shared user, so a request that changes its user does
+        not change the user of the requests it shares the lookup or the cache with.
+        """
+        return User(**{column.key: getattr(user, column.key) for column in inspect(User).column_attrs})
+
+    @traced("jwt.sign")
     def create_email_token(self, data: dict):
         """
         Creates a token for email verification with a 7-day expiration.
@@ -181,4 +231,24 @@ class Auth:
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                                 detail="Invalid token for email verification")
 
-auth_service = Auth()
\ No newline at end of file
+auth_service = Auth()
+invalidation_bus.register("users", auth_service.users_cache)
+
+
+# users allowed on the operator endpoints under /ops/memory, comma separated emails
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv('ADMIN_EMAILS', '').split(',') if email.strip()}
+
+
+async def get_current_admin(user: User = Depends(auth_service.get_current_user)) -> User:
+    """
+    Returns the current user if their email is listed in ``ADMIN_EMAILS``.
+
+    :param user: The current authenticated user.
+    :type user: User
+    :return: The current user.
+    :rtype: User
+    :raises HTTPException: 403 if the user is not an administrator.
+    """
+    if user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Administrator access required")
+    return user
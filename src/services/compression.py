@@ -0,0 +1,282 @@
+import gzip
+import hashlib
+import os
+import zlib
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+from fastapi import Request
+
+from src.services.metrics import registry
+
+try:
+    import brotli
+except ImportError:  # optional, br is not offered without it
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional, zstd is not offered without it
+    zstandard = None
+
+load_dotenv()
+
+# bodies smaller than this go out as they are, the headers and CPU cost more than they save
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+# levels tuned for per-request compression (see benchmarks/compression.py); on a 100-contact
+# page gzip 4 gets within 5% of the size of gzip 6 for about 60% of the CPU
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '4'))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4'))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv('COMPRESSION_ZSTD_LEVEL', '3'))
+# memory for compressed bodies of repeated responses, per process
+COMPRESSION_CACHE_BYTES = int(os.getenv('COMPRESSION_CACHE_BYTES', str(16 * 1024 * 1024)))
+
+# media types worth compressing; images are already compressed and event streams must not be buffered
+COMPRESSIBLE_TYPES = (b"application/json", b"text/html", b"text/plain", b"text/csv", b"text/css",
+                      b"application/javascript", b"application/xml", b"image/svg+xml")
+
+compressed_bytes_total = registry.counter(
+    "compression_bytes_total", "Response body bytes before (in) and after (out) compression, by encoding"
+)
+compression_cache_total = registry.counter(
+    "compression_cache_total", "Compressed body lookups in the cache, by result (hit or miss)"
+)
+
+
+def _gzip(body: bytes, level: int) -> bytes:
+    # mtime=0 keeps the output identical for identical bodies
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def _gzip_stream(level: int):
+    return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def available_encodings() -> dict:
+    """
+    Returns the encodings this process can produce, in server preference order.
+
+    :return: Encoding name to a ``(compress(body), stream())`` pair, where ``stream()``
+        returns an object with ``compress(chunk)`` and ``flush()``.
+    :rtype: dict
+    """
+    encodings = {}
+    if zstandard is not None:
+        encodings["zstd"] = (
+            lambda body: zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compress(body),
+            lambda: zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compressobj(),
+        )
+    if brotli is not None:
+        encodings["br"] = (
+            lambda body: brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY),
+            lambda: _BrotliStream(brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)),
+        )
+    encodings["gzip"] = (
+        lambda body: _gzip(body, COMPRESSION_GZIP_LEVEL),
+        lambda: _gzip_stream(COMPRESSION_GZIP_LEVEL),
+    )
+    return encodings
+
+
+class _BrotliStream:
+    def __init__(self, compressor):
+        self.compressor = compressor
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self.compressor.process(chunk)
+
+    def flush(self) -> bytes:
+        return self.compressor.finish()
+
+
+def negotiate(accept_encoding: str, encodings) -> str | None:
+    """
+    Picks the response encoding from an ``Accept-Encoding`` header.
+
+    The highest ``q`` wins; ties go to the earlier entry of ``encodings``. ``*`` covers
+    every encoding not named explicitly and ``q=0`` refuses one.
+
+    :param accept_encoding: The request header value.
+    :type accept_encoding: str
+    :param encodings: Encodings the server can produce, in preference order.
+    :return: The chosen encoding, None for identity.
+    :rtype: str, optional
+    """
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name] = weight
+    best, best_weight = None, 0.0
+    for name in encodings:
+        weight = weights.get(name, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = name, weight
+    return best
+
+
+class CompressedBodyCache:
+    """
+    LRU of compressed response bodies keyed by encoding and a digest of the plain body.
+
+    Hot payloads, such as the first page of a large contact list polled by several
+    clients or an idempotent replay, are compressed once. Hashing the body is an order
+    of magnitude cheaper than compressing it.
+
+    :param max_bytes: Upper bound on the compressed bytes kept.
+    :type max_bytes: int
+    """
+
+    def __init__(self, max_bytes: int = COMPRESSION_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def get_or_compress(self, encoding: str, body: bytes, compress) -> bytes:
+        if self.max_bytes <= 0:
+            return compress(body)
+        key = (encoding, hashlib.sha256(body).digest())
+        compressed = self.entries.get(key)
+        if compressed is not None:
+            self.entries.move_to_end(key)
+            compression_cache_total.inc(result="hit")
+            return compressed
+        compression_cache_total.inc(result="miss")
+        compressed = compress(body)
+        if len(compressed) <= self.max_bytes // 8:
+            self.entries[key] = compressed
+            self.size += len(compressed)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+        return compressed
+
+
+async def skip_compression(request: Request):
+    """
+    Route dependency that sends the route's responses uncompressed.
+
+    Used for responses that carry secrets (tokens) next to data the client controls,
+    where compression would leak the secret through the response size (BREACH).
+    """
+    request.state.compress = False
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware that compresses responses with the best encoding the client accepts.
+
+    ``zstd`` and ``br`` are offered when the ``zstandard`` and ``brotli`` packages are
+    installed, ``gzip`` always. Bodies below ``min_size``, media types outside
+    :data:`COMPRESSIBLE_TYPES`, responses that already have a ``Content-Encoding`` and
+    routes using :func:`skip_compression` go out unchanged. Complete bodies are
+    compressed through :class:`CompressedBodyCache`; streamed bodies are compressed
+    chunk by chunk and not cached.
+
+    :param min_size: Smallest body that is compressed, in bytes.
+    :type min_size: int
+    :param cache: Cache of compressed bodies, None for a new one.
+    :type cache: CompressedBodyCache, optional
+    :param encodings: Encodings to offer, see :func:`available_encodings`.
+    :type encodings: dict, optional
+    """
+
+    def __init__(self, app, min_size: int = COMPRESSION_MIN_SIZE, cache: CompressedBodyCache | None = None,
+                 encodings: dict | None = None):
+        self.app = app
+        self.min_size = min_size
+        self.cache = CompressedBodyCache() if cache is None else cache
+        self.encodings = available_encodings() if encodings is None else encodings
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = dict(scope.get("headers", [])).get(b"accept-encoding", b"").decode("latin-1")
+        encoding = negotiate(accept, self.encodings)
+        state = scope.setdefault("state", {})
+
+        start = None
+        stream = None
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start, stream, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if stream is not None:
+                chunk = stream.compress(body)
+                if not more_body:
+                    chunk += stream.flush()
+                compressed_bytes_total.inc(len(body), direction="in", encoding=encoding)
+                compressed_bytes_total.inc(len(chunk), direction="out", encoding=encoding)
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+                return
+
+            headers = start.get("headers", [])
+            names = {name.lower(): value for name, value in headers}
+            eligible = (
+                state.get("compress", True)
+                and start["status"] not in (204, 304)
+                and b"content-encoding" not in names
+                and names.get(b"content-type", b"").split(b";")[0].strip() in COMPRESSIBLE_TYPES
+            )
+            if eligible:
+                headers = _add_vary(headers)
+            if not eligible or encoding is None or (not more_body and len(body) < self.min_size):
+                passthrough = True
+                await send({**start, "headers": headers})
+                await send(message)
+                return
+
+            compress, open_stream = self.encodings[encoding]
+            headers = [(name, value) for name, value in headers
+                       if name.lower() not in (b"content-length", b"etag")]
+            etag = names.get(b"etag")
+            if etag is not None:
+                # the compressed bytes differ from what a strong validator describes
+                headers.append((b"etag", etag if etag.startswith(b"W/") else b"W/" + etag))
+            headers.append((b"content-encoding", encoding.encode()))
+
+            if more_body:
+                stream = open_stream()
+                chunk = stream.compress(body)
+                compressed_bytes_total.inc(len(body), direction="in", encoding=encoding)
+                compressed_bytes_total.inc(len(chunk), direction="out", encoding=encoding)
+                await send({**start, "headers": headers})
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                return
+
+            compressed = self.cache.get_or_compress(encoding, body, compress)
+            compressed_bytes_total.inc(len(body), direction="in", encoding=encoding)
+            compressed_bytes_total.inc(len(compressed), direction="out", encoding=encoding)
+            headers.append((b"content-length", str(len(compressed)).encode()))
+            await send({**start, "headers": headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, compressing_send)
+
+
+def _add_vary(headers: list) -> list:
+    for index, (name, value) in enumerate(headers):
+        if name.lower() == b"vary":
+            if b"accept-encoding" in value.lower() or value.strip() == b"*":
+                return headers
+            return headers[:index] + [(name, value + b", Accept-Encoding")] + headers[index + 1:]
+    return [*headers, (b"vary", b"Accept-Encoding")]
@@ -0,0 +1,234 @@
+import asyncio
+import inspect
+import os
+import time
+
+from dotenv import load_dotenv
+from fastapi import Depends, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from src.db.db import get_db
+from src.services.metrics import registry
+
+load_dotenv()
+
+# default time budget of a request, routes may only tighten it
+REQUEST_TIMEOUT = float(os.getenv('REQUEST_TIMEOUT_MS', '5000')) / 1000
+# tighter budget for the unbounded contact search
+SEARCH_TIMEOUT = float(os.getenv('SEARCH_TIMEOUT_MS', '2000')) / 1000
+# type-ahead suggestions are useless once the next keystroke arrives
+SUGGEST_TIMEOUT = float(os.getenv('SUGGEST_TIMEOUT_MS', '250')) / 1000
+# header a client can send to shorten the budget, in milliseconds
+TIMEOUT_HEADER = "X-Request-Timeout"
+
+# PostgreSQL SQLSTATE for a statement cancelled by statement_timeout or pg_cancel_backend
+QUERY_CANCELED = "57014"
+
+deadline_exceeded_total = registry.counter(
+    "request_deadline_exceeded_total", "Requests that ran out of time, by cause (deadline or disconnect)"
+)
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when a request's deadline has passed before its next database transaction,
+    or in place of the driver's error when a statement was cancelled for running out of
+    time or because the client went away.
+    """
+
+
+class RequestDeadline:
+    """
+    Route dependency that gives the request a deadline and attaches it to the request's
+    database session.
+
+    Every transaction the session begins afterwards runs with
+    ``SET LOCAL statement_timeout`` set to the time left, so a runaway query is cancelled
+    by PostgreSQL instead of holding a pooled connection after the client has given up.
+    A client can shorten (never extend) the budget with the ``X-Request-Timeout`` header.
+    When several ``RequestDeadline`` dependencies apply (router and route), the earliest wins.
+
+    :param seconds: The time budget of the route.
+    :type seconds: float
+    """
+
+    def __init__(self, seconds: float = REQUEST_TIMEOUT):
+        self.seconds = seconds
+
+    async def __call__(self, request: Request, db: Session = Depends(get_db)):
+        timeout = self.seconds
+        header = request.headers.get(TIMEOUT_HEADER)
+        if header and header.isdigit():
+            timeout = min(timeout, int(header) / 1000)
+        deadline = time.monotonic() + timeout
+        deadline = min(deadline, db.info.get("deadline", deadline))
+        db.info["deadline"] = deadline
+        request.state.deadline = deadline
+        callbacks = getattr(request.state, "on_disconnect", None)
+        if callbacks is not None and not db.info.get("cancel_registered"):
+            db.info["cancel_registered"] = True
+            callbacks.append(lambda: cancel_session(db))
+
+
+def remaining_ms(deadline: float) -> int:
+    """
+    Returns the milliseconds left until a deadline.
+
+    :param deadline: A ``time.monotonic()`` timestamp.
+    :type deadline: float
+    :return: Milliseconds left, 0 if the deadline has passed.
+    :rtype: int
+    """
+    return max(0, int((deadline - time.monotonic()) * 1000))
+
+
+@event.listens_for(Session, "after_begin")
+def apply_statement_timeout(session, transaction, connection):
+    """
+    Applies the session's deadline to every transaction it begins.
+    """
+    # only while the transaction holds the connection, see release_connection
+    session.info["dbapi_connection"] = connection.connection.dbapi_connection
+    deadline = session.info.get("deadline")
+    if deadline is None:
+        return
+    if session.info.get("cancelled"):
+        raise DeadlineExceeded("Client disconnected")
+    left = remaining_ms(deadline)
+    if left == 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    if connection.dialect.name == "postgresql":
+        # SET LOCAL only lasts until the end of this transaction, pooled connections stay clean
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {left}")
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def release_connection(session):
+    """
+    Forgets the transaction's connection before it goes back to the pool, so cancelling
+    this session can never cancel another request's statement on the same connection.
+    """
+    session.info.pop("dbapi_connection", None)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def release_connection_after_rollback(session, previous_transaction):
+    if not session.in_transaction():
+        release_connection(session)
+
+
+async def cancel_session(db: Session) -> None:
+    """
+    Cancels the statement currently running on the session's connection, if any.
+
+    Safe to call while another thread uses the session: it only uses the driver's
+    cancel primitive (``cancel()`` for psycopg2, ``interrupt()`` for sqlite3), never the
+    session itself. psycopg2 sends the cancel request over a new connection to the
+    server, so it runs in a thread.
+
+    :param db: The session of a request whose client went away.
+    :type db: Session
+    """
+    db.info["cancelled"] = True
+    connection = db.info.get("dbapi_connection")
+    cancel = getattr(connection, "cancel", None) or getattr(connection, "interrupt", None)
+    if cancel is not None:
+        await asyncio.to_thread(cancel)
+    deadline_exceeded_total.inc(cause="disconnect")
+
+
+def is_cancelled_statement(err: Exception) -> bool:
+    """
+    Tells whether a DBAPI error reports a statement cancelled by ``statement_timeout``
+    or :func:`cancel_session`.
+    """
+    return getattr(err, "pgcode", None) == QUERY_CANCELED or str(err) == "interrupted"
+
+
+@event.listens_for(Engine, "handle_error")
+def raise_deadline_exceeded(context):
+    """
+    Raises :class:`DeadlineExceeded` in place of the error of a cancelled statement;
+    every other database error is left alone.
+    """
+    if is_cancelled_statement(context.original_exception):
+        raise DeadlineExceeded("Statement cancelled") from context.sqlalchemy_exception
+
+
+async def deadline_exceeded_handler(request: Request, err: DeadlineExceeded):
+    """
+    Turns :class:`DeadlineExceeded` into ``504 Gateway Timeout``.
+    """
+    deadline_exceeded_total.inc(cause="deadline")
+    return JSONResponse(status_code=504, content={"detail": "Request deadline exceeded"})
+
+
+class DisconnectMiddleware:
+    """
+    ASGI middleware that notices when the client disconnects while its request is still
+    being handled and runs the callbacks registered in ``request.state.on_disconnect``
+    (see :class:`RequestDeadline`), which cancel the request's database work. A
+    callback may return an awaitable, which is awaited.
+
+    The disconnect is observed once the request body has been read. Work that blocks
+    the event loop is only interrupted between statements; queries running in the
+    threadpool are cancelled immediately.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        callbacks = []
+        scope.setdefault("state", {})["on_disconnect"] = callbacks
+        watcher = None
+        buffered = []
+        finished = False
+
+        async def watch():
+            message = await receive()
+            # servers also report a disconnect after a complete response, that one is not a cancellation
+            if message["type"] == "http.disconnect" and not finished:
+                for callback in callbacks:
+                    result = callback()
+                    if inspect.isawaitable(result):
+                        await result
+            return message
+
+        async def wrapped_send(message):
+            nonlocal finished
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finished = True
+            await send(message)
+
+        if not any(name in (b"content-length", b"transfer-encoding") and value != b"0"
+                   for name, value in scope.get("headers", [])):
+            # no body: read the empty request message now and start watching right away
+            buffered.append(await receive())
+            if buffered[0]["type"] == "http.request":
+                watcher = asyncio.ensure_future(watch())
+
+        async def wrapped_receive():
+            nonlocal watcher
+            if buffered:
+                return buffered.pop()
+            if watcher is not None:
+                return await asyncio.shield(watcher)
+            message = await receive()
+            if message["type"] == "http.request" and not message.get("more_body", False):
+                watcher = asyncio.ensure_future(watch())
+            return message
+
+        try:
+            await self.app(scope, wrapped_receive, wrapped_send)
+        finally:
+            if watcher is not None and not watcher.done():
+                watcher.cancel()
@@ -0,0 +1,112 @@
+from collections import defaultdict
+from typing import Iterable
+
+from src.services.normalization import normalize_email, normalize_phone, soundex
+
+# blocks bigger than this (e.g. hundreds of "John Smith") are skipped to keep the
+# number of compared pairs close to linear in the number of contacts
+MAX_BLOCK_SIZE = 100
+
+# trailing digits that identify a number regardless of how its prefix was written
+PHONE_TAIL_DIGITS = 7
+
+
+def blocking_keys(contact) -> set[tuple[str, str]]:
+    """
+    Returns the blocking keys of a contact. Contacts that share at least one key are
+    candidate duplicates; contacts that share none are never compared.
+
+    :param contact: Any object with name, email, phone_number and birthday attributes.
+    :type contact: Contact
+    :return: Set of (kind, value) keys.
+    :rtype: set[tuple[str, str]]
+    """
+    keys = set()
+    first, last = soundex(contact.first_name), soundex(contact.last_name)
+    if first and last:
+        # sorted, so "Doe John" and "John Doe" land in the same block
+        keys.add(("name", "|".join(sorted((first, last)))))
+    phone = normalize_phone(contact.phone_number)
+    if phone:
+        keys.add(("phone", phone[-PHONE_TAIL_DIGITS:]))
+    email = normalize_email(contact.email)
+    if email:
+        keys.add(("email", email))
+    return keys
+
+
+def find_duplicates(contacts: Iterable, max_block_size: int = MAX_BLOCK_SIZE) -> list[dict]:
+    """
+    Groups candidate duplicate contacts using blocking keys and union-find.
+
+    Every contact is read once; pairs are only formed inside a block, so the cost is
+    linear in the number of contacts plus the pairs within (bounded) blocks.
+
+    :param contacts: Contacts of one user.
+    :type contacts: Iterable
+    :param max_block_size: Blocks larger than this are ignored.
+    :type max_block_size: int
+    :return: Groups as dicts with ``contact_ids`` and the ``reasons`` (key kinds) that linked them.
+    :rtype: list[dict]
+    """
+    blocks = defaultdict(list)
+    for contact in contacts:
+        for key in blocking_keys(contact):
+            blocks[key].append(contact.id)
+
+    parent = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    linked = []
+    for (kind, _), ids in blocks.items():
+        if len(ids) < 2 or len(ids) > max_block_size:
+            continue
+        root = find(ids[0])
+        for other in ids[1:]:
+            other_root = find(other)
+            if other_root != root:
+                parent[other_root] = root
+        linked.append((kind, ids[0]))
+
+    reasons = defaultdict(set)
+    for kind, contact_id in linked:
+        reasons[find(contact_id)].add(kind)
+    groups = defaultdict(list)
+    for contact_id in parent:
+        groups[find(contact_id)].append(contact_id)
+    return sorted(
+        ({"contact_ids": sorted(ids), "reasons": sorted(reasons[root])} for root, ids in groups.items()),
+        key=lambda group: group["contact_ids"][0],
+    )
+
+
+def merge_values(primary, duplicates: list) -> dict:
+    """
+    Computes the field values of a merged contact: the primary contact wins, empty
+    fields are filled from the duplicates and additional info is concatenated.
+
+    :param primary: The contact that is kept.
+    :type primary: Contact
+    :param duplicates: The contacts merged into it.
+    :type duplicates: list
+    :return: Column values for the primary contact.
+    :rtype: dict
+    """
+    values = {}
+    for field in ("first_name", "last_name", "email", "phone_number", "birthday"):
+        value = getattr(primary, field)
+        for duplicate in duplicates:
+            if value:
+                break
+            value = getattr(duplicate, field)
+        values[field] = value
+    notes = [primary.additional_info] + [d.additional_info for d in duplicates]
+    unique_notes = list(dict.fromkeys(note for note in notes if note))
+    values["additional_info"] = "\n".join(unique_notes) or None
+    return values
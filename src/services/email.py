@@ -7,6 +7,7 @@ from fastapi_mail.errors import ConnectionErrors
 from pydantic import EmailStr
 
 from src.services.auth import auth_service
+from src.services.tracing import traced
 
 load_dotenv()
 
@@ -29,6 +30,7 @@ conf = ConnectionConfig(
 )
 
 
+@traced("smtp.send confirmation")
 async def send_email(email: EmailStr, username: str, host: str):
     """
     Sends an email to the specified recipient for email verification.
@@ -40,7 +42,7 @@ async def send_email(email: EmailStr, username: str, host: str):
     :param host: The host URL where the user can verify their email.
     :type host: str
     :return: None
-    :raises ConnectionErrors: If there is an error while sending the email.
+    :raises ConnectionErrors: If there is an error while sending the email, so the job is retried.
     """
     try:
         token_verification = auth_service.create_email_token({"sub": email})
@@ -55,4 +57,34 @@ async def send_email(email: EmailStr, username: str, host: str):
         await fm.send_message(message, template_name="email_template.html")
     except ConnectionErrors as err:
         print(err)
+        raise
 
+
+
+@traced("smtp.send birthday_reminder")
+async def send_birthday_reminder(email: EmailStr, username: str, contacts: list[dict]):
+    """
+    Sends a user the list of their contacts with upcoming birthdays.
+
+    :param email: The recipient's email address.
+    :type email: EmailStr
+    :param username: The username of the recipient, used in the email template.
+    :type username: str
+    :param contacts: first_name, last_name and birthday of each contact.
+    :type contacts: list[dict]
+    :return: None
+    :raises ConnectionErrors: If there is an error while sending the email, so the job is retried.
+    """
+    try:
+        message = MessageSchema(
+            subject="Upcoming birthdays",
+            recipients=[email],
+            template_body={"username": username, "contacts": contacts},
+            subtype=MessageType.html
+        )
+
+        fm = FastMail(conf)
+        await fm.send_message(message, template_name="birthday_template.html")
+    except ConnectionErrors as err:
+        print(err)
+        raise
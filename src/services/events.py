@@ -0,0 +1,297 @@
+"""
+Contact change events pushed to clients over Server-Sent Events (``GET /contact/stream``).
+
+Every contact write publishes an event with one Redis script call: the event is appended
+to the user's capped stream ``events:contacts:{user_id}``, which assigns its id, and
+published on the user's channel. Each process holds one pub/sub connection and subscribes
+to the channels of the users it has streams open for, so an event only reaches the
+processes that have a subscriber for it.
+
+A client that reconnects with ``Last-Event-ID`` is replayed what it missed from the
+stream. A slow client does not hold events in memory: once its buffer of
+``EVENTS_BUFFER`` events is full, the buffer is dropped and the client catches up from the
+stream when it reads again. A client that missed events it cannot be replayed (its last
+event is no longer retained, or it had not been sent any yet) is sent a ``reset`` event
+and should reload its contacts.
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+from redis.exceptions import RedisError
+
+from src.services.metrics import registry
+
+load_dotenv()
+
+# events kept per user for resuming, and how long a user's stream outlives their last event
+EVENTS_RETAINED = int(os.getenv('EVENTS_RETAINED', '1000'))
+EVENTS_RETENTION = int(os.getenv('EVENTS_RETENTION_SECONDS', '86400'))
+# events buffered per open stream before it falls back to reading the Redis stream
+EVENTS_BUFFER = int(os.getenv('EVENTS_BUFFER', '64'))
+# comment line sent on idle streams, so proxies do not close them
+EVENTS_HEARTBEAT = float(os.getenv('EVENTS_HEARTBEAT_SECONDS', '15'))
+# reconnection delay suggested to clients
+EVENTS_RETRY_MS = int(os.getenv('EVENTS_RETRY_MS', '3000'))
+
+logger = logging.getLogger(__name__)
+
+events_published = registry.counter("events_published_total", "Contact events published, by event")
+events_delivered = registry.counter("events_delivered_total", "Contact events written to open streams")
+event_streams = registry.gauge("event_streams", "Open event streams in this process")
+event_stream_lagged = registry.counter("event_stream_lagged_total",
+                                       "Times a slow stream overflowed its buffer and caught up from Redis")
+
+# appends to the user's stream and publishes "<id> <event> <data>" on their channel
+PUBLISH_SCRIPT = """
+local id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[1], '*', 'event', ARGV[2], 'data', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('PUBLISH', KEYS[2], id .. ' ' .. ARGV[2] .. ' ' .. ARGV[3])
+return id
+"""
+
+
+def stream_key(user_id: int) -> str:
+    return f"events:contacts:{user_id}"
+
+
+def channel(user_id: int) -> str:
+    return f"events:contacts:{user_id}:live"
+
+
+def parse_event_id(event_id: str | None) -> tuple[int, int] | None:
+    """
+    Parses a Redis stream id such as ``1718000000000-3``, None if it is not one.
+    """
+    if not event_id:
+        return None
+    millis, _, sequence = event_id.partition("-")
+    if not millis.isdigit() or not (sequence or "0").isdigit():
+        return None
+    return int(millis), int(sequence or 0)
+
+
+def format_event(event_id: str, event: str, data: str) -> str:
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+
+
+class Subscriber:
+    """
+    One open stream: a bounded buffer of events and the id of the last event sent.
+
+    :param user_id: The user whose events are streamed.
+    :type user_id: int
+    :param size: Events buffered before the stream falls back to catching up.
+    :type size: int
+    """
+
+    def __init__(self, user_id: int, size: int = EVENTS_BUFFER):
+        self.user_id = user_id
+        self.size = size
+        self.buffer = deque()
+        self.wake = asyncio.Event()
+        self.lagged = False
+        self.closed = False
+        self.last = None
+
+    def deliver(self, event_id: str, event: str, data: str) -> None:
+        if not self.lagged:
+            if len(self.buffer) < self.size:
+                self.buffer.append((event_id, event, data))
+            else:
+                # the client reads slower than events arrive; it catches up from Redis instead
+                self.lagged = True
+                self.buffer.clear()
+                event_stream_lagged.inc()
+        self.wake.set()
+
+    def close(self) -> None:
+        self.closed = True
+        self.wake.set()
+
+
+class EventHub:
+    """
+    Publishes contact events and fans them out to this process's open streams.
+
+    :param retained: Events kept per user for resuming.
+    :type retained: int
+    :param buffer: Events buffered per open stream.
+    :type buffer: int
+    """
+
+    def __init__(self, retained: int = EVENTS_RETAINED, buffer: int = EVENTS_BUFFER):
+        self.retained = retained
+        self.buffer = buffer
+        self.redis = None
+        self.script = None
+        self.pubsub = None
+        self.listener = None
+        self.subscribers = {}
+
+    def use(self, redis) -> None:
+        """
+        Sets the Redis client events are published and received through.
+        """
+        self.redis = redis
+        self.script = redis.register_script(PUBLISH_SCRIPT)
+
+    async def publish(self, user_id: int, event: str, data: dict) -> str | None:
+        """
+        Publishes a change to the user's streams. A Redis failure does not fail the write
+        that caused the event; clients see the change on their next reload.
+
+        :param user_id: The owner of the changed contacts.
+        :type user_id: int
+        :param event: ``created``, ``updated``, ``deleted``, ``restored`` or ``imported``.
+        :type event: str
+        :param data: The event payload.
+        :type data: dict
+        :return: The event id, None if it was not published.
+        :rtype: str, optional
+        """
+        if self.redis is None:
+            return None
+        try:
+            event_id = await self.script(keys=[stream_key(user_id), channel(user_id)],
+                                         args=[self.retained, event, json.dumps(data, default=str), EVENTS_RETENTION])
+        except RedisError:
+            logger.warning("events: could not publish %s for user %s", event, user_id, exc_info=True)
+            return None
+        events_published.inc(event=event)
+        return event_id
+
+    async def subscribe(self, user_id: int) -> Subscriber:
+        subscriber = Subscriber(user_id, self.buffer)
+        subscribers = self.subscribers.setdefault(user_id, set())
+        subscribers.add(subscriber)
+        event_streams.inc()
+        if len(subscribers) == 1:
+            if self.pubsub is None:
+                self.pubsub = self.redis.pubsub()
+            await self.pubsub.subscribe(channel(user_id))
+            if self.listener is None or self.listener.done():
+                self.listener = asyncio.ensure_future(self._listen())
+        return subscriber
+
+    async def unsubscribe(self, subscriber: Subscriber) -> None:
+        event_streams.dec()
+        subscribers = self.subscribers.get(subscriber.user_id, set())
+        subscribers.discard(subscriber)
+        if not subscribers:
+            self.subscribers.pop(subscriber.user_id, None)
+            if self.pubsub is not None:
+                try:
+                    await self.pubsub.unsubscribe(channel(subscriber.user_id))
+                except RedisError:
+                    pass
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except RedisError:
+                # events published meanwhile are replayed: every stream catches up from Redis
+                logger.warning("events: pub/sub connection lost", exc_info=True)
+                for subscribers in self.subscribers.values():
+                    for subscriber in subscribers:
+                        subscriber.lagged = True
+                        subscriber.wake.set()
+                await asyncio.sleep(1)
+                continue
+            if message is None or message["type"] != "message":
+                continue
+            user_id = int(message["channel"].split(":")[2])
+            event_id, event, data = message["data"].split(" ", 2)
+            for subscriber in self.subscribers.get(user_id, ()):
+                subscriber.deliver(event_id, event, data)
+
+    async def catch_up(self, subscriber: Subscriber) -> list[tuple[str, str, str]] | None:
+        """
+        Reads the events after the subscriber's last one from the user's Redis stream.
+
+        :return: The missed events, None if they cannot all be replayed: the subscriber
+            has no last event to resume after, or some are no longer retained.
+        :rtype: list, optional
+        """
+        key = stream_key(subscriber.user_id)
+        if subscriber.last is None:
+            # events were dropped before any was sent, there is no position to resume from
+            return None
+        first = await self.redis.xrange(key, "-", "+", count=1)
+        if not first or parse_event_id(first[0][0]) > parse_event_id(subscriber.last):
+            return None
+        entries = await self.redis.xrange(key, f"({subscriber.last}", "+")
+        return [(event_id, fields["event"], fields["data"]) for event_id, fields in entries]
+
+    async def stream(self, user_id: int, last_event_id: str | None = None, heartbeat: float = EVENTS_HEARTBEAT):
+        """
+        Yields the Server-Sent Events of a user's contact changes until the client leaves
+        or the process shuts down.
+
+        :param user_id: The user.
+        :type user_id: int
+        :param last_event_id: The last event the client received, to resume after it.
+        :type last_event_id: str, optional
+        :param heartbeat: Seconds between keep-alive comments on an idle stream.
+        :type heartbeat: float
+        """
+        # subscribed before replaying, so no event falls between the replay and the live feed
+        subscriber = await self.subscribe(user_id)
+        try:
+            yield f"retry: {EVENTS_RETRY_MS}\n\n"
+            if parse_event_id(last_event_id) is not None:
+                subscriber.last = last_event_id
+                subscriber.lagged = True
+            while not subscriber.closed:
+                if subscriber.lagged:
+                    subscriber.lagged = False
+                    subscriber.buffer.clear()
+                    events = await self.catch_up(subscriber)
+                    if events is None:
+                        subscriber.last = None
+                        yield "event: reset\ndata: {}\n\n"
+                        continue
+                    subscriber.buffer.extend(events)
+                if not subscriber.buffer:
+                    subscriber.wake.clear()
+                    try:
+                        async with asyncio.timeout(heartbeat):
+                            await subscriber.wake.wait()
+                    except TimeoutError:
+                        yield ": keep-alive\n\n"
+                    continue
+                event_id, event, data = subscriber.buffer.popleft()
+                # a replayed event can arrive again from the live feed
+                if subscriber.last is not None and parse_event_id(event_id) <= parse_event_id(subscriber.last):
+                    continue
+                subscriber.last = event_id
+                events_delivered.inc()
+                yield format_event(event_id, event, data)
+        finally:
+            await self.unsubscribe(subscriber)
+
+    async def close(self) -> None:
+        """
+        Ends every open stream and stops listening; clients reconnect, to another
+        process, and resume where they stopped.
+        """
+        for subscribers in self.subscribers.values():
+            for subscriber in subscribers:
+                subscriber.close()
+        if self.listener is not None:
+            self.listener.cancel()
+            self.listener = None
+        if self.pubsub is not None:
+            try:
+                await self.pubsub.aclose()
+            except RedisError:
+                pass
+            self.pubsub = None
+
+
+event_hub = EventHub()
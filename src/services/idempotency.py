@@ -0,0 +1,175 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+
+from dotenv import load_dotenv
+
+from src.services.metrics import registry
+
+load_dotenv()
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+# how long a stored response is replayed, in seconds
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', '86400'))
+# upper bound on how long one attempt may hold a key, in milliseconds
+IDEMPOTENCY_LOCK_TTL = int(os.getenv('IDEMPOTENCY_LOCK_TTL_MS', '30000'))
+# how long a concurrent retry waits for the first attempt before giving up with 409
+IDEMPOTENCY_WAIT = float(os.getenv('IDEMPOTENCY_WAIT_MS', '5000')) / 1000
+MAX_KEY_LENGTH = 255
+
+# routes that honour Idempotency-Key
+IDEMPOTENT_ROUTES = {
+    ("POST", "/contact/contacts"),
+    ("POST", "/auth/signup"),
+}
+
+idempotency_total = registry.counter(
+    "idempotency_requests_total", "Requests carrying an Idempotency-Key, by outcome"
+)
+
+
+def _json_response(status: int, detail: str, headers: list | None = None) -> dict:
+    body = json.dumps({"detail": detail}).encode()
+    return {
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                    *(headers or [])],
+        "body": body,
+    }
+
+
+class IdempotencyMiddleware:
+    """
+    ASGI middleware that makes retried writes safe.
+
+    The first request with a given ``Idempotency-Key`` runs normally and its response is
+    stored in Redis for :data:`IDEMPOTENCY_TTL` seconds. A retry with the same key gets
+    the stored response (marked ``Idempotent-Replayed: true``) without reaching the
+    route, so no password is hashed, no email is queued and no row is written twice.
+    A retry that arrives while the first attempt is still running waits for its result,
+    and gets ``409`` if it does not arrive in time. Reusing a key for a different request
+    body is rejected with ``422``. Server errors and ``429`` are not stored, so they can be retried.
+
+    Keys are scoped to the caller's ``Authorization`` header, so one user can never
+    replay another user's response. Without Redis (``app.state.redis``) the header is ignored.
+    """
+
+    def __init__(self, app, routes: set | None = None, ttl: int = IDEMPOTENCY_TTL,
+                 lock_ttl: int = IDEMPOTENCY_LOCK_TTL, wait: float = IDEMPOTENCY_WAIT):
+        self.app = app
+        self.routes = IDEMPOTENT_ROUTES if routes is None else routes
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.wait = wait
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"]) not in self.routes:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers", []))
+        key = headers.get(IDEMPOTENCY_HEADER.encode())
+        redis = getattr(getattr(scope.get("app"), "state", None), "redis", None)
+        if key is None or redis is None:
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await self._send(send, _json_response(400, "Invalid Idempotency-Key"))
+            return
+
+        body, more_body = b"", True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        caller = hashlib.sha256(headers.get(b"authorization", b"")).hexdigest()[:32]
+        storage_key = f"idempotency:{scope['method']}:{scope['path']}:{caller}:{key.decode('latin-1')}"
+        fingerprint = hashlib.sha256(body).hexdigest()
+
+        stored = await redis.get(storage_key)
+        if stored is None:
+            acquired = await redis.set(f"{storage_key}:lock", 1, nx=True, px=self.lock_ttl)
+            if not acquired:
+                stored = await self._wait_for(redis, storage_key)
+                if stored is None:
+                    idempotency_total.inc(outcome="conflict")
+                    await self._send(send, _json_response(
+                        409, "A request with this Idempotency-Key is still in progress", [(b"retry-after", b"1")]
+                    ))
+                    return
+        if stored is not None:
+            await self._replay(send, json.loads(stored), fingerprint)
+            return
+
+        try:
+            await self._run(scope, receive, body, send, redis, storage_key, fingerprint)
+        finally:
+            await redis.delete(f"{storage_key}:lock")
+
+    async def _wait_for(self, redis, storage_key: str):
+        deadline = asyncio.get_running_loop().time() + self.wait
+        while asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.05)
+            stored = await redis.get(storage_key)
+            if stored is not None:
+                return stored
+            if not await redis.exists(f"{storage_key}:lock"):
+                # the first attempt failed without storing a response
+                return None
+        return None
+
+    async def _replay(self, send, stored: dict, fingerprint: str):
+        if stored["fingerprint"] != fingerprint:
+            idempotency_total.inc(outcome="mismatch")
+            await self._send(send, _json_response(422, "Idempotency-Key was used with a different request"))
+            return
+        idempotency_total.inc(outcome="replayed")
+        await self._send(send, {
+            "status": stored["status"],
+            "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in stored["headers"]]
+                       + [(b"idempotent-replayed", b"true")],
+            "body": base64.b64decode(stored["body"]),
+        })
+
+    async def _run(self, scope, receive, body: bytes, send, redis, storage_key: str, fingerprint: str):
+        delivered = False
+
+        async def replay_receive():
+            nonlocal delivered
+            if not delivered:
+                delivered = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # the body was consumed here, later reads only report a disconnect
+            return await receive()
+
+        response = {"status": 500, "headers": [], "body": b""}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = message.get("headers", [])
+            elif message["type"] == "http.response.body":
+                response["body"] += message.get("body", b"")
+            await send(message)
+
+        await self.app(scope, replay_receive, capture_send)
+        if response["status"] >= 500 or response["status"] == 429:
+            # transient failures are not remembered, a retry should run again
+            idempotency_total.inc(outcome="not_stored")
+            return
+        idempotency_total.inc(outcome="stored")
+        await redis.set(storage_key, json.dumps({
+            "fingerprint": fingerprint,
+            "status": response["status"],
+            "headers": [(name.decode("latin-1"), value.decode("latin-1")) for name, value in response["headers"]],
+            "body": base64.b64encode(response["body"]).decode(),
+        }), ex=self.ttl)
+
+    @staticmethod
+    async def _send(send, response: dict):
+        await send({"type": "http.response.start", "status": response["status"], "headers": response["headers"]})
+        await send({"type": "http.response.body", "body": response["body"]})
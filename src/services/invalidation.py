@@ -0,0 +1,263 @@
+"""
+In-process caches that every worker keeps consistent through one invalidation channel.
+
+A write commits, then calls :meth:`InvalidationBus.invalidate`. That call increments
+the key's version in the Redis hash ``cache:versions`` and publishes
+``<namespace> <version> <key>`` on ``cache:invalidate``, in one script call. Each
+process listens on the channel and drops the key from its cache in that namespace. The
+writing process drops it right away, so it reads its own writes. Reads never touch Redis.
+
+A load that was already running when an invalidation arrived must not store its
+result, because it may have read the old row. :meth:`LocalCache.token` is taken before
+the load, and :meth:`LocalCache.set` refuses the value if the key's version moved in
+the meantime.
+
+While the pub/sub connection is down, invalidations may be missed. Caches are bypassed
+until it is back, then flushed completely.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+from redis.exceptions import RedisError
+
+from src.services.metrics import registry
+
+load_dotenv()
+
+# users cached per process by Auth.get_current_user
+CACHE_USERS_SIZE = int(os.getenv('CACHE_USERS_SIZE', '10000'))
+# entries expire even without an invalidation, bounding the damage of a lost message
+CACHE_TTL = float(os.getenv('CACHE_TTL_SECONDS', '300'))
+# per-key versions remembered per cache, for refusing loads that raced an invalidation
+CACHE_VERSIONS_SIZE = int(os.getenv('CACHE_VERSIONS_SIZE', '100000'))
+
+CHANNEL = "cache:invalidate"
+
+logger = logging.getLogger(__name__)
+
+cache_lookups = registry.counter("cache_lookups_total", "In-process cache lookups, by cache and result")
+cache_invalidations = registry.counter("cache_invalidations_total", "Keys invalidated, by cache")
+cache_flushes = registry.counter("cache_flushes_total", "Full cache flushes after the invalidation channel reconnected")
+
+# the version of every key no invalidation has been seen for
+UNVERSIONED = 0
+
+# bumps the key's version and announces it
+INVALIDATE_SCRIPT = """
+local version = redis.call('HINCRBY', KEYS[1], ARGV[2] .. ':' .. ARGV[3], 1)
+redis.call('PUBLISH', ARGV[1], ARGV[2] .. ' ' .. version .. ' ' .. ARGV[3])
+return version
+"""
+
+VERSIONS_KEY = "cache:versions"
+
+
+class LocalCache:
+    """
+    LRU of values with a time to live, invalidated through :class:`InvalidationBus`.
+
+    Values are shared between requests, so they must not be mutated or bound to a
+    database session.
+
+    :param name: The namespace invalidations are addressed to.
+    :type name: str
+    :param max_entries: Entries kept; the least recently used are evicted beyond it.
+    :type max_entries: int
+    :param ttl: Seconds an entry is served.
+    :type ttl: float
+    """
+
+    def __init__(self, name: str, max_entries: int, ttl: float = CACHE_TTL,
+                 max_versions: int = CACHE_VERSIONS_SIZE):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_versions = max_versions
+        self.entries = OrderedDict()
+        self.versions = OrderedDict()
+        # bumped by every flush, so loads started before it are not stored
+        self.epoch = 0
+        self.enabled = True
+
+    def get(self, key: str):
+        """
+        Returns the cached value, None on a miss.
+        """
+        entry = self.entries.get(key) if self.enabled else None
+        if entry is None or entry[1] <= time.monotonic():
+            cache_lookups.inc(cache=self.name, result="miss")
+            return None
+        self.entries.move_to_end(key)
+        cache_lookups.inc(cache=self.name, result="hit")
+        return entry[0]
+
+    def token(self, key: str) -> tuple[int, int]:
+        """
+        Returns what the key's state was before a load, to pass to :meth:`set`.
+        """
+        return self.epoch, self.versions.get(key, UNVERSIONED)
+
+    def set(self, key: str, value, token: tuple[int, int]) -> bool:
+        """
+        Caches a loaded value, unless the key was invalidated since ``token`` was taken.
+
+        :param key: The key.
+        :type key: str
+        :param value: The value.
+        :param token: The result of :meth:`token` before the load.
+        :type token: tuple[int, int]
+        :return: True if the value was stored.
+        :rtype: bool
+        """
+        if not self.enabled or token != self.token(key):
+            return False
+        self.entries[key] = (value, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return True
+
+    def invalidate(self, key: str, version: int | None = None) -> None:
+        """
+        Drops a key and moves its version past both the local one and ``version``, the
+        one announced on the bus, so a load that started before is not stored.
+        """
+        self.entries.pop(key, None)
+        known = self.versions.pop(key, UNVERSIONED)
+        self.versions[key] = max(known + 1, version or UNVERSIONED)
+        while len(self.versions) > self.max_versions:
+            # an evicted version only lets a racing load through if it is older than the eviction
+            self.versions.popitem(last=False)
+        cache_invalidations.inc(cache=self.name)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.epoch += 1
+
+
+class InvalidationBus:
+    """
+    Announces invalidations to every process and applies those of the others to the
+    caches registered here.
+
+    :param channel: The pub/sub channel.
+    :type channel: str
+    :param retry_delay: Seconds between reconnection attempts.
+    :type retry_delay: float
+    """
+
+    def __init__(self, channel: str = CHANNEL, retry_delay: float = 1.0):
+        self.channel = channel
+        self.retry_delay = retry_delay
+        self.caches = {}
+        self.redis = None
+        self.script = None
+        self.pubsub = None
+        self.listener = None
+
+    def register(self, namespace: str, cache) -> None:
+        """
+        Adds a cache, anything with ``invalidate(key, version)``, ``clear()`` and an
+        ``enabled`` flag.
+        """
+        self.caches[namespace] = cache
+
+    def use(self, redis) -> None:
+        """
+        Sets the Redis client invalidations are published through.
+        """
+        self.redis = redis
+        self.script = redis.register_script(INVALIDATE_SCRIPT)
+
+    async def start(self, redis) -> None:
+        """
+        Publishes through ``redis`` and listens for the other processes' invalidations.
+        """
+        self.use(redis)
+        self.pubsub = redis.pubsub()
+        await self.pubsub.subscribe(self.channel)
+        self.listener = asyncio.ensure_future(self._listen())
+
+    async def invalidate(self, namespace: str, key: str | int) -> None:
+        """
+        Invalidates a key in this process and, once published, in every other. Call it
+        after the change is committed.
+
+        :param namespace: The cache.
+        :type namespace: str
+        :param key: The key.
+        :type key: str | int
+        """
+        key = str(key)
+        version = None
+        if self.redis is not None:
+            try:
+                version = int(await self.script(keys=[VERSIONS_KEY], args=[self.channel, namespace, key]))
+            except RedisError:
+                # the other processes' entries expire with their TTL
+                logger.warning("invalidation: could not publish %s %s", namespace, key, exc_info=True)
+        self.apply(namespace, key, version)
+
+    def apply(self, namespace: str, key: str, version: int | None = None) -> None:
+        cache = self.caches.get(namespace)
+        if cache is not None:
+            cache.invalidate(key, version)
+
+    def set_enabled(self, enabled: bool) -> None:
+        for cache in self.caches.values():
+            cache.enabled = enabled
+
+    def flush(self) -> None:
+        """
+        Empties every registered cache.
+        """
+        for cache in self.caches.values():
+            cache.clear()
+        cache_flushes.inc()
+
+    async def _listen(self) -> None:
+        connected = True
+        while True:
+            try:
+                if not connected:
+                    try:
+                        await self.pubsub.aclose()
+                    except RedisError:
+                        pass
+                    self.pubsub = self.redis.pubsub()
+                    await self.pubsub.subscribe(self.channel)
+                    # whatever was published while disconnected is lost
+                    self.flush()
+                    self.set_enabled(True)
+                    connected = True
+                    logger.info("invalidation: reconnected, caches flushed")
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except RedisError:
+                if connected:
+                    logger.warning("invalidation: channel lost, caches bypassed", exc_info=True)
+                    self.set_enabled(False)
+                    connected = False
+                await asyncio.sleep(self.retry_delay)
+                continue
+            if message is None or message["type"] != "message":
+                continue
+            namespace, version, key = message["data"].split(" ", 2)
+            self.apply(namespace, key, int(version))
+
+    async def close(self) -> None:
+        if self.listener is not None:
+            self.listener.cancel()
+            self.listener = None
+        if self.pubsub is not None:
+            try:
+                await self.pubsub.aclose()
+            except RedisError:
+                pass
+            self.pubsub = None
+
+
+invalidation_bus = InvalidationBus()
@@ -0,0 +1,158 @@
+"""
+Process lifecycle: resource warm-up on startup, draining on shutdown, and the state
+the ``/ops/live`` and ``/ops/ready`` probes report.
+"""
+import asyncio
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from src.services.metrics import registry
+
+load_dotenv()
+
+# connections opened before the first request, capped by the pool size
+DB_POOL_WARM = int(os.getenv('DB_POOL_WARM', '5'))
+# how long shutdown waits for in-flight requests before closing the pools anyway
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT_MS', '10000')) / 1000
+
+STARTING, READY, DRAINING, STOPPED = "starting", "ready", "draining", "stopped"
+
+logger = logging.getLogger(__name__)
+
+lifecycle_state = registry.gauge("lifecycle_ready", "1 while the process accepts traffic, 0 otherwise")
+warmup_seconds = registry.gauge("lifecycle_warmup_seconds", "Time spent warming up each resource at startup")
+
+
+class Lifecycle:
+    """
+    Tracks whether the process is starting, ready, draining or stopped, and how many
+    HTTP requests are in flight.
+    """
+
+    def __init__(self):
+        self.state = STARTING
+        self.in_flight = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    def set_state(self, state: str) -> None:
+        self.state = state
+        lifecycle_state.set(1 if state == READY else 0)
+        logger.info("lifecycle: %s", state)
+
+    def request_started(self) -> None:
+        self.in_flight += 1
+
+    def request_finished(self) -> None:
+        self.in_flight -= 1
+
+    async def drain(self, timeout: float = SHUTDOWN_DRAIN_TIMEOUT) -> bool:
+        """
+        Stops reporting ready, if SIGTERM has not already, and waits for the in-flight
+        requests to finish.
+
+        :param timeout: Longest wait, in seconds.
+        :type timeout: float
+        :return: True if every request finished in time.
+        :rtype: bool
+        """
+        self.set_state(DRAINING)
+        # polled rather than awaited on an Event, the tracker outlives the event loop it was created in
+        deadline = time.monotonic() + timeout
+        while self.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self.in_flight:
+            logger.warning("lifecycle: %d requests still in flight after %.1fs", self.in_flight, timeout)
+            return False
+        return True
+
+
+lifecycle = Lifecycle()
+
+
+class InFlightMiddleware:
+    """
+    ASGI middleware that counts HTTP requests in flight, so shutdown can wait for them.
+    """
+
+    def __init__(self, app, tracker: Lifecycle = lifecycle):
+        self.app = app
+        self.tracker = tracker
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        self.tracker.request_started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.tracker.request_finished()
+
+
+def warm_db_pool(engine: Engine, connections: int = DB_POOL_WARM) -> int:
+    """
+    Opens up to ``connections`` pooled connections at once and returns them to the pool,
+    so the first requests do not pay for connecting and authenticating.
+
+    :param engine: The engine whose pool is warmed.
+    :type engine: Engine
+    :param connections: Number of connections to open, capped by the pool size.
+    :type connections: int
+    :return: Number of connections opened.
+    :rtype: int
+    """
+    size = getattr(engine.pool, "size", None)
+    if callable(size):
+        connections = min(connections, size())
+    opened = []
+    try:
+        for _ in range(max(1, connections)):
+            connection = engine.connect()
+            opened.append(connection)
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in opened:
+            connection.close()
+    return len(opened)
+
+
+def prime_crypto() -> None:
+    """
+    Loads the bcrypt backend and the JWT signer, which both initialise on first use.
+    """
+    from jose import jwt
+
+    from src.services.auth import auth_service
+
+    auth_service.verify_password("warm-up", auth_service.get_password_hash("warm-up"))
+    token = auth_service.create_email_token({"sub": "warm-up@example.com"})
+    jwt.decode(token, auth_service.SECRET_KEY, algorithms=[auth_service.ALGORITHM])
+
+
+async def warm_up(engine: Engine, redis) -> dict:
+    """
+    Warms the database pool, checks Redis and primes the crypto backends, timing each step.
+
+    :param engine: The application's engine.
+    :type engine: Engine
+    :param redis: The application's Redis client.
+    :return: Seconds spent per step.
+    :rtype: dict
+    """
+    timings = {}
+    for name, step in (("db", lambda: asyncio.to_thread(warm_db_pool, engine)),
+                       ("redis", redis.ping),
+                       ("crypto", lambda: asyncio.to_thread(prime_crypto))):
+        started = time.perf_counter()
+        await step()
+        timings[name] = time.perf_counter() - started
+        warmup_seconds.set(timings[name], resource=name)
+    return timings
@@ -0,0 +1,239 @@
+"""
+Memory diagnostics for tracking down worker RSS growth: on-demand ``tracemalloc``
+snapshots and their diffs, live ORM objects per session identity map, and the memory
+sampled requests leave allocated.
+
+Everything is off unless ``MEMORY_DIAGNOSTICS`` is set: tracing is not started, the
+sampling middleware is not installed and the ``/ops/memory`` endpoints answer 404.
+Every worker process traces only itself.
+"""
+import gc
+import os
+import random
+import resource
+import time
+import tracemalloc
+from collections import OrderedDict, defaultdict
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from src.services.metrics import registry
+
+load_dotenv()
+
+MEMORY_DIAGNOSTICS = os.getenv('MEMORY_DIAGNOSTICS', '').lower() in ('1', 'true', 'yes')
+# frames kept per traced allocation; more frames give better tracebacks and cost more memory
+MEMORY_TRACE_FRAMES = int(os.getenv('MEMORY_TRACE_FRAMES', '10'))
+# snapshots kept per worker, the oldest is dropped first
+MEMORY_SNAPSHOTS = int(os.getenv('MEMORY_SNAPSHOTS', '5'))
+# share of requests whose allocation is measured
+MEMORY_SAMPLE_RATE = float(os.getenv('MEMORY_SAMPLE_RATE', '0.01'))
+
+# allocations of the profiler itself and of imports are noise in every diff
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+request_allocated = registry.histogram(
+    "request_allocated_bytes", "Traced memory still allocated after a sampled request, by route",
+    buckets=(0, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216),
+)
+
+
+def rss_bytes() -> int:
+    """
+    Returns the resident set size of this process, or its peak where the current one
+    cannot be read.
+
+    :return: Bytes.
+    :rtype: int
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _statistic(stat) -> dict:
+    frame = stat.traceback[0]
+    return {"location": f"{frame.filename}:{frame.lineno}", "size": stat.size, "count": stat.count}
+
+
+class MemoryProfiler:
+    """
+    Takes and compares ``tracemalloc`` snapshots and aggregates per-request allocation.
+
+    :param frames: Frames stored per traced allocation.
+    :type frames: int
+    :param max_snapshots: Snapshots kept, the oldest is dropped first.
+    :type max_snapshots: int
+    """
+
+    def __init__(self, frames: int = MEMORY_TRACE_FRAMES, max_snapshots: int = MEMORY_SNAPSHOTS):
+        self.frames = frames
+        self.max_snapshots = max_snapshots
+        self.snapshots = OrderedDict()
+        self.next_id = 1
+        self.requests = defaultdict(lambda: {"count": 0, "total_bytes": 0, "max_bytes": 0})
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    def stop(self) -> None:
+        tracemalloc.stop()
+        self.snapshots.clear()
+
+    def take_snapshot(self) -> dict:
+        """
+        Records a snapshot of the traced allocations.
+
+        :return: The snapshot id, when it was taken and the traced bytes.
+        :rtype: dict
+        """
+        snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+        snapshot_id = self.next_id
+        self.next_id += 1
+        self.snapshots[snapshot_id] = (time.time(), snapshot)
+        while len(self.snapshots) > self.max_snapshots:
+            self.snapshots.popitem(last=False)
+        return self.describe(snapshot_id)
+
+    def describe(self, snapshot_id: int) -> dict:
+        taken_at, snapshot = self.snapshots[snapshot_id]
+        return {"id": snapshot_id, "taken_at": taken_at,
+                "traced_bytes": sum(trace.size for trace in snapshot.traces)}
+
+    def top(self, snapshot_id: int, limit: int = 20, key_type: str = "lineno") -> list[dict]:
+        """
+        Returns the largest allocation sites of a snapshot.
+
+        :param snapshot_id: The snapshot.
+        :type snapshot_id: int
+        :param limit: Number of sites.
+        :type limit: int
+        :param key_type: ``lineno``, ``filename`` or ``traceback``.
+        :type key_type: str
+        :return: Location, bytes and number of blocks per site.
+        :rtype: list[dict]
+        :raises KeyError: If the snapshot was never taken or has been dropped.
+        """
+        _, snapshot = self.snapshots[snapshot_id]
+        return [_statistic(stat) for stat in snapshot.statistics(key_type)[:limit]]
+
+    def diff(self, base_id: int, current_id: int, limit: int = 20, key_type: str = "lineno") -> list[dict]:
+        """
+        Returns the allocation sites that grew the most between two snapshots.
+
+        :param base_id: The earlier snapshot.
+        :type base_id: int
+        :param current_id: The later snapshot.
+        :type current_id: int
+        :param limit: Number of sites.
+        :type limit: int
+        :param key_type: ``lineno``, ``filename`` or ``traceback``.
+        :type key_type: str
+        :return: Location, current bytes and blocks, and their growth per site.
+        :rtype: list[dict]
+        :raises KeyError: If either snapshot was never taken or has been dropped.
+        """
+        _, base = self.snapshots[base_id]
+        _, current = self.snapshots[current_id]
+        return [{**_statistic(stat), "size_diff": stat.size_diff, "count_diff": stat.count_diff}
+                for stat in current.compare_to(base, key_type)[:limit]]
+
+    def record_request(self, route: str, allocated: int) -> None:
+        stats = self.requests[route]
+        stats["count"] += 1
+        stats["total_bytes"] += allocated
+        stats["max_bytes"] = max(stats["max_bytes"], allocated)
+        request_allocated.observe(max(0, allocated), route=route)
+
+    def request_report(self) -> list[dict]:
+        """
+        Returns the memory sampled requests left allocated, per route, largest mean first.
+
+        Requests overlap on the event loop, so a single sample includes whatever concurrent
+        requests allocated meanwhile; the mean over many samples is what points at a leak.
+
+        :return: Route, samples, mean and largest bytes.
+        :rtype: list[dict]
+        """
+        report = [{"route": route, "samples": stats["count"], "mean_bytes": stats["total_bytes"] // stats["count"],
+                   "max_bytes": stats["max_bytes"]} for route, stats in self.requests.items()]
+        return sorted(report, key=lambda row: row["mean_bytes"], reverse=True)
+
+    def summary(self) -> dict:
+        current, peak = tracemalloc.get_traced_memory() if self.tracing else (0, 0)
+        return {
+            "tracing": self.tracing,
+            "rss_bytes": rss_bytes(),
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "gc_objects": len(gc.get_objects()),
+            "snapshots": [self.describe(snapshot_id) for snapshot_id in self.snapshots],
+        }
+
+
+memory_profiler = MemoryProfiler()
+
+
+def orm_objects() -> dict:
+    """
+    Counts the live sessions and the objects in their identity maps, per mapped class.
+
+    Sessions still inside a transaction while no request is running point at a session
+    that was not closed on some path.
+
+    :return: Sessions, sessions in a transaction and identity-map objects per class.
+    :rtype: dict
+    """
+    sessions = [obj for obj in gc.get_objects() if isinstance(obj, Session)]
+    objects = defaultdict(int)
+    for session in sessions:
+        for obj in session.identity_map.values():
+            objects[type(obj).__name__] += 1
+    return {
+        "sessions": len(sessions),
+        "in_transaction": sum(1 for session in sessions if session.in_transaction()),
+        "identity_map": dict(sorted(objects.items(), key=lambda item: item[1], reverse=True)),
+    }
+
+
+class AllocationSamplingMiddleware:
+    """
+    ASGI middleware that measures, for a sample of HTTP requests, how much traced memory
+    is still allocated when the response has been sent. Installed only when
+    ``MEMORY_DIAGNOSTICS`` is set.
+
+    :param rate: Share of requests sampled.
+    :type rate: float
+    :param profiler: Where the samples are aggregated.
+    :type profiler: MemoryProfiler
+    """
+
+    def __init__(self, app, rate: float = MEMORY_SAMPLE_RATE, profiler: MemoryProfiler = memory_profiler):
+        self.app = app
+        self.rate = rate
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.tracing or random.random() >= self.rate:
+            await self.app(scope, receive, send)
+            return
+        before, _ = tracemalloc.get_traced_memory()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            after, _ = tracemalloc.get_traced_memory()
+            route = scope.get("route")
+            self.profiler.record_request(f"{scope['method']} {getattr(route, 'path', 'unmatched')}", after - before)
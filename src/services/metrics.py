@@ -0,0 +1,168 @@
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _labels(labels: dict) -> tuple:
+        return tuple(sorted(labels.items()))
+
+    @staticmethod
+    def _format(name: str, labels: tuple, value) -> str:
+        if labels:
+            rendered = ",".join(f'{key}="{value}"' for key, value in labels)
+            name = f"{name}{{{rendered}}}"
+        return f"{name} {value}"
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+
+class Counter(_Metric):
+    """
+    A monotonically increasing value, optionally split by labels.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values = defaultdict(float)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        with self._lock:
+            self._values[self._labels(labels)] += amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._labels(labels), 0)
+
+    def samples(self) -> list[str]:
+        return [self._format(self.name, labels, value) for labels, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    """
+    A value that can go up and down.
+    """
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._labels(labels)] = value
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """
+    Observations counted into cumulative buckets, with their sum and count.
+    """
+    kind = "histogram"
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name: str, documentation: str, buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = defaultdict(lambda: [0] * (len(self.buckets) + 1))
+        self._sums = defaultdict(float)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._labels(labels)
+        with self._lock:
+            counts = self._counts[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._sums[key] += value
+
+    def count(self, **labels) -> int:
+        counts = self._counts.get(self._labels(labels))
+        return counts[-1] if counts else 0
+
+    def samples(self) -> list[str]:
+        lines = []
+        for labels, counts in sorted(self._counts.items()):
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                lines.append(self._format(f"{self.name}_bucket", (*labels, ("le", bound)), count))
+            lines.append(self._format(f"{self.name}_sum", labels, self._sums[labels]))
+            lines.append(self._format(f"{self.name}_count", labels, counts[-1]))
+        return lines
+
+
+class Registry:
+    """
+    In-process metrics of one worker, exposed in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def _get(self, cls, name, documentation, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, documentation, **kwargs)
+        return metric
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._get(Counter, name, documentation)
+
+    def gauge(self, name: str, documentation: str) -> Gauge:
+        return self._get(Gauge, name, documentation)
+
+    def histogram(self, name: str, documentation: str, **kwargs) -> Histogram:
+        return self._get(Histogram, name, documentation, **kwargs)
+
+    def render(self) -> str:
+        """
+        Renders every registered metric.
+
+        :return: The metrics in the Prometheus text exposition format.
+        :rtype: str
+        """
+        return "\n".join(line for metric in self._metrics.values() for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port: int, host: str = "0.0.0.0") -> HTTPServer:
+    """
+    Serves this process's metrics on a port of its own, from a daemon thread, for
+    Prometheus to scrape on the internal network without credentials.
+
+    :param port: The port, 0 for any free one.
+    :type port: int
+    :param host: The address to listen on.
+    :type host: str
+    :return: The running server.
+    :rtype: HTTPServer
+    """
+    server = HTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
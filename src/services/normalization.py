@@ -0,0 +1,103 @@
+import os
+import re
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# country calling code assumed for numbers written without one, e.g. "(555) 123-4567"
+DEFAULT_COUNTRY_CODE = os.getenv('PHONE_DEFAULT_COUNTRY_CODE', '1')
+
+_NON_DIGITS = re.compile(r"\D")
+
+_SOUNDEX_CODES = {
+    **dict.fromkeys("BFPV", "1"),
+    **dict.fromkeys("CGJKQSXZ", "2"),
+    **dict.fromkeys("DT", "3"),
+    "L": "4",
+    **dict.fromkeys("MN", "5"),
+    "R": "6",
+}
+
+
+def normalize_email(email: str | None) -> str | None:
+    """
+    Normalizes an email address for comparison.
+
+    :param email: The email as entered.
+    :type email: str, optional
+    :return: The trimmed, lowercased email, or None when empty.
+    :rtype: str | None
+    """
+    email = (email or "").strip().lower()
+    return email or None
+
+
+def normalize_phone(phone: str | None, country_code: str = DEFAULT_COUNTRY_CODE) -> str | None:
+    """
+    Normalizes a phone number to E.164 (``+<country code><number>``).
+
+    Numbers starting with ``+`` or the ``00`` international prefix keep their country
+    code; national numbers get ``country_code`` and lose the trunk prefix (a leading
+    ``0``, or a leading ``1`` on 11-digit NANP numbers).
+
+    :param phone: The phone number as entered, e.g. "+1 (555) 123-4567".
+    :type phone: str, optional
+    :param country_code: Calling code for national numbers.
+    :type country_code: str
+    :return: The E.164 number, or None when it contains no digits.
+    :rtype: str | None
+    """
+    phone = (phone or "").strip()
+    digits = _NON_DIGITS.sub("", phone)
+    if not digits:
+        return None
+    if phone.startswith("+"):
+        return "+" + digits
+    if digits.startswith("00"):
+        return "+" + digits[2:]
+    if country_code == "1" and len(digits) == 11 and digits.startswith("1"):
+        digits = digits[1:]
+    elif country_code != "1" and digits.startswith("0"):
+        digits = digits[1:]
+    return "+" + country_code + digits
+
+
+def soundex(name: str | None) -> str:
+    """
+    Returns the American Soundex code of a name, so that spelling variants such as
+    "Smith" and "Smyth" share a key.
+
+    :param name: The name to encode.
+    :type name: str, optional
+    :return: A four character code like "S530", or an empty string for empty names.
+    :rtype: str
+    """
+    letters = [c for c in (name or "").upper() if "A" <= c <= "Z"]
+    if not letters:
+        return ""
+    code = letters[0]
+    previous = _SOUNDEX_CODES.get(letters[0], "")
+    for letter in letters[1:]:
+        digit = _SOUNDEX_CODES.get(letter, "")
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        if letter not in "HW":
+            previous = digit
+    return code.ljust(4, "0")
+
+
+def normalized_fields(email: str | None, phone_number: str | None) -> dict:
+    """
+    Returns the normalized key columns of a contact.
+
+    :param email: The contact's email.
+    :type email: str, optional
+    :param phone_number: The contact's phone number.
+    :type phone_number: str, optional
+    :return: ``email_normalized`` and ``phone_normalized`` values.
+    :rtype: dict
+    """
+    return {"email_normalized": normalize_email(email), "phone_normalized": normalize_phone(phone_number)}
@@ -0,0 +1,330 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable
+
+from dotenv import load_dotenv
+from redis.exceptions import ResponseError
+
+from src.db.db import SessionLocal
+from src.services import tracing
+from src.services.metrics import registry
+
+load_dotenv()
+
+JOB_CONCURRENCY = int(os.getenv('JOB_CONCURRENCY', '8'))
+JOB_MAX_RETRIES = int(os.getenv('JOB_MAX_RETRIES', '5'))
+# base of the exponential retry backoff, in seconds
+JOB_RETRY_BACKOFF = float(os.getenv('JOB_RETRY_BACKOFF', '2'))
+# a job claimed by a worker that has not acknowledged it for this long is handed to another worker
+JOB_VISIBILITY_TIMEOUT = int(os.getenv('JOB_VISIBILITY_TIMEOUT_MS', '300000'))
+# how long enqueue() remembers a dedupe key, in seconds
+JOB_DEDUPE_TTL = int(os.getenv('JOB_DEDUPE_TTL', '172800'))
+
+jobs_total = registry.counter("jobs_total", "Finished job attempts, by job name and outcome")
+job_latency = registry.histogram("job_latency_seconds", "Time from enqueue to the start of the attempt")
+job_duration = registry.histogram("job_duration_seconds", "Run time of job attempts")
+
+
+@dataclass
+class Job:
+    """
+    A unit of background work: the name of a registered task and its JSON payload.
+    """
+    name: str
+    payload: dict
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    attempts: int = 0
+    enqueued_at: float = field(default_factory=time.time)
+    # W3C trace context of the request that queued the job
+    trace: dict = field(default_factory=dict)
+
+    def dumps(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def loads(cls, data: str) -> "Job":
+        return cls(**json.loads(data))
+
+
+class InMemoryBroker:
+    """
+    Broker that keeps jobs in process memory. Used in tests and for local development;
+    jobs do not survive a restart.
+    """
+
+    def __init__(self):
+        self.jobs: deque[tuple[str, Job]] = deque()
+        self.delayed: list[tuple[float, Job]] = []
+        self.dead: list[tuple[Job, str]] = []
+        self.pending: dict[str, Job] = {}
+        self.claimed: set[str] = set()
+
+    async def claim(self, key: str, ttl: int) -> bool:
+        if key in self.claimed:
+            return False
+        self.claimed.add(key)
+        return True
+
+    async def enqueue(self, job: Job) -> str:
+        message_id = uuid.uuid4().hex
+        self.jobs.append((message_id, job))
+        return message_id
+
+    async def fetch(self, consumer: str, count: int, block_ms: int = 0) -> list[tuple[str, Job]]:
+        await self.promote_due()
+        batch = []
+        while self.jobs and len(batch) < count:
+            message_id, job = self.jobs.popleft()
+            self.pending[message_id] = job
+            batch.append((message_id, job))
+        if not batch and block_ms:
+            await asyncio.sleep(block_ms / 1000)
+        return batch
+
+    async def ack(self, message_id: str) -> None:
+        self.pending.pop(message_id, None)
+
+    async def retry(self, message_id: str, job: Job, delay: float) -> None:
+        self.delayed.append((time.time() + delay, job))
+        await self.ack(message_id)
+
+    async def dead_letter(self, message_id: str, job: Job, error: str) -> None:
+        self.dead.append((job, error))
+        await self.ack(message_id)
+
+    async def promote_due(self) -> None:
+        now = time.time()
+        due = [job for when, job in self.delayed if when <= now]
+        self.delayed = [(when, job) for when, job in self.delayed if when > now]
+        for job in due:
+            await self.enqueue(job)
+
+    async def size(self) -> int:
+        return len(self.jobs) + len(self.delayed) + len(self.pending)
+
+
+class RedisStreamBroker:
+    """
+    Broker on a Redis stream with a consumer group.
+
+    Jobs are ``XADD``-ed to the stream and claimed with ``XREADGROUP``; a job stays in
+    the group's pending list until the worker acknowledges it, so a crashed worker's jobs
+    are reclaimed by another worker with ``XAUTOCLAIM`` after the visibility timeout.
+    Retries wait in a sorted set keyed by due time; exhausted jobs go to a dead-letter stream.
+    """
+
+    def __init__(self, redis, stream: str = "jobs", group: str = "workers",
+                 visibility_timeout_ms: int = JOB_VISIBILITY_TIMEOUT):
+        self.redis = redis
+        self.stream = stream
+        self.group = group
+        self.delayed_key = f"{stream}:delayed"
+        self.dead_stream = f"{stream}:dead"
+        self.visibility_timeout_ms = visibility_timeout_ms
+        self._group_ready = False
+
+    async def _ensure_group(self) -> None:
+        if self._group_ready:
+            return
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as err:
+            if "BUSYGROUP" not in str(err):
+                raise
+        self._group_ready = True
+
+    async def claim(self, key: str, ttl: int) -> bool:
+        return bool(await self.redis.set(f"{self.stream}:once:{key}", 1, nx=True, ex=ttl))
+
+    async def enqueue(self, job: Job) -> str:
+        return await self.redis.xadd(self.stream, {"job": job.dumps()})
+
+    async def fetch(self, consumer: str, count: int, block_ms: int = 1000) -> list[tuple[str, Job]]:
+        await self._ensure_group()
+        await self.promote_due()
+        _, claimed, _ = await self.redis.xautoclaim(
+            self.stream, self.group, consumer, min_idle_time=self.visibility_timeout_ms, start_id="0-0", count=count
+        )
+        messages = list(claimed)
+        if len(messages) < count:
+            response = await self.redis.xreadgroup(
+                self.group, consumer, {self.stream: ">"}, count=count - len(messages), block=block_ms
+            )
+            for _, entries in response or []:
+                messages.extend(entries)
+        return [(message_id, Job.loads(fields["job"])) for message_id, fields in messages if fields]
+
+    async def ack(self, message_id: str) -> None:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xack(self.stream, self.group, message_id)
+            pipe.xdel(self.stream, message_id)
+            await pipe.execute()
+
+    async def retry(self, message_id: str, job: Job, delay: float) -> None:
+        await self.redis.zadd(self.delayed_key, {job.dumps(): time.time() + delay})
+        await self.ack(message_id)
+
+    async def dead_letter(self, message_id: str, job: Job, error: str) -> None:
+        await self.redis.xadd(self.dead_stream, {"job": job.dumps(), "error": error})
+        await self.ack(message_id)
+
+    async def promote_due(self) -> None:
+        for data in await self.redis.zrangebyscore(self.delayed_key, "-inf", time.time(), start=0, num=100):
+            # only the worker that removes the entry re-enqueues it
+            if await self.redis.zrem(self.delayed_key, data):
+                await self.redis.xadd(self.stream, {"job": data})
+
+    async def size(self) -> int:
+        return await self.redis.xlen(self.stream) + await self.redis.zcard(self.delayed_key)
+
+
+class JobQueue:
+    """
+    Registry of task functions and the entry point for enqueueing jobs.
+
+    Tasks are async functions registered with :meth:`task` and receive the job payload
+    as keyword arguments. The broker defaults to :class:`InMemoryBroker` and is replaced
+    by :class:`RedisStreamBroker` at application and worker startup.
+    """
+
+    def __init__(self, broker=None):
+        self.broker = broker or InMemoryBroker()
+        self.tasks: dict[str, Callable[..., Awaitable]] = {}
+        self.session_factory = SessionLocal
+
+    def use(self, broker) -> None:
+        self.broker = broker
+
+    def task(self, name: str):
+        def register(fn):
+            self.tasks[name] = fn
+            return fn
+        return register
+
+    async def enqueue(self, name: str, *, dedupe_key: str | None = None, dedupe_ttl: int = JOB_DEDUPE_TTL,
+                      **payload) -> str | None:
+        """
+        Queues a job for a registered task.
+
+        :param name: The task name.
+        :type name: str
+        :param dedupe_key: When given, the job is only queued if no job with the same key
+            was queued within ``dedupe_ttl`` seconds.
+        :type dedupe_key: str, optional
+        :param dedupe_ttl: How long a dedupe key is remembered, in seconds.
+        :type dedupe_ttl: int
+        :param payload: JSON-serialisable keyword arguments of the task.
+        :return: The job id, or None if the job was a duplicate.
+        :rtype: str | None
+        """
+        if dedupe_key is not None and not await self.broker.claim(f"{name}:{dedupe_key}", dedupe_ttl):
+            return None
+        job = Job(name=name, payload=payload, trace=tracing.inject())
+        await self.broker.enqueue(job)
+        return job.id
+
+    @contextmanager
+    def session(self):
+        """
+        Opens a database session for a task.
+        """
+        db = self.session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+
+class Worker:
+    """
+    Runs jobs from the queue's broker with bounded concurrency, retrying failures with
+    exponential backoff and dead-lettering jobs that exhaust their retries.
+    """
+
+    def __init__(self, queue: JobQueue, concurrency: int = JOB_CONCURRENCY, max_retries: int = JOB_MAX_RETRIES,
+                 consumer: str | None = None):
+        self.queue = queue
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.consumer = consumer or f"worker-{uuid.uuid4().hex[:8]}"
+        self._slots = asyncio.Semaphore(concurrency)
+        self._running: set[asyncio.Task] = set()
+
+    async def execute(self, message_id: str, job: Job) -> None:
+        broker = self.queue.broker
+        task = self.queue.tasks.get(job.name)
+        started = time.time()
+        job_latency.observe(max(0.0, started - job.enqueued_at), job=job.name)
+        try:
+            if task is None:
+                raise LookupError(f"Unknown task '{job.name}'")
+            with tracing.job_span(job.name, job.trace):
+                await task(**job.payload)
+        except Exception as err:
+            job.attempts += 1
+            error = f"{type(err).__name__}: {err}"
+            if task is None or job.attempts > self.max_retries:
+                jobs_total.inc(job=job.name, outcome="dead")
+                await broker.dead_letter(message_id, job, error)
+            else:
+                jobs_total.inc(job=job.name, outcome="retry")
+                await broker.retry(message_id, job, JOB_RETRY_BACKOFF ** job.attempts)
+        else:
+            jobs_total.inc(job=job.name, outcome="ok")
+            await broker.ack(message_id)
+        finally:
+            job_duration.observe(time.time() - started, job=job.name)
+
+    async def _run_one(self, message_id: str, job: Job) -> None:
+        try:
+            await self.execute(message_id, job)
+        finally:
+            self._slots.release()
+
+    async def run(self, stop: asyncio.Event | None = None) -> None:
+        """
+        Fetches and runs jobs until ``stop`` is set, then waits for running jobs.
+
+        :param stop: Event that ends the loop.
+        :type stop: asyncio.Event, optional
+        """
+        stop = stop or asyncio.Event()
+        while not stop.is_set():
+            await self._slots.acquire()
+            free = 1
+            # take as many jobs as there are free slots in one round-trip
+            while free < self.concurrency and not self._slots.locked():
+                await self._slots.acquire()
+                free += 1
+            batch = await self.queue.broker.fetch(self.consumer, free, block_ms=1000)
+            for message_id, job in batch:
+                task = asyncio.create_task(self._run_one(message_id, job))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+            for _ in range(free - len(batch)):
+                self._slots.release()
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def drain(self) -> int:
+        """
+        Runs queued jobs one by one until none are ready, for tests and scripts.
+
+        :return: The number of executed attempts.
+        :rtype: int
+        """
+        executed = 0
+        while batch := await self.queue.broker.fetch(self.consumer, self.concurrency, block_ms=0):
+            for message_id, job in batch:
+                await self.execute(message_id, job)
+                executed += 1
+        return executed
+
+
+job_queue = JobQueue()
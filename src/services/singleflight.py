@@ -0,0 +1,71 @@
+import asyncio
+import os
+from typing import Callable, Hashable
+
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+from src.services.metrics import registry
+
+load_dotenv()
+
+# comma separated flight groups that collapse duplicate reads, empty disables single-flight
+SINGLEFLIGHT_SCOPE = {group.strip() for group in os.getenv('SINGLEFLIGHT_SCOPE', 'users,contacts').split(',')
+                      if group.strip()}
+
+calls_total = registry.counter(
+    "singleflight_calls_total", "Reads routed through single-flight, by group and outcome (executed or collapsed)"
+)
+
+
+class SingleFlight:
+    """
+    Collapses identical concurrent reads into one execution.
+
+    The first caller for a key runs the blocking function in the threadpool; callers
+    that arrive with the same key while it is in flight await the same result instead
+    of issuing their own query. Nothing is cached: once the call finishes, the next
+    caller executes again.
+
+    Keys must contain everything the result depends on, including the user id.
+    Shared results must not be mutated and must not be bound to a session.
+    """
+
+    def __init__(self, group: str, enabled: bool | None = None):
+        self.group = group
+        self.enabled = group in SINGLEFLIGHT_SCOPE if enabled is None else enabled
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable, *args):
+        """
+        Runs ``fn(*args)`` in the threadpool, or joins an identical call in flight.
+
+        :param key: The request signature.
+        :type key: Hashable
+        :param fn: A blocking function that performs the read.
+        :type fn: Callable
+        :return: The result of ``fn``.
+        """
+        if not self.enabled:
+            return await run_in_threadpool(fn, *args)
+
+        task = self._calls.get(key)
+        if task is None:
+            # the work runs as its own task, so a caller that disconnects does not cancel it for the others
+            task = asyncio.ensure_future(run_in_threadpool(fn, *args))
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            calls_total.inc(group=self.group, outcome="executed")
+        else:
+            calls_total.inc(group=self.group, outcome="collapsed")
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # mark the exception as retrieved when every waiter has gone away
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,347 @@
+"""
+OpenTelemetry tracing: spans for HTTP requests, SQL statements, Redis commands, password
+hashing, JWT signing, Cloudinary uploads and email delivery, carried into queued jobs.
+
+Off unless ``TRACING_ENABLED`` is set and ``opentelemetry-sdk`` is installed; the OTLP
+exporter also needs ``opentelemetry-exporter-otlp-proto-http``. While off, :func:`span`
+and :func:`traced` do nothing and no listener or middleware is installed.
+
+Every span is recorded, and :class:`TailSamplingProcessor` decides per trace, once its
+local root span has ended, whether to export it: traces with an error or slower than
+``TRACING_SLOW_MS`` always, the rest at ``TRACING_SAMPLE_RATE``.
+"""
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+from dotenv import load_dotenv
+
+try:
+    from opentelemetry import propagate, trace
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+except ImportError:  # optional, tracing stays off without it
+    propagate = trace = None
+
+try:
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+    from opentelemetry.sdk.trace.sampling import ALWAYS_ON
+except ImportError:  # optional, tracing stays off without it
+    TracerProvider = None
+    SpanExporter = object
+
+try:
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+except ImportError:  # optional, only the file exporter is available without it
+    OTLPSpanExporter = None
+
+load_dotenv()
+
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', '').lower() in ('1', 'true', 'yes')
+# "otlp" sends to OTEL_EXPORTER_OTLP_ENDPOINT (a local collector by default), "file" writes
+# one JSON span per line to TRACING_FILE
+TRACING_EXPORTER = os.getenv('TRACING_EXPORTER', 'otlp')
+TRACING_FILE = os.getenv('TRACING_FILE', 'traces.jsonl')
+# traces at least this slow are always exported, as are traces with an error
+TRACING_SLOW_MS = float(os.getenv('TRACING_SLOW_MS', '500'))
+# share of the remaining traces that is exported
+TRACING_SAMPLE_RATE = float(os.getenv('TRACING_SAMPLE_RATE', '0.05'))
+# unfinished traces buffered per process; the oldest are dropped beyond it
+TRACING_BUFFER_TRACES = int(os.getenv('TRACING_BUFFER_TRACES', '10000'))
+# SQL text kept on a statement span
+TRACING_STATEMENT_CHARS = 2000
+
+logger = logging.getLogger(__name__)
+
+# the active tracer, None while tracing is off
+tracer = None
+
+
+def span(name: str, kind=None, context=None, **attributes):
+    """
+    Returns a context manager that runs its block in a span, or does nothing while
+    tracing is off.
+
+    :param name: The span name.
+    :type name: str
+    :param kind: The OpenTelemetry span kind, internal by default.
+    :param context: Parent context, the current one by default.
+    :param attributes: Span attributes.
+    """
+    if tracer is None:
+        return nullcontext()
+    return tracer.start_as_current_span(name, context=context, kind=kind or SpanKind.INTERNAL,
+                                        attributes=attributes)
+
+
+def traced(name: str):
+    """
+    Decorator that runs a function, sync or async, in a span named ``name``.
+
+    :param name: The span name.
+    :type name: str
+    """
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def inject() -> dict:
+    """
+    Returns the current trace context as W3C headers, for carrying it into a job.
+
+    :return: ``traceparent`` and ``tracestate``, empty while tracing is off.
+    :rtype: dict
+    """
+    carrier = {}
+    if tracer is not None:
+        propagate.inject(carrier)
+    return carrier
+
+
+def extract(carrier: dict):
+    """
+    Returns the trace context stored by :func:`inject`.
+
+    :param carrier: The stored headers.
+    :type carrier: dict
+    :return: An OpenTelemetry context, None while tracing is off.
+    """
+    if tracer is None or not carrier:
+        return None
+    return propagate.extract(carrier)
+
+
+class TailSamplingProcessor:
+    """
+    Span processor that buffers the spans of each trace and, when the local root span
+    ends, passes the whole trace on to ``delegate`` or drops it.
+
+    A trace is kept if any span has an error or the root took at least ``slow_ms``,
+    otherwise with probability ``rate``.
+
+    :param delegate: The processor that exports kept spans.
+    :param slow_ms: Root span duration from which a trace is always kept.
+    :type slow_ms: float
+    :param rate: Probability of keeping any other trace.
+    :type rate: float
+    :param max_traces: Unfinished traces buffered; the oldest are dropped beyond it.
+    :type max_traces: int
+    """
+
+    def __init__(self, delegate, slow_ms: float = TRACING_SLOW_MS, rate: float = TRACING_SAMPLE_RATE,
+                 max_traces: int = TRACING_BUFFER_TRACES):
+        self.delegate = delegate
+        self.slow_ms = slow_ms
+        self.rate = rate
+        self.max_traces = max_traces
+        self.traces = OrderedDict()
+        self.lock = threading.Lock()
+
+    def on_start(self, span, parent_context=None) -> None:
+        pass
+
+    def on_end(self, span) -> None:
+        trace_id = span.context.trace_id
+        # the local root: no parent, or a parent in another process (the caller or the enqueuer)
+        is_root = span.parent is None or span.parent.is_remote
+        with self.lock:
+            spans = self.traces.pop(trace_id, [])
+            spans.append(span)
+            if not is_root:
+                self.traces[trace_id] = spans
+                while len(self.traces) > self.max_traces:
+                    self.traces.popitem(last=False)
+                return
+        if self.keep(span, spans):
+            for finished in spans:
+                self.delegate.on_end(finished)
+
+    def keep(self, root, spans: list) -> bool:
+        if any(finished.status.status_code == StatusCode.ERROR for finished in spans):
+            return True
+        if (root.end_time - root.start_time) / 1_000_000 >= self.slow_ms:
+            return True
+        return random.random() < self.rate
+
+    def shutdown(self) -> None:
+        self.delegate.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.delegate.force_flush(timeout_millis)
+
+
+class FileSpanExporter(SpanExporter):
+    """
+    Writes every exported span as one JSON line, for tests and local debugging.
+
+    :param path: The file spans are appended to.
+    :type path: str
+    """
+
+    def __init__(self, path: str = TRACING_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def export(self, spans):
+        with self.lock, open(self.path, "a") as file:
+            for finished in spans:
+                file.write(json.dumps(json.loads(finished.to_json())) + "\n")
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+
+def configure_tracing(service_name: str, exporter=None) -> bool:
+    """
+    Installs the tracer provider with tail sampling, when tracing is enabled and the SDK
+    is installed.
+
+    :param service_name: Reported as ``service.name`` unless ``OTEL_SERVICE_NAME`` is set.
+    :type service_name: str
+    :param exporter: Span exporter to use instead of the configured one.
+    :return: True if tracing is on.
+    :rtype: bool
+    """
+    global tracer
+    if not TRACING_ENABLED and exporter is None:
+        return False
+    if TracerProvider is None:
+        logger.warning("tracing: TRACING_ENABLED is set but opentelemetry-sdk is not installed")
+        return False
+    if exporter is None:
+        if TRACING_EXPORTER == "otlp" and OTLPSpanExporter is not None:
+            exporter = OTLPSpanExporter()
+        else:
+            exporter = FileSpanExporter()
+    resource = Resource.create({"service.name": os.getenv('OTEL_SERVICE_NAME', service_name)})
+    # every span is recorded, the tail sampler decides what is exported
+    provider = TracerProvider(resource=resource, sampler=ALWAYS_ON)
+    provider.add_span_processor(TailSamplingProcessor(BatchSpanProcessor(exporter)))
+    trace.set_tracer_provider(provider)
+    tracer = trace.get_tracer("contacts")
+    return True
+
+
+def instrument_engine(engine) -> None:
+    """
+    Records a client span for every SQL statement the engine runs.
+
+    :param engine: The SQLAlchemy engine.
+    """
+    if tracer is None:
+        return
+    from sqlalchemy import event
+
+    system = engine.dialect.name
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_statement(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._span = tracer.start_span(
+                f"db {statement.split(None, 1)[0].upper() if statement else 'statement'}", kind=SpanKind.CLIENT,
+                attributes={"db.system": system, "db.statement": statement[:TRACING_STATEMENT_CHARS]},
+            )
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_statement(conn, cursor, statement, parameters, context, executemany):
+        statement_span = getattr(context, "_span", None)
+        if statement_span is not None:
+            statement_span.end()
+
+    @event.listens_for(engine, "handle_error")
+    def fail_statement(exception_context):
+        statement_span = getattr(exception_context.execution_context, "_span", None)
+        if statement_span is not None:
+            statement_span.record_exception(exception_context.original_exception)
+            statement_span.set_status(Status(StatusCode.ERROR))
+            statement_span.end()
+
+
+def instrument_redis(client) -> None:
+    """
+    Records a client span for every command sent through the Redis client, such as the
+    rate limiter's scripts and the job queue's stream commands.
+
+    :param client: A ``redis.asyncio.Redis`` client.
+    """
+    if tracer is None:
+        return
+    execute_command = client.execute_command
+
+    @functools.wraps(execute_command)
+    async def traced_command(*args, **options):
+        with span(f"redis {args[0]}", kind=SpanKind.CLIENT, **{"db.system": "redis"}):
+            return await execute_command(*args, **options)
+
+    client.execute_command = traced_command
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that runs each HTTP request in a server span, continuing the trace
+    of an incoming ``traceparent`` header. The span is named after the matched route.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or tracer is None:
+            await self.app(scope, receive, send)
+            return
+        headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope.get("headers", [])}
+        method = scope["method"]
+        attributes = {"http.method": method, "http.target": scope["path"]}
+        with tracer.start_as_current_span(method, context=propagate.extract(headers), kind=SpanKind.SERVER,
+                                          attributes=attributes) as request_span:
+            async def traced_send(message):
+                if message["type"] == "http.response.start":
+                    request_span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        request_span.set_status(Status(StatusCode.ERROR))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, traced_send)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    request_span.update_name(f"{method} {route.path}")
+                    request_span.set_attribute("http.route", route.path)
+
+
+@contextmanager
+def job_span(name: str, carrier: dict):
+    """
+    Runs a job in a consumer span that continues the trace it was enqueued from.
+
+    :param name: The task name.
+    :type name: str
+    :param carrier: The trace context stored with the job.
+    :type carrier: dict
+    """
+    if tracer is None:
+        yield None
+        return
+    with span(f"job {name}", kind=SpanKind.CONSUMER, context=extract(carrier), **{"job.name": name}) as job:
+        yield job
@@ -1,50 +1,176 @@
+import os
+
+# settings the application reads at import time; tests never touch a real database,
+# Redis, SMTP server or Cloudinary account
+os.environ["DATABASE_URL"] = "sqlite://"
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("JWT_ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "15")
+os.environ.setdefault("REFRESH_TOKEN_EXPIRE_DAYS", "7")
+os.environ.setdefault("MAIL_USERNAME", "test@example.com")
+os.environ.setdefault("MAIL_PASSWORD", "test")
+os.environ.setdefault("MAIL_FROM", "test@example.com")
+os.environ.setdefault("MAIL_PORT", "465")
+os.environ.setdefault("MAIL_SERVER", "localhost")
+os.environ.setdefault("CLOUDINARY_NAME", "test")
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import fakeredis
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
 from main import app
-from src.db.models import Base
+from src.db.models import Base, User
 from src.db.db import get_db
+from src.services.auth import auth_service
+from src.services.invalidation import invalidation_bus
+from src.services.queue import InMemoryBroker, Worker, job_queue
+import src.jobs.tasks  # noqa: F401  registers the tasks
 
+# bcrypt at its production cost dominates the suite, tests only need a valid hash
+auth_service.pwd_context.update(bcrypt__rounds=4)
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+@pytest.fixture(scope="session")
+def engine():
+    # one in-memory database per process, so every xdist worker gets its own
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
 
+    # let SQLAlchemy drive BEGIN/SAVEPOINT instead of pysqlite, which breaks nested transactions
+    @event.listens_for(engine, "connect")
+    def do_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
 
-@pytest.fixture(scope="module")
-def session():
-    # Create the database
+    @event.listens_for(engine, "begin")
+    def do_begin(conn):
+        conn.exec_driver_sql("BEGIN")
 
-    Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
 
-    db = TestingSessionLocal()
+
+@pytest.fixture()
+def session(engine):
+    # every test runs inside a transaction that is rolled back afterwards; commits made
+    # by the application only release a SAVEPOINT
+    connection = engine.connect()
+    transaction = connection.begin()
+    db = sessionmaker(autocommit=False, autoflush=False)(
+        bind=connection, join_transaction_mode="create_savepoint"
+    )
     try:
         yield db
     finally:
         db.close()
+        transaction.rollback()
+        connection.close()
+
+
+@pytest.fixture()
+def queries(engine):
+    """
+    Records the SQL statements the test runs, without transaction control statements.
+    """
+    statements = []
 
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith(("SAVEPOINT", "RELEASE", "ROLLBACK", "BEGIN", "COMMIT")):
+            statements.append(" ".join(statement.split()))
 
-@pytest.fixture(scope="module")
-def client(session):
+    event.listen(engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(engine, "before_cursor_execute", record)
+
+
+@pytest.fixture()
+def redis_client():
+    return fakeredis.FakeAsyncRedis(decode_responses=True)
+
+
+@pytest.fixture()
+def client(session, redis_client, monkeypatch):
     # Dependency override
 
     def override_get_db():
-        try:
-            yield session
-        finally:
-            session.close()
+        # per-request state such as the deadline must not leak into the next request
+        session.info.clear()
+        yield session
 
+    monkeypatch.setattr("main.redis.Redis", lambda *args, **kwargs: redis_client)
     app.dependency_overrides[get_db] = override_get_db
+    # users cached by an earlier test are rows its rolled back transaction created
+    invalidation_bus.flush()
+    with TestClient(app) as test_client:
+        # startup wires the Redis broker, jobs stay in memory until a test runs them
+        job_queue.use(InMemoryBroker())
+        yield test_client
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture()
+def run_jobs(session, monkeypatch):
+    """
+    Runs the queued jobs in the test's transaction and returns the dead-lettered ones.
+    """
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=session.get_bind(),
+                           join_transaction_mode="create_savepoint")
+    monkeypatch.setattr(job_queue, "session_factory", factory)
 
-    yield TestClient(app)
+    def run():
+        asyncio.run(Worker(job_queue, max_retries=0).drain())
+        session.expire_all()
+        return job_queue.broker.dead
 
+    return run
 
-@pytest.fixture(scope="module")
+
+@pytest.fixture(autouse=True)
+def mock_send_email(monkeypatch):
+    mock = AsyncMock()
+    monkeypatch.setattr("src.jobs.tasks.deliver_email", mock)
+    return mock
+
+
+@pytest.fixture(autouse=True)
+def mock_cloudinary(monkeypatch):
+    mock = MagicMock(return_value={"version": 1})
+    monkeypatch.setattr("cloudinary.uploader.upload", mock)
+    return mock
+
+
+@pytest.fixture(scope="session")
 def user():
     return {"username": "deadpool", "email": "deadpool@example.com", "password": "123456789"}
+
+
+@pytest.fixture()
+def registered_user(client, user):
+    response = client.post("/auth/signup", json=user)
+    assert response.status_code == 201, response.text
+    return response.json()["user"]
+
+
+@pytest.fixture()
+def confirmed_user(session, registered_user, user):
+    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
+    current_user.confirmed = True
+    session.commit()
+    return current_user
+
+
+@pytest.fixture()
+def token(client, confirmed_user, user):
+    response = client.post(
+        "/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["access_token"]
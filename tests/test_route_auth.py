@@ -1,24 +1,24 @@
-from unittest.mock import MagicMock
+from src.db.models import User
+from src.services.auth import auth_service
 
-from src.database.models import User
 
-
-def test_create_user(client, user, monkeypatch):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+def test_create_user(client, user, mock_send_email, run_jobs):
     response = client.post(
-        "/api/auth/signup",
+        "/auth/signup",
         json=user,
     )
     assert response.status_code == 201, response.text
     data = response.json()
     assert data["user"]["email"] == user.get("email")
     assert "id" in data["user"]
+    mock_send_email.assert_not_called()
+    assert run_jobs() == []
+    mock_send_email.assert_called_once()
 
 
-def test_repeat_create_user(client, user):
+def test_repeat_create_user(client, user, registered_user):
     response = client.post(
-        "/api/auth/signup",
+        "/auth/signup",
         json=user,
     )
     assert response.status_code == 409, response.text
@@ -26,9 +26,9 @@ def test_repeat_create_user(client, user):
     assert data["detail"] == "Account already exists"
 
 
-def test_login_user_not_confirmed(client, user):
+def test_login_user_not_confirmed(client, user, registered_user):
     response = client.post(
-        "/api/auth/login",
+        "/auth/login",
         data={"username": user.get('email'), "password": user.get('password')},
     )
     assert response.status_code == 401, response.text
@@ -36,12 +36,12 @@ def test_login_user_not_confirmed(client, user):
     assert data["detail"] == "Email not confirmed"
 
 
-def test_login_user(client, session, user):
+def test_login_user(client, session, user, registered_user):
     current_user: User = session.query(User).filter(User.email == user.get('email')).first()
     current_user.confirmed = True
     session.commit()
     response = client.post(
-        "/api/auth/login",
+        "/auth/login",
         data={"username": user.get('email'), "password": user.get('password')},
     )
     assert response.status_code == 200, response.text
@@ -49,9 +49,9 @@ def test_login_user(client, session, user):
     assert data["token_type"] == "bearer"
 
 
-def test_login_wrong_password(client, user):
+def test_login_wrong_password(client, user, confirmed_user):
     response = client.post(
-        "/api/auth/login",
+        "/auth/login",
         data={"username": user.get('email'), "password": 'password'},
     )
     assert response.status_code == 401, response.text
@@ -61,9 +61,51 @@ def test_login_wrong_password(client, user):
 
 def test_login_wrong_email(client, user):
     response = client.post(
-        "/api/auth/login",
+        "/auth/login",
         data={"username": 'email', "password": user.get('password')},
     )
     assert response.status_code == 401, response.text
     data = response.json()
     assert data["detail"] == "Invalid email"
+
+
+def test_tests_are_isolated(client, session, user):
+    # the user created by other tests was rolled back with their transaction
+    assert session.query(User).filter(User.email == user.get('email')).first() is None
+
+
+def test_signup_retry_is_replayed(client, user, mock_send_email, run_jobs, monkeypatch):
+    hashes = []
+    original = auth_service.get_password_hash
+    monkeypatch.setattr(auth_service, "get_password_hash", lambda password: hashes.append(1) or original(password))
+    headers = {"Idempotency-Key": "signup-1"}
+
+    first = client.post("/auth/signup", json=user, headers=headers)
+    retry = client.post("/auth/signup", json=user, headers=headers)
+    assert first.status_code == retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert len(hashes) == 1
+    run_jobs()
+    mock_send_email.assert_called_once()
+
+
+def test_signup_and_confirmation_statement_budget(client, user, queries, monkeypatch):
+    # the shard directory allocates the id, then the user is inserted
+    queries.clear()
+    assert client.post("/auth/signup", json=user).status_code == 201
+    assert len(queries) == 2 and queries[0].startswith("INSERT INTO shard_directory"), queries
+    assert queries[1].startswith("INSERT INTO users"), queries
+
+    queries.clear()
+    assert client.post("/auth/signup", json=user).status_code == 409
+    assert len(queries) == 2, queries
+
+    async def email_from_token(token):
+        return user["email"]
+
+    monkeypatch.setattr(auth_service, "get_email_from_token", email_from_token)
+    queries.clear()
+    assert client.get("/auth/confirmed_email/token").json() == {"message": "Email confirmed"}
+    assert len(queries) == 1 and queries[0].startswith("UPDATE users"), queries
+    assert client.get("/auth/confirmed_email/token").json() == {"message": "Your email is already confirmed"}
@@ -1,23 +1,23 @@
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 import pytest
+from sqlalchemy import select
 from src.db.models import Contact, User
-from src.schemas import ContactCreate
-from datetime import datetime, timedelta
+
+CONTACT = {
+    "first_name": "John",
+    "last_name": "Doe",
+    "email": "john.doe@example.com",
+    "phone_number": "+123456789",
+    "birthday": "1990-01-01",
+    "additional_info": "Friend"
+}
+
 
 @pytest.fixture()
-def token(client, user, session, monkeypatch):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
-    client.post("/api/auth/signup", json=user)
-    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
-    current_user.confirmed = True
-    session.commit()
-    response = client.post(
-        "/api/auth/login",
-        data={"username": user.get('email'), "password": user.get('password')},
-    )
-    data = response.json()
-    return data["access_token"]
+def contact(client, token):
+    response = client.post("/contact/contacts", json=CONTACT, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 201, response.text
+    return response.json()
 
 def test_create_contact(client, token):
     contact_data = {
@@ -31,7 +31,7 @@ def test_create_contact(client, token):
     
     with patch('src.services.auth.auth_service.get_current_user', return_value=User(id=1)):
         response = client.post(
-            "/api/contact/contacts",
+            "/contact/contacts",
             json=contact_data,
             headers={"Authorization": f"Bearer {token}"}
         )
@@ -41,10 +41,10 @@ def test_create_contact(client, token):
         assert data["last_name"] == contact_data["last_name"]
         assert "id" in data
 
-def test_read_contacts(client, token):
+def test_read_contacts(client, token, contact):
     with patch('src.services.auth.auth_service.get_current_user', return_value=User(id=1)):
         response = client.get(
-            "/api/contact/contacts",
+            "/contact/contacts",
             headers={"Authorization": f"Bearer {token}"}
         )
         assert response.status_code == 200, response.text
@@ -52,10 +52,10 @@ def test_read_contacts(client, token):
         assert isinstance(data, list)
         assert "id" in data[0]
 
-def test_search_contacts(client, token):
+def test_search_contacts(client, token, contact):
     with patch('src.services.auth.auth_service.get_current_user', return_value=User(id=1)):
         response = client.get(
-            "/api/contact/contacts/search?first_name=John",
+            "/contact/contacts/search?first_name=John",
             headers={"Authorization": f"Bearer {token}"}
         )
         assert response.status_code == 200, response.text
@@ -63,27 +63,27 @@ def test_search_contacts(client, token):
         assert isinstance(data, list)
         assert data[0]["first_name"] == "John"
 
-def test_get_upcoming_birthdays(client, token):
+def test_get_upcoming_birthdays(client, token, contact):
     with patch('src.services.auth.auth_service.get_current_user', return_value=User(id=1)):
         response = client.get(
-            "/api/contact/contacts/upcoming-birthdays",
+            "/contact/contacts/upcoming-birthdays",
             headers={"Authorization": f"Bearer {token}"}
         )
         assert response.status_code == 200, response.text
         data = response.json()
         assert isinstance(data, list)
 
-def test_read_contact(client, token):
+def test_read_contact(client, token, contact):
     with patch('src.services.auth.auth_service.get_current_user', return_value=User(id=1)):
         response = client.get(
-            "/api/contact/contacts/1",
+            f"/contact/contacts/{contact['id']}",
             headers={"Authorization": f"Bearer {token}"}
         )
         assert response.status_code == 200, response.text
         data = response.json()
-        assert data["id"] == 1
+        assert data["id"] == contact["id"]
 
-def test_update_contact(client, token):
+def test_update_contact(client, token, contact):
     contact_data = {
         "first_name": "John",
         "last_name": "Updated",
@@ -95,7 +95,7 @@ def test_update_contact(client, token):
     
     with patch('src.services.auth.auth_service.get_current_user', return_value=User(id=1)):
         response = client.put(
-            "/api/contact/contacts/1",
+            f"/contact/contacts/{contact['id']}",
             json=contact_data,
             headers={"Authorization": f"Bearer {token}"}
         )
@@ -104,10 +104,179 @@ def test_update_contact(client, token):
         assert data["first_name"] == contact_data["first_name"]
         assert data["last_name"] == contact_data["last_name"]
 
-def test_delete_contact(client, token):
+def test_delete_contact(client, token, contact):
     with patch('src.services.auth.auth_service.get_current_user', return_value=User(id=1)):
         response = client.delete(
-            "/api/contact/contacts/1",
+            f"/contact/contacts/{contact['id']}",
             headers={"Authorization": f"Bearer {token}"}
         )
         assert response.status_code == 204
+
+def test_contact_stats(client, token, contact):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/contact/stats", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["total"] == 1
+
+    client.delete(f"/contact/contacts/{contact['id']}", headers=headers)
+    response = client.get("/contact/stats", headers=headers)
+    assert response.json()["total"] == 0
+
+
+def test_deleted_contact_can_be_restored(client, token, contact, session):
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.delete(f"/contact/contacts/{contact['id']}", headers=headers).status_code == 204
+    assert session.scalar(select(Contact.deleted_at).where(Contact.id == contact["id"])) is not None
+    assert client.get(f"/contact/contacts/{contact['id']}", headers=headers).status_code == 404
+    assert client.get("/contact/contacts", headers=headers).json() == []
+
+    response = client.post(f"/contact/contacts/{contact['id']}/restore", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["email"] == CONTACT["email"]
+    assert client.get("/contact/stats", headers=headers).json()["total"] == 1
+    assert client.post(f"/contact/contacts/{contact['id']}/restore", headers=headers).status_code == 404
+
+
+def test_restore_conflicts_with_a_recreated_contact(client, token, contact):
+    headers = {"Authorization": f"Bearer {token}"}
+    client.delete(f"/contact/contacts/{contact['id']}", headers=headers)
+    # the unique keys only cover live contacts
+    assert client.post("/contact/contacts", json=CONTACT, headers=headers).status_code == 201
+    response = client.post(f"/contact/contacts/{contact['id']}/restore", headers=headers)
+    assert response.status_code == 409, response.text
+
+
+def test_create_contact_duplicate_phone_format(client, token, contact):
+    duplicate = {**CONTACT, "email": "JOHN.DOE@example.com ", "phone_number": "+1 (234) 567-89"}
+    response = client.post("/contact/contacts", json=duplicate, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 409, response.text
+
+
+def test_duplicates_and_merge(client, token, contact):
+    headers = {"Authorization": f"Bearer {token}"}
+    other = {**CONTACT, "first_name": "Jon", "email": "jd@home.com", "phone_number": "+380501234567",
+             "additional_info": "Gym buddy"}
+    other_id = client.post("/contact/contacts", json=other, headers=headers).json()["id"]
+
+    response = client.get("/contact/contacts/duplicates", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json() == [{"contact_ids": [contact["id"], other_id], "reasons": ["name"]}]
+
+    response = client.post(f"/contact/contacts/{contact['id']}/merge", json={"duplicate_ids": [other_id]},
+                           headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["additional_info"] == "Friend\nGym buddy"
+    assert client.get(f"/contact/contacts/{other_id}", headers=headers).status_code == 404
+    assert client.get("/contact/stats", headers=headers).json()["total"] == 1
+
+
+def test_merge_with_a_deleted_duplicate_changes_nothing(client, token, contact):
+    headers = {"Authorization": f"Bearer {token}"}
+    other = {**CONTACT, "email": "jd@home.com", "phone_number": "+380501234567"}
+    other_id = client.post("/contact/contacts", json=other, headers=headers).json()["id"]
+    assert client.delete(f"/contact/contacts/{other_id}", headers=headers).status_code == 204
+
+    response = client.post(f"/contact/contacts/{contact['id']}/merge", json={"duplicate_ids": [other_id]},
+                           headers=headers)
+    assert response.status_code == 404, response.text
+    # the deleted duplicate left the statistics once, the primary is untouched
+    assert client.get("/contact/stats", headers=headers).json()["total"] == 1
+    assert client.get(f"/contact/contacts/{contact['id']}", headers=headers).status_code == 200
+
+
+def test_import_contacts(client, token, contact, run_jobs):
+    headers = {"Authorization": f"Bearer {token}"}
+    imported = [CONTACT, {**CONTACT, "email": "jane@example.com", "phone_number": "+380671112233", "first_name": "Jane"}]
+    response = client.post("/contact/contacts/import", json={"contacts": imported}, headers=headers)
+    assert response.status_code == 202, response.text
+    assert response.json()["job_id"]
+
+    assert run_jobs() == []
+    names = [c["first_name"] for c in client.get("/contact/contacts", headers=headers).json()]
+    assert sorted(names) == ["Jane", "John"]
+    assert client.get("/contact/stats", headers=headers).json()["total"] == 2
+
+
+def test_suggest_contacts(client, token, contact):
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post("/contact/contacts", headers=headers,
+                json={**CONTACT, "first_name": "Jane", "last_name": "Roe", "email": "j_r@example.com",
+                      "phone_number": "+380671112233"})
+
+    def suggest(q):
+        response = client.get("/contact/contacts/suggest", params={"q": q}, headers=headers)
+        assert response.status_code == 200, response.text
+        return [(hit["first_name"], hit["last_name"]) for hit in response.json()]
+
+    assert suggest("j") == [("John", "Doe"), ("Jane", "Roe")]
+    assert suggest("DO") == [("John", "Doe")]
+    assert suggest("roe ja") == [("Jane", "Roe")]
+    assert suggest("j_") == [("Jane", "Roe")]
+    assert suggest("j%") == []
+    assert set(client.get("/contact/contacts/suggest", params={"q": "john"}, headers=headers).json()[0]) == {
+        "id", "first_name", "last_name", "email"
+    }
+
+
+def test_full_text_search(client, token, contact):
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post("/contact/contacts", headers=headers,
+                json={**CONTACT, "first_name": "Jane", "last_name": "Roe", "email": "jane@example.com",
+                      "phone_number": "+380671112233", "additional_info": "Met at the chess club"})
+
+    def search(q):
+        response = client.get("/contact/contacts/search", params={"q": q}, headers=headers)
+        assert response.status_code == 200, response.text
+        return [hit["first_name"] for hit in response.json()]
+
+    assert search("chess") == ["Jane"]
+    assert search("CHESS roe") == ["Jane"]
+    assert search("example.com") == ["John", "Jane"]
+    assert search("chess doe") == []
+    # without q the field filters still apply
+    response = client.get("/contact/contacts/search", params={"first_name": "Jo"}, headers=headers)
+    assert [hit["first_name"] for hit in response.json()] == ["John"]
+
+
+def writes(statements, table):
+    return [sql for sql in statements if sql.startswith(("INSERT", "UPDATE", "DELETE", "WITH"))
+            and f" {table} " in f" {sql.split('(')[0]} "]
+
+
+def test_contact_writes_stay_within_query_budget(client, token, queries):
+    headers = {"Authorization": f"Bearer {token}"}
+
+    queries.clear()
+    contact_id = client.post("/contact/contacts", json=CONTACT, headers=headers).json()["id"]
+    # the current user, one INSERT ... RETURNING and the stats upsert; no refresh
+    assert len(queries) == 3, queries
+    assert len(writes(queries, "contact")) == 1
+
+    queries.clear()
+    response = client.put(f"/contact/contacts/{contact_id}", json={**CONTACT, "first_name": "Jack"}, headers=headers)
+    assert response.json()["first_name"] == "Jack"
+    # the current user is cached from here on; on SQLite the old values are read first,
+    # PostgreSQL returns them from the UPDATE; a new name leaves the stats as they are,
+    # so there is no upsert
+    assert len(queries) == 2, queries
+    assert len(writes(queries, "contact")) == 1
+
+    queries.clear()
+    assert client.delete(f"/contact/contacts/{contact_id}", headers=headers).status_code == 204
+    assert len(queries) == 2, queries
+    assert len(writes(queries, "contact")) == 1
+
+    queries.clear()
+    assert client.delete(f"/contact/contacts/{contact_id}", headers=headers).status_code == 404
+    assert len(queries) == 1, queries
+
+    stats = client.get("/contact/stats", headers=headers).json()
+    assert stats["total"] == 0
+
+
+def test_duplicate_contact_is_one_statement(client, token, contact, queries):
+    queries.clear()
+    response = client.post("/contact/contacts", json=CONTACT, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 409
+    assert len(writes(queries, "contact")) == 1
+    assert not writes(queries, "contact_stats")
@@ -0,0 +1,18 @@
+def test_update_avatar(client, token, user, mock_cloudinary, run_jobs):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.patch("/users/avatar", files={"file": ("avatar.png", b"\x89PNG", "image/png")},
+                            headers=headers)
+    assert response.status_code == 202, response.text
+    assert client.get("/users/me/", headers=headers).json()["avatar"] is None
+
+    assert run_jobs() == []
+    assert mock_cloudinary.call_args.args[0].read() == b"\x89PNG"
+    avatar = client.get("/users/me/", headers=headers).json()["avatar"]
+    assert avatar.endswith(f"NotesApp/{user['username']}")
+
+
+def test_oversized_avatar_is_refused(client, token, monkeypatch):
+    monkeypatch.setattr("src.routers.users.AVATAR_MAX_BYTES", 4)
+    response = client.patch("/users/avatar", files={"file": ("avatar.png", b"\x89PNG!", "image/png")},
+                            headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 413
@@ -0,0 +1,73 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.services.admission import AdmissionControlMiddleware, AdmissionQueue, CoDel, Overloaded, classify
+
+
+def test_classify():
+    assert classify({"path": "/auth/login", "method": "POST"}) == "auth"
+    assert classify({"path": "/contact/contacts", "method": "GET"}) == "read"
+    assert classify({"path": "/contact/contacts", "method": "POST"}) == "write"
+    assert classify({"path": "/ops/metrics", "method": "GET"}) is None
+
+
+def test_codel_drops_only_after_a_standing_queue():
+    codel = CoDel(target=0.05, interval=0.5)
+    assert not codel.should_drop(0.01, now=0.0)
+    # above target, but not for a whole interval yet
+    assert not codel.should_drop(0.2, now=1.0)
+    assert not codel.should_drop(0.2, now=1.4)
+    assert codel.should_drop(0.2, now=1.6)
+    # dropping continues at interval / sqrt(count), not for every request
+    assert not codel.should_drop(0.2, now=1.7)
+    assert codel.should_drop(0.2, now=2.2)
+    # a short wait ends the dropping state
+    assert not codel.should_drop(0.01, now=2.3)
+    assert not codel.dropping
+
+
+@pytest.mark.asyncio
+async def test_queue_hands_slots_over_in_order():
+    queue = AdmissionQueue("test", limit=1, max_wait=1)
+    await queue.acquire()
+    order = []
+
+    async def waiter(n):
+        await queue.acquire()
+        order.append(n)
+        queue.release()
+
+    tasks = [asyncio.create_task(waiter(n)) for n in range(3)]
+    await asyncio.sleep(0.01)
+    queue.release()
+    await asyncio.gather(*tasks)
+    assert order == [0, 1, 2]
+    assert queue.active == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_sheds_after_deadline():
+    queue = AdmissionQueue("test", limit=1, max_wait=0.02)
+    await queue.acquire()
+    with pytest.raises(Overloaded) as err:
+        await queue.acquire()
+    assert err.value.reason == "timeout"
+    queue.release()
+    assert queue.active == 0
+
+
+@pytest.mark.asyncio
+async def test_middleware_sheds_with_retry_after():
+    async def slow_app(scope, receive, send):
+        await asyncio.sleep(0.1)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    app = AdmissionControlMiddleware(slow_app, limits={"read": 1}, max_wait=0.01, retry_after=2)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        first, second = await asyncio.gather(client.get("/contact/contacts"), client.get("/contact/contacts"))
+    assert sorted([first.status_code, second.status_code]) == [200, 503]
+    shed = first if first.status_code == 503 else second
+    assert shed.headers["retry-after"] == "2"
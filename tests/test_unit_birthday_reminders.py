@@ -0,0 +1,69 @@
+from datetime import date
+
+import pytest
+
+from src.db.models import Contact, JobCheckpoint, User
+from src.jobs import birthday_reminders
+from src.repository.birthdays import birthday_window
+from src.services.queue import InMemoryBroker, job_queue
+
+
+@pytest.fixture()
+def broker(monkeypatch):
+    broker = InMemoryBroker()
+    monkeypatch.setattr(job_queue, "broker", broker)
+    return broker
+
+
+@pytest.fixture()
+def users(session):
+    users = [User(username=f"user{n}", email=f"user{n}@example.com", password="x", confirmed=n != 2)
+             for n in range(4)]
+    session.add_all(users)
+    session.flush()
+    birthdays = [date(1990, 12, 30), date(1985, 1, 2), date(1990, 6, 1), date(2000, 1, 3)]
+    for n, user in enumerate(users):
+        session.add(Contact(first_name=f"C{n}", last_name="X", email=f"c{n}@example.com", birthday=birthdays[n],
+                            phone_number=str(n), user_id=user.id))
+    session.add(Contact(first_name="Late", last_name="X", email="late@example.com", birthday=date(1990, 1, 20),
+                        phone_number="9", user_id=users[0].id))
+    session.commit()
+    return users
+
+
+def test_birthday_window_wraps_the_year():
+    assert birthday_window(date(2023, 12, 30), 3) == [101, 102, 1230, 1231]
+    assert 229 in birthday_window(date(2023, 2, 27), 2)
+    assert 229 not in birthday_window(date(2024, 2, 27), 1)
+
+
+@pytest.mark.asyncio
+async def test_reminders_are_queued_per_user(session, users, broker):
+    result = await birthday_reminders.run(session, today=date(2024, 12, 29), days=7, chunk_size=2)
+
+    assert result["reminders"] == 3
+    assert result["chunks"] == 2
+    jobs = {job.payload["email"]: job.payload["contacts"] for _, job in broker.jobs}
+    # the unconfirmed user and contacts outside the window are skipped
+    assert set(jobs) == {"user0@example.com", "user1@example.com", "user3@example.com"}
+    assert jobs["user0@example.com"] == [{"first_name": "C0", "last_name": "X", "birthday": "1990-12-30"}]
+
+
+@pytest.mark.asyncio
+async def test_run_is_idempotent_and_resumable(session, users, broker):
+    today = date(2024, 12, 29)
+    # a previous run stopped after the first user
+    session.add(JobCheckpoint(name=birthday_reminders.JOB_NAME, run_date=today, last_user_id=users[0].id))
+    session.commit()
+
+    result = await birthday_reminders.run(session, today=today, chunk_size=2)
+    assert result["reminders"] == 2
+    assert await birthday_reminders.run(session, today=today) == {
+        "reminders": 0, "contacts": 0, "chunks": 0, "seconds": 0.0
+    }
+
+    # a crashed run that re-reads a range does not queue the same reminder twice
+    session.query(JobCheckpoint).delete()
+    session.commit()
+    assert (await birthday_reminders.run(session, today=today))["reminders"] == 1
+    assert len(broker.jobs) == 3
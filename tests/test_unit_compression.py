@@ -0,0 +1,117 @@
+import gzip
+import hashlib
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+from src.services.compression import (CompressedBodyCache, CompressionMiddleware, available_encodings, negotiate,
+                                      skip_compression)
+
+PAYLOAD = [{"id": n, "first_name": "John", "last_name": "Doe", "email": f"john{n}@example.com"} for n in range(100)]
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, br, zstd", "zstd"),
+    ("gzip;q=1, zstd;q=0.5", "gzip"),
+    ("zstd;q=0, *", "br"),
+    ("identity", None),
+    ("", None),
+    ("gzip;q=0", None),
+    ("GZIP;q=bogus, br", "br"),
+])
+def test_negotiate(header, expected):
+    assert negotiate(header, ["zstd", "br", "gzip"]) == expected
+
+
+def make_app(cache=None, encodings=None):
+    app = FastAPI()
+
+    @app.get("/contacts")
+    async def contacts():
+        return PAYLOAD
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/token", dependencies=[Depends(skip_compression)])
+    async def token():
+        return PAYLOAD
+
+    @app.get("/stream")
+    async def stream():
+        async def lines():
+            for n in range(100):
+                yield f"line {n}\n".encode()
+        return StreamingResponse(lines(), media_type="text/plain")
+
+    @app.get("/image")
+    async def image():
+        return PlainTextResponse("x" * 4096, media_type="image/png")
+
+    app.add_middleware(CompressionMiddleware, min_size=1024, cache=cache,
+                       encodings=encodings or {"gzip": available_encodings()["gzip"]})
+    return app
+
+
+async def get(app, path, accept="gzip"):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.get(path, headers={"Accept-Encoding": accept})
+
+
+@pytest.mark.asyncio
+async def test_large_json_is_compressed():
+    response = await get(make_app(), "/contacts")
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < 4096
+    assert response.json() == PAYLOAD
+
+    plain = await get(make_app(), "/contacts", accept="identity")
+    assert "content-encoding" not in plain.headers
+    assert plain.headers["vary"] == "Accept-Encoding"
+    assert plain.json() == PAYLOAD
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("path", ["/small", "/token", "/image"])
+async def test_ineligible_responses_are_not_compressed(path):
+    response = await get(make_app(), path)
+    assert "content-encoding" not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_streamed_body_is_compressed_in_chunks():
+    response = await get(make_app(), "/stream")
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert response.text == "".join(f"line {n}\n" for n in range(100))
+
+
+@pytest.mark.asyncio
+async def test_repeated_body_is_compressed_once():
+    cache = CompressedBodyCache(max_bytes=1024 * 1024)
+    calls = []
+    original = available_encodings()["gzip"]
+    encodings = {"gzip": (lambda body: calls.append(1) or original[0](body), original[1])}
+    app = make_app(cache, encodings)
+    first = await get(app, "/contacts")
+    second = await get(app, "/contacts")
+    assert first.content == second.content
+    assert len(calls) == 1
+    assert len(cache.entries) == 1
+
+
+def test_cache_evicts_least_recently_used():
+    cache = CompressedBodyCache(max_bytes=800)
+    bodies = [bytes([n]) * 90 for n in range(10)]
+    for body in bodies:
+        # stored as is, 90 bytes each
+        cache.get_or_compress("gzip", body, lambda body: body)
+    assert cache.size <= 800
+    assert ("gzip", hashlib.sha256(bodies[-1]).digest()) in cache.entries
+    assert ("gzip", hashlib.sha256(bodies[0]).digest()) not in cache.entries
+    assert gzip.decompress(cache.get_or_compress("gzip", b"a" * 10, gzip.compress)) == b"a" * 10
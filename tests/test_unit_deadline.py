@@ -0,0 +1,113 @@
+import asyncio
+import sqlite3
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy import text
+
+from src.services.deadline import (DeadlineExceeded, DisconnectMiddleware, apply_statement_timeout, cancel_session,
+                                   raise_deadline_exceeded)
+
+
+def postgres_connection():
+    connection = MagicMock()
+    connection.dialect.name = "postgresql"
+    return connection
+
+
+def test_statement_timeout_follows_the_deadline():
+    session = MagicMock(info={"deadline": time.monotonic() + 1.5})
+    connection = postgres_connection()
+    apply_statement_timeout(session, None, connection)
+    statement = connection.exec_driver_sql.call_args.args[0]
+    assert statement.startswith("SET LOCAL statement_timeout = ")
+    assert 1000 < int(statement.rsplit(" ", 1)[1]) <= 1500
+
+
+def test_no_deadline_no_timeout():
+    session = MagicMock(info={})
+    connection = postgres_connection()
+    apply_statement_timeout(session, None, connection)
+    connection.exec_driver_sql.assert_not_called()
+
+
+def test_expired_deadline_refuses_new_transactions():
+    session = MagicMock(info={"deadline": time.monotonic() - 1})
+    with pytest.raises(DeadlineExceeded):
+        apply_statement_timeout(session, None, postgres_connection())
+
+
+@pytest.mark.asyncio
+async def test_cancel_session_uses_the_driver_cancel():
+    dbapi_connection = MagicMock(spec=["cancel"])
+    session = MagicMock(info={"dbapi_connection": dbapi_connection})
+    await cancel_session(session)
+    dbapi_connection.cancel.assert_called_once()
+    assert session.info["cancelled"]
+
+
+def test_the_connection_is_forgotten_when_the_transaction_ends(session):
+    session.execute(text("SELECT 1"))
+    assert session.info["dbapi_connection"] is not None
+    session.commit()
+    assert "dbapi_connection" not in session.info
+
+    session.execute(text("SELECT 1"))
+    session.rollback()
+    assert "dbapi_connection" not in session.info
+
+
+def test_only_cancelled_statements_become_deadline_errors():
+    cancelled = SimpleNamespace(original_exception=sqlite3.OperationalError("interrupted"),
+                                sqlalchemy_exception=None)
+    with pytest.raises(DeadlineExceeded):
+        raise_deadline_exceeded(cancelled)
+    locked = SimpleNamespace(original_exception=sqlite3.OperationalError("database is locked"),
+                             sqlalchemy_exception=None)
+    assert raise_deadline_exceeded(locked) is None
+
+
+def test_client_timeout_header_returns_504(client, token):
+    response = client.get("/contact/contacts", headers={"Authorization": f"Bearer {token}", "X-Request-Timeout": "0"})
+    assert response.status_code == 504, response.text
+    assert response.json()["detail"] == "Request deadline exceeded"
+
+
+async def run_middleware(respond_first: bool):
+    cancelled = []
+    disconnect = asyncio.Event()
+
+    async def app(scope, receive, send):
+        scope["state"]["on_disconnect"].append(lambda: cancelled.append(True))
+        await receive()
+        if respond_first:
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+        disconnect.set()
+        await asyncio.sleep(0.01)
+
+    messages = [{"type": "http.request", "body": b""}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        pass
+
+    await DisconnectMiddleware(app)({"type": "http", "headers": []}, receive, send)
+    return cancelled
+
+
+@pytest.mark.asyncio
+async def test_disconnect_runs_cancel_callbacks():
+    assert await run_middleware(respond_first=False) == [True]
+
+
+@pytest.mark.asyncio
+async def test_disconnect_after_response_is_ignored():
+    assert await run_middleware(respond_first=True) == []
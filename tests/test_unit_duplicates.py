@@ -0,0 +1,80 @@
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+from src.services.duplicates import find_duplicates, merge_values
+from src.services.normalization import normalize_email, normalize_phone, soundex
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("+1 (555) 123-4567", "+15551234567"),
+    ("555-123-4567", "+15551234567"),
+    ("1 555 123 4567", "+15551234567"),
+    ("00380 50 123 45 67", "+380501234567"),
+    ("", None),
+    (None, None),
+])
+def test_normalize_phone(raw, expected):
+    assert normalize_phone(raw) == expected
+
+
+def test_normalize_phone_trunk_prefix():
+    assert normalize_phone("050 123 45 67", country_code="380") == "+380501234567"
+
+
+def test_normalize_email():
+    assert normalize_email("  John.Doe@Example.COM ") == "john.doe@example.com"
+    assert normalize_email(" ") is None
+
+
+def test_soundex():
+    assert soundex("Robert") == soundex("Rupert") == "R163"
+    assert soundex("Smith") == soundex("Smyth")
+    assert soundex("Ashcraft") == "A261"
+    assert soundex("") == ""
+
+
+def contact(id, first, last, email=None, phone=None, birthday=None, info=None):
+    return SimpleNamespace(id=id, first_name=first, last_name=last, email=email, phone_number=phone,
+                           birthday=birthday, additional_info=info)
+
+
+def test_find_duplicates_groups_by_blocking_keys():
+    contacts = [
+        contact(1, "John", "Smith", "john@work.com", "+1 555 111 2222"),
+        contact(2, "Jon", "Smyth", "js@home.com", "+44 20 7946 0000"),
+        contact(3, "Alice", "Brown", "alice@x.com", "555-999-8888"),
+        contact(4, "Alicia", "Green", "carol@y.com", "+1 (555) 999-8888"),
+        contact(5, "Bob", "Stone", "bob@z.com", "+380501234567"),
+    ]
+    groups = find_duplicates(contacts)
+    assert groups == [
+        {"contact_ids": [1, 2], "reasons": ["name"]},
+        {"contact_ids": [3, 4], "reasons": ["phone"]},
+    ]
+
+
+def test_find_duplicates_compares_whole_email_addresses():
+    contacts = [
+        contact(1, "Ann", "Lee", "john@gmail.com"),
+        contact(2, "Bob", "Stone", "john@yahoo.com"),
+        contact(3, "Carl", "Marx", " John@Yahoo.com"),
+    ]
+    assert find_duplicates(contacts) == [{"contact_ids": [2, 3], "reasons": ["email"]}]
+
+
+def test_find_duplicates_skips_oversized_blocks():
+    contacts = [contact(n, "John", "Smith", f"{n}@x.com", f"+1555000{n:04d}") for n in range(10)]
+    assert find_duplicates(contacts, max_block_size=5) == []
+
+
+def test_merge_values_fills_gaps_and_joins_notes():
+    primary = contact(1, "John", "Smith", "john@work.com", None, None, "Colleague")
+    duplicate = contact(2, "Jon", "Smyth", "js@home.com", "+15551112222", date(1990, 1, 1), "Gym buddy")
+    values = merge_values(primary, [duplicate])
+    assert values == {
+        "first_name": "John", "last_name": "Smith", "email": "john@work.com",
+        "phone_number": "+15551112222", "birthday": date(1990, 1, 1),
+        "additional_info": "Colleague\nGym buddy",
+    }
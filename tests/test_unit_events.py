@@ -0,0 +1,137 @@
+import asyncio
+import json
+
+import pytest
+
+from main import app
+from src.services.admission import classify
+from src.services.deadline import RequestDeadline
+from src.services.events import EventHub, stream_key
+
+
+@pytest.fixture()
+def hub(redis_client):
+    hub = EventHub(retained=100, buffer=2)
+    hub.use(redis_client)
+    return hub
+
+
+async def next_event(stream, timeout: float = 2) -> str:
+    return await asyncio.wait_for(stream.__anext__(), timeout)
+
+
+def event_ids(chunks: list[str]) -> list[str]:
+    return [chunk.split("\n")[0].removeprefix("id: ") for chunk in chunks]
+
+
+@pytest.mark.asyncio
+async def test_live_events_reach_the_users_streams_only(hub):
+    mine, theirs = hub.stream(1), hub.stream(2)
+    assert (await next_event(mine)).startswith("retry:")
+    await next_event(theirs)
+
+    event_id = await hub.publish(1, "created", {"id": 7, "first_name": "Ann"})
+    chunk = await next_event(mine)
+
+    assert chunk == f'id: {event_id}\nevent: created\ndata: {json.dumps({"id": 7, "first_name": "Ann"})}\n\n'
+    with pytest.raises(asyncio.TimeoutError):
+        await next_event(theirs, timeout=0.2)
+    await mine.aclose()
+    await theirs.aclose()
+    await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_reconnecting_streams_resume_after_the_last_event(hub):
+    ids = [await hub.publish(1, "updated", {"id": n}) for n in range(3)]
+
+    stream = hub.stream(1, last_event_id=ids[0])
+    await next_event(stream)
+
+    assert event_ids([await next_event(stream), await next_event(stream)]) == ids[1:]
+    await stream.aclose()
+    await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_streams_behind_the_retained_events_are_reset(hub):
+    await hub.publish(1, "deleted", {"id": 1})
+
+    stream = hub.stream(1, last_event_id="1-0")
+    await next_event(stream)
+
+    assert (await next_event(stream)).startswith("event: reset")
+    await stream.aclose()
+    await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_slow_streams_catch_up_from_redis_in_order(hub):
+    stream = hub.stream(1)
+    await next_event(stream)
+    first = await hub.publish(1, "created", {"id": 0})
+    assert event_ids([await next_event(stream)]) == [first]
+
+    # the client stops reading while five events arrive, more than its buffer holds
+    ids = [await hub.publish(1, "created", {"id": n}) for n in range(1, 6)]
+    [subscriber] = hub.subscribers[1]
+    for _ in range(100):
+        if subscriber.lagged:
+            break
+        await asyncio.sleep(0.01)
+    assert subscriber.lagged and not subscriber.buffer
+
+    assert event_ids([await next_event(stream) for _ in range(5)]) == ids
+    await stream.aclose()
+    await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_streams_that_overflow_before_their_first_event_are_reset(hub):
+    stream = hub.stream(1)
+    await next_event(stream)
+
+    # nothing was sent yet, so there is no event to replay from
+    for n in range(5):
+        await hub.publish(1, "created", {"id": n})
+    [subscriber] = hub.subscribers[1]
+    for _ in range(100):
+        if subscriber.lagged:
+            break
+        await asyncio.sleep(0.01)
+
+    assert (await next_event(stream)).startswith("event: reset")
+    await stream.aclose()
+    await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_idle_streams_send_keep_alives(hub):
+    stream = hub.stream(1, heartbeat=0.05)
+    await next_event(stream)
+
+    assert await next_event(stream) == ": keep-alive\n\n"
+    await stream.aclose()
+    assert not hub.subscribers
+    await hub.close()
+
+
+def test_contact_writes_are_published(client, token, redis_client):
+    headers = {"Authorization": f"Bearer {token}"}
+    contact = {"first_name": "Ann", "last_name": "Lee", "email": "ann@example.com", "phone_number": "123456",
+               "birthday": "1990-01-01", "additional_info": ""}
+    contact_id = client.post("/contact/contacts", json=contact, headers=headers).json()["id"]
+    assert client.delete(f"/contact/contacts/{contact_id}", headers=headers).status_code == 204
+
+    user_id = client.get("/users/me/", headers=headers).json()["id"]
+    entries = asyncio.run(redis_client.xrange(stream_key(user_id)))
+    assert [fields["event"] for _, fields in entries] == ["created", "deleted"]
+    assert json.loads(entries[0][1]["data"])["first_name"] == "Ann"
+    assert client.get("/contact/stream").status_code == 401
+
+
+def test_event_streams_hold_no_admission_slot_and_have_no_deadline():
+    assert classify({"path": "/contact/stream", "method": "GET"}) is None
+    assert classify({"path": "/contact/contacts", "method": "GET"}) == "read"
+    [route] = [route for route in app.routes if getattr(route, "path", None) == "/contact/stream"]
+    assert not any(isinstance(dependency.call, RequestDeadline) for dependency in route.dependant.dependencies)
@@ -0,0 +1,69 @@
+import asyncio
+
+import fakeredis
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+
+from src.services.idempotency import IdempotencyMiddleware
+
+
+def make_app(calls, delay=0.0, status_code=201):
+    app = FastAPI()
+    app.state.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    @app.post("/items")
+    async def create(request: Request):
+        calls.append(await request.json())
+        await asyncio.sleep(delay)
+        if status_code >= 500:
+            raise RuntimeError("boom")
+        return {"n": len(calls)}
+
+    app.add_middleware(IdempotencyMiddleware, routes={("POST", "/items")}, wait=1)
+    return app
+
+
+def client_for(app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app, raise_app_exceptions=False),
+                             base_url="http://test")
+
+
+@pytest.mark.asyncio
+async def test_retry_replays_stored_response():
+    calls = []
+    async with client_for(make_app(calls)) as client:
+        first = await client.post("/items", json={"a": 1}, headers={"Idempotency-Key": "k1"})
+        retry = await client.post("/items", json={"a": 1}, headers={"Idempotency-Key": "k1"})
+        other_user = await client.post("/items", json={"a": 1},
+                                       headers={"Idempotency-Key": "k1", "Authorization": "Bearer x"})
+        reused = await client.post("/items", json={"a": 2}, headers={"Idempotency-Key": "k1"})
+        plain = await client.post("/items", json={"a": 1})
+    assert (first.status_code, first.json()) == (200, {"n": 1})
+    assert (retry.status_code, retry.json()) == (200, {"n": 1})
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert other_user.json() == {"n": 2}
+    assert reused.status_code == 422
+    assert plain.json() == {"n": 3}
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_concurrent_retries_wait_for_the_first_attempt():
+    calls = []
+    async with client_for(make_app(calls, delay=0.2)) as client:
+        responses = await asyncio.gather(*(
+            client.post("/items", json={"a": 1}, headers={"Idempotency-Key": "k2"}) for _ in range(3)
+        ))
+    assert len(calls) == 1
+    assert [r.json() for r in responses] == [{"n": 1}] * 3
+
+
+@pytest.mark.asyncio
+async def test_server_errors_are_not_stored():
+    calls = []
+    async with client_for(make_app(calls, status_code=500)) as client:
+        for _ in range(2):
+            response = await client.post("/items", json={"a": 1}, headers={"Idempotency-Key": "k3"})
+            assert response.status_code == 500
+    assert len(calls) == 2
@@ -0,0 +1,100 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from src.services.invalidation import VERSIONS_KEY, InvalidationBus, LocalCache
+
+
+async def eventually(condition, timeout: float = 2) -> None:
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not met")
+
+
+def make_worker() -> tuple[InvalidationBus, LocalCache]:
+    bus = InvalidationBus(retry_delay=0.05)
+    cache = LocalCache("users", 100)
+    bus.register("users", cache)
+    return bus, cache
+
+
+@pytest.fixture()
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.mark.asyncio
+async def test_an_invalidation_drops_the_key_in_every_worker(server):
+    (bus_a, cache_a), (bus_b, cache_b) = make_worker(), make_worker()
+    redis_a = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    await bus_a.start(redis_a)
+    await bus_b.start(fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+    for cache in (cache_a, cache_b):
+        cache.set("ann@example.com", "Ann", cache.token("ann@example.com"))
+        cache.set("bob@example.com", "Bob", cache.token("bob@example.com"))
+
+    await bus_a.invalidate("users", "ann@example.com")
+
+    # the writer reads its own write at once
+    assert cache_a.get("ann@example.com") is None
+    await eventually(lambda: cache_b.get("ann@example.com") is None)
+    assert cache_b.get("bob@example.com") == "Bob"
+    assert await redis_a.hget(VERSIONS_KEY, "users:ann@example.com") == "1"
+    await bus_a.close()
+    await bus_b.close()
+
+
+def test_a_load_raced_by_an_invalidation_is_not_stored():
+    cache = LocalCache("users", 100)
+    token = cache.token("ann@example.com")
+    # the row changes while the old one is being loaded
+    cache.invalidate("ann@example.com", 7)
+
+    assert not cache.set("ann@example.com", "old Ann", token)
+    assert cache.set("ann@example.com", "new Ann", cache.token("ann@example.com"))
+    # an announcement older than the local version still moves it
+    token = cache.token("ann@example.com")
+    cache.invalidate("ann@example.com", 3)
+    assert not cache.set("ann@example.com", "old Ann", token)
+
+    token = cache.token("bob@example.com")
+    cache.clear()
+    assert not cache.set("bob@example.com", "Bob", token)
+
+
+def test_entries_expire_and_the_least_recently_used_are_evicted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("src.services.invalidation.time.monotonic", lambda: now[0])
+    cache = LocalCache("users", 2, ttl=10)
+    for key in ("a", "b"):
+        cache.set(key, key.upper(), cache.token(key))
+    assert cache.get("a") == "A"
+    cache.set("c", "C", cache.token("c"))
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    now[0] += 11
+    assert cache.get("c") is None
+
+
+@pytest.mark.asyncio
+async def test_caches_are_bypassed_while_disconnected_and_flushed_after(server):
+    bus, cache = make_worker()
+    await bus.start(fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+    cache.set("ann@example.com", "Ann", cache.token("ann@example.com"))
+
+    server.connected = False
+    await eventually(lambda: not cache.enabled)
+    assert cache.get("ann@example.com") is None
+    assert not cache.set("bob@example.com", "Bob", cache.token("bob@example.com"))
+    # the writer's invalidation cannot be published, but it applies locally
+    await bus.invalidate("users", "carol@example.com")
+
+    server.connected = True
+    await eventually(lambda: cache.enabled)
+    assert not cache.entries
+    assert cache.set("ann@example.com", "Ann", cache.token("ann@example.com"))
+    await bus.close()
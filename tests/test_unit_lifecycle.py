@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+
+from src.services.lifecycle import DRAINING, READY, STOPPED, Lifecycle, lifecycle, warm_db_pool
+
+
+def test_warm_db_pool_fills_the_pool(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'warm.db'}", poolclass=QueuePool, pool_size=3)
+    assert warm_db_pool(engine, connections=10) == 3
+    assert engine.pool.checkedin() == 3
+    engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_drain_waits_for_in_flight_requests():
+    tracker = Lifecycle()
+    tracker.set_state(READY)
+    tracker.request_started()
+
+    async def finish():
+        await asyncio.sleep(0.1)
+        tracker.request_finished()
+
+    task = asyncio.ensure_future(finish())
+    assert await tracker.drain(timeout=2) is True
+    assert tracker.state == DRAINING
+    await task
+
+    tracker.request_started()
+    assert await tracker.drain(timeout=0.1) is False
+
+
+def test_probes_follow_the_lifecycle(client, redis_client, monkeypatch):
+    assert client.get("/ops/ready").json() == {"status": READY, "in_flight": 1}
+    assert client.get("/ops/live").status_code == 200
+
+    monkeypatch.setattr(lifecycle, "state", DRAINING)
+    response = client.get("/ops/ready")
+    assert response.status_code == 503
+    assert client.get("/ops/live").status_code == 200
+
+
+def test_shutdown_closes_the_pools(session, redis_client, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from main import app
+
+    disposed = []
+    monkeypatch.setattr("main.redis.Redis", lambda *args, **kwargs: redis_client)
+    monkeypatch.setattr("main.engine.dispose", lambda: disposed.append(True))
+    with TestClient(app):
+        assert lifecycle.ready
+    assert lifecycle.state == STOPPED
+    assert disposed == [True]
@@ -0,0 +1,82 @@
+import sys
+import tracemalloc
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.services import auth, memory
+from src.services.memory import AllocationSamplingMiddleware, MemoryProfiler
+
+
+@pytest.fixture()
+def profiler():
+    profiler = MemoryProfiler(frames=1, max_snapshots=2)
+    was_tracing = tracemalloc.is_tracing()
+    profiler.start()
+    yield profiler
+    if not was_tracing:
+        tracemalloc.stop()
+
+
+def test_diff_points_at_the_growing_allocation(profiler):
+    base = profiler.take_snapshot()["id"]
+    line = sys._getframe().f_lineno + 1
+    leak = [bytearray(1024) for _ in range(200)]
+    current = profiler.take_snapshot()["id"]
+
+    top = profiler.diff(base, current, limit=1)
+    assert top[0]["location"].endswith(f"{__file__}:{line}")
+    assert top[0]["size_diff"] >= 200 * 1024
+    assert profiler.top(current, limit=3)
+    assert len(leak) == 200
+
+
+def test_only_the_newest_snapshots_are_kept(profiler):
+    ids = [profiler.take_snapshot()["id"] for _ in range(3)]
+
+    assert list(profiler.snapshots) == ids[1:]
+    with pytest.raises(KeyError):
+        profiler.top(ids[0])
+
+
+def test_sampled_requests_are_aggregated_per_route(profiler):
+    app = FastAPI()
+    retained = []
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        retained.append(bytearray(64 * 1024))
+        return {"id": item_id}
+
+    app.add_middleware(AllocationSamplingMiddleware, rate=1.0, profiler=profiler)
+    with TestClient(app) as client:
+        for item_id in range(3):
+            assert client.get(f"/items/{item_id}").status_code == 200
+
+    [report] = profiler.request_report()
+    assert report["route"] == "GET /items/{item_id}"
+    assert report["samples"] == 3
+    # the response itself is freed, the retained buffer is not
+    assert report["mean_bytes"] >= 32 * 1024
+
+
+def test_memory_endpoints_are_off_unless_enabled(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/ops/memory", headers=headers).status_code == 404
+
+
+def test_memory_endpoints_need_an_admin(client, token, user, monkeypatch, profiler):
+    headers = {"Authorization": f"Bearer {token}"}
+    monkeypatch.setattr(memory, "MEMORY_DIAGNOSTICS", True)
+    monkeypatch.setattr("src.routers.ops.memory_profiler", profiler)
+    assert client.get("/ops/memory", headers=headers).status_code == 403
+
+    monkeypatch.setattr(auth, "ADMIN_EMAILS", {user["email"]})
+    assert client.get("/ops/memory", headers=headers).json()["tracing"] is True
+    first = client.post("/ops/memory/snapshots", headers=headers).json()["id"]
+    second = client.post("/ops/memory/snapshots", headers=headers).json()["id"]
+    response = client.get("/ops/memory/diff", params={"base": first, "current": second}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert client.get("/ops/memory/snapshots/999", headers=headers).status_code == 404
+    assert client.get("/ops/memory/orm", headers=headers).json()["sessions"] >= 1
@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from src.db.migrations import (add_constraint_not_valid, backfill, create_index_concurrently, run_with_lock_timeout,
+                               set_not_null, validate_constraint)
+from src.db.partitioning import partitioned_contact_ddl
+
+POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+
+def run_alongside_traffic(engine, table: str, migrate, key: str = "id", keys: int = 1000) -> dict:
+    """
+    Runs ``migrate`` while another thread reads and updates single rows of ``table``,
+    the way the application does, and reports how long those statements took.
+    """
+    done = threading.Event()
+    latencies = []
+
+    def traffic():
+        n = 0
+        with engine.connect() as conn:
+            while not done.is_set():
+                n += 1
+                started = time.perf_counter()
+                conn.execute(text(f"SELECT * FROM {table} WHERE {key} = :key"), {"key": n % keys + 1}).all()
+                conn.execute(text(f"UPDATE {table} SET first_name = first_name WHERE {key} = :key"),
+                             {"key": n % keys + 1})
+                conn.commit()
+                latencies.append(time.perf_counter() - started)
+
+    thread = threading.Thread(target=traffic)
+    thread.start()
+    try:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            migrate(conn)
+    finally:
+        done.set()
+        thread.join()
+    return {"statements": len(latencies), "max_ms": max(latencies, default=0) * 1000}
+
+
+@pytest.fixture()
+def seeded(tmp_path):
+    # a file database, so the migration and the traffic use separate connections
+    engine = create_engine(f"sqlite:///{tmp_path}/migrations.db", connect_args={"timeout": 5})
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE contact (id integer PRIMARY KEY, first_name varchar, "
+                             "nickname varchar, user_id integer)")
+        conn.execute(text("INSERT INTO contact (id, first_name, user_id) VALUES (:id, :name, :user)"),
+                     [{"id": n, "name": f"Name{n}", "user": n % 50} for n in range(1, 5001)])
+    yield engine
+    engine.dispose()
+
+
+def test_backfill_commits_each_batch_and_resumes(seeded):
+    with seeded.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("UPDATE contact SET nickname = 'set' WHERE id <= 1000")
+        result = backfill(conn, "contact", "nickname = lower(first_name)", "nickname IS NULL",
+                          batch_size=500, pause_ms=0)
+        assert result == {**result, "rows": 4000, "batches": 8}
+        assert conn.exec_driver_sql("SELECT nickname FROM contact WHERE id = 4321").scalar() == "name4321"
+        # nothing left to do
+        assert backfill(conn, "contact", "nickname = lower(first_name)", "nickname IS NULL")["rows"] == 0
+
+
+def test_backfill_batches_are_bounded_by_rows(seeded):
+    # 50 users with 100 contacts each: paged by the primary key, not by user_id ranges
+    with seeded.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        result = backfill(conn, "contact", "nickname = first_name", "nickname IS NULL", key=("user_id", "id"),
+                          batch_size=300, pause_ms=0)
+        assert result == {**result, "rows": 5000, "batches": 17}
+        assert conn.exec_driver_sql("SELECT count(*) FROM contact WHERE nickname IS NULL").scalar() == 0
+
+
+def test_helpers_refuse_to_run_inside_the_migration_transaction(seeded):
+    with seeded.connect() as conn:
+        with pytest.raises(RuntimeError):
+            backfill(conn, "contact", "nickname = first_name", "nickname IS NULL")
+
+
+def test_locked_statements_are_retried_until_the_lock_is_free(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/locked.db", connect_args={"timeout": 0.02})
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE contact (id integer PRIMARY KEY, first_name varchar)")
+    holder = engine.raw_connection()
+    holder.cursor().execute("BEGIN IMMEDIATE")
+    try:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            with pytest.raises(OperationalError):
+                run_with_lock_timeout(conn, "CREATE INDEX ix_contact_name ON contact (first_name)",
+                                      timeout_ms=20, retries=1)
+            threading.Timer(0.2, holder.rollback).start()
+            run_with_lock_timeout(conn, "CREATE INDEX ix_contact_name ON contact (first_name)",
+                                  timeout_ms=20, retries=50)
+            assert conn.exec_driver_sql("SELECT count(*) FROM sqlite_master WHERE name = 'ix_contact_name'").scalar()
+    finally:
+        holder.close()
+        engine.dispose()
+
+
+def test_batched_backfill_lets_traffic_through(seeded):
+    report = run_alongside_traffic(seeded, "contact", lambda conn: backfill(
+        conn, "contact", "nickname = lower(first_name)", "nickname IS NULL", batch_size=100, pause_ms=2))
+
+    assert report["statements"] > 0
+    assert report["max_ms"] < 1000
+
+
+@pytest.mark.skipif(not POSTGRES_URL, reason="set TEST_POSTGRES_URL to run against PostgreSQL")
+def test_online_migration_of_the_partitioned_contact_table():
+    schema = f"test_migrations_{os.getpid()}"
+    table = f"{schema}.contact"
+    engine = create_engine(POSTGRES_URL)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"CREATE SCHEMA {schema}")
+        conn.exec_driver_sql(f"CREATE SEQUENCE {schema}.contact_id_seq")
+        for statement in partitioned_contact_ddl(table, 4, f"{schema}.contact_id_seq", None):
+            conn.exec_driver_sql(statement)
+        conn.exec_driver_sql(f"INSERT INTO {table} (first_name, user_id) "
+                             f"SELECT 'Name' || g, g % 1000 + 1 FROM generate_series(1, 50000) AS g")
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN nickname varchar")
+
+    def migrate(conn):
+        backfill(conn, table, "nickname = lower(first_name)", "nickname IS NULL", key=("user_id", "id"),
+                 batch_size=50, pause_ms=1)
+        create_index_concurrently(conn, "ix_contact_user_nickname", table, "(user_id, nickname)",
+                                  where="deleted_at IS NULL")
+        add_constraint_not_valid(conn, table, "ck_contact_nickname", "CHECK (nickname <> '')")
+        validate_constraint(conn, table, "ck_contact_nickname")
+        set_not_null(conn, table, "nickname")
+
+    try:
+        report = run_alongside_traffic(engine, table, migrate, key="user_id")
+        assert report["statements"] > 0
+        assert report["max_ms"] < 1000, report
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"),
+                                {"name": f"{schema}.ix_contact_user_nickname"}).scalar()
+            assert conn.exec_driver_sql(f"SELECT count(*) FROM {table} WHERE nickname IS NULL").scalar() == 0
+    finally:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"DROP SCHEMA {schema} CASCADE")
+        engine.dispose()
+
+
+@pytest.mark.skipif(not POSTGRES_URL, reason="set TEST_POSTGRES_URL to run against PostgreSQL")
+def test_ddl_gives_way_to_a_long_transaction():
+    schema = f"test_lock_timeout_{os.getpid()}"
+    engine = create_engine(POSTGRES_URL)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"CREATE SCHEMA {schema}")
+        conn.exec_driver_sql(f"CREATE TABLE {schema}.contact (id integer PRIMARY KEY, first_name varchar)")
+    holder = engine.connect()
+    holder.exec_driver_sql(f"SELECT * FROM {schema}.contact")
+    try:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            threading.Timer(0.3, holder.rollback).start()
+            run_with_lock_timeout(conn, f"ALTER TABLE {schema}.contact ADD COLUMN nickname varchar",
+                                  timeout_ms=50, retries=20)
+    finally:
+        holder.close()
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"DROP SCHEMA {schema} CASCADE")
+        engine.dispose()
@@ -0,0 +1,38 @@
+import os
+import re
+
+import pytest
+from sqlalchemy import create_engine
+
+from src.db.partitioning import partitioned_contact_ddl, route_statements, scanned_relations
+
+POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+pytestmark = pytest.mark.skipif(not POSTGRES_URL, reason="set TEST_POSTGRES_URL to run against PostgreSQL")
+
+
+@pytest.fixture()
+def partitioned():
+    schema = f"test_partitioning_{os.getpid()}"
+    engine = create_engine(POSTGRES_URL)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"CREATE SCHEMA {schema}")
+        conn.exec_driver_sql(f"CREATE SEQUENCE {schema}.contact_id_seq")
+        for statement in partitioned_contact_ddl(f"{schema}.contact", 8, f"{schema}.contact_id_seq", None):
+            conn.exec_driver_sql(statement)
+        conn.exec_driver_sql(f"INSERT INTO {schema}.contact (first_name, user_id) "
+                             f"SELECT 'John', g % 50 FROM generate_series(1, 1000) AS g")
+        conn.exec_driver_sql(f"ANALYZE {schema}.contact")
+    try:
+        with engine.connect() as conn:
+            yield conn.execution_options(schema_translate_map={None: schema})
+    finally:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"DROP SCHEMA {schema} CASCADE")
+        engine.dispose()
+
+
+def test_every_route_reads_a_single_partition(partitioned):
+    for route, statement in route_statements(user_id=7, contact_id=57).items():
+        partitions = {name for name in scanned_relations(partitioned, statement) if re.fullmatch(r"contact_p\d+", name)}
+        assert len(partitions) == 1, f"{route} reads {sorted(partitions)}"
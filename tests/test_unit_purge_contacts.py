@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from src.db.models import Contact, User
+from src.jobs import purge_contacts
+from src.repository import contacts as repository_contacts
+
+NOW = datetime(2024, 6, 1, 12, 0)
+
+
+@pytest.fixture()
+def user(session):
+    user = User(username="purger", email="purger@example.com", password="x", confirmed=True)
+    session.add(user)
+    session.flush()
+    # five expired tombstones, one recent tombstone and one live contact
+    deleted = [NOW - timedelta(days=40)] * 5 + [NOW - timedelta(days=2), None]
+    for n, deleted_at in enumerate(deleted):
+        session.add(Contact(first_name=f"C{n}", last_name="X", email=f"c{n}@example.com", phone_number=str(n),
+                            user_id=user.id, deleted_at=deleted_at))
+    session.commit()
+    return user
+
+
+@pytest.mark.asyncio
+async def test_purge_removes_expired_tombstones_in_batches(session, user):
+    result = await purge_contacts.run(session, retention_days=30, batch_size=2, pause_ms=0, now=NOW)
+
+    assert result["purged"] == 5
+    assert result["batches"] == 3
+    names = session.scalars(select(Contact.first_name).where(Contact.user_id == user.id)).all()
+    assert sorted(names) == ["C5", "C6"]
+
+
+@pytest.mark.asyncio
+async def test_purge_stops_after_max_batches(session, user):
+    result = await purge_contacts.run(session, retention_days=30, batch_size=2, pause_ms=0, max_batches=1, now=NOW)
+
+    assert result == {**result, "purged": 2, "batches": 1}
+    remaining = session.scalars(select(Contact.id).where(Contact.user_id == user.id)).all()
+    assert len(remaining) == 5
+
+
+@pytest.mark.asyncio
+async def test_purge_cutoff_follows_the_database_clock(session, user):
+    # stamped by the database like every delete; kept, while the 2024 tombstones are long expired
+    live = session.scalars(select(Contact).where(Contact.first_name == "C6")).one()
+    assert await repository_contacts.delete_contact(live.id, user.id, session)
+
+    result = await purge_contacts.run(session, retention_days=30, batch_size=10, pause_ms=0)
+
+    assert result["purged"] == 6
+    assert session.scalars(select(Contact.first_name).where(Contact.user_id == user.id)).all() == ["C6"]
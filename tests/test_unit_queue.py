@@ -0,0 +1,125 @@
+import asyncio
+import time
+from contextlib import nullcontext
+from unittest.mock import AsyncMock
+
+import fakeredis
+import pytest
+
+from src.jobs import tasks
+from src.services.queue import InMemoryBroker, Job, JobQueue, RedisStreamBroker, Worker, jobs_total
+
+
+@pytest.fixture()
+def queue():
+    queue = JobQueue(InMemoryBroker())
+    attempts = []
+
+    @queue.task("flaky")
+    async def flaky(fail_times: int):
+        attempts.append(fail_times)
+        if len(attempts) <= fail_times:
+            raise RuntimeError("boom")
+
+    queue.attempts = attempts
+    return queue
+
+
+@pytest.mark.asyncio
+async def test_failed_job_is_retried_with_backoff(queue, monkeypatch):
+    monkeypatch.setattr("src.services.queue.JOB_RETRY_BACKOFF", 0.01)
+    worker = Worker(queue, max_retries=3)
+    await queue.enqueue("flaky", fail_times=2)
+
+    while await queue.broker.size():
+        await worker.drain()
+        await asyncio.sleep(0.02)
+    assert len(queue.attempts) == 3
+    assert queue.broker.dead == []
+
+
+@pytest.mark.asyncio
+async def test_exhausted_and_unknown_jobs_are_dead_lettered(queue):
+    worker = Worker(queue, max_retries=0)
+    await queue.enqueue("flaky", fail_times=5)
+    await queue.enqueue("missing")
+    before = jobs_total.value(job="missing", outcome="dead")
+
+    assert await worker.drain() == 2
+    assert [(job.name, job.attempts) for job, _ in queue.broker.dead] == [("flaky", 1), ("missing", 1)]
+    assert queue.broker.dead[0][1] == "RuntimeError: boom"
+    assert jobs_total.value(job="missing", outcome="dead") == before + 1
+
+
+@pytest.mark.asyncio
+async def test_run_respects_concurrency(queue):
+    running, peak = 0, 0
+
+    @queue.task("slow")
+    async def slow():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    for _ in range(6):
+        await queue.enqueue("slow")
+    stop = asyncio.Event()
+    worker = Worker(queue, concurrency=2)
+    runner = asyncio.create_task(worker.run(stop))
+    while await queue.broker.size():
+        await asyncio.sleep(0.01)
+    stop.set()
+    await runner
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_redis_broker_acks_and_reclaims_unacknowledged_jobs():
+    broker = RedisStreamBroker(fakeredis.FakeAsyncRedis(decode_responses=True), visibility_timeout_ms=10)
+    await broker.enqueue(Job(name="a", payload={"n": 1}))
+
+    (message_id, job), = await broker.fetch("crashed", 1, block_ms=0)
+    assert job.payload == {"n": 1}
+    assert await broker.fetch("other", 1, block_ms=0) == []
+
+    time.sleep(0.02)
+    (reclaimed_id, _), = await broker.fetch("other", 1, block_ms=0)
+    assert reclaimed_id == message_id
+    await broker.ack(reclaimed_id)
+    assert await broker.size() == 0
+
+
+@pytest.mark.asyncio
+async def test_redis_broker_retry_and_dead_letter():
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    broker = RedisStreamBroker(redis)
+    await broker.enqueue(Job(name="a", payload={}))
+    (message_id, job), = await broker.fetch("w", 1, block_ms=0)
+
+    await broker.retry(message_id, job, delay=0)
+    (message_id, job), = await broker.fetch("w", 1, block_ms=0)
+    await broker.dead_letter(message_id, job, "RuntimeError: boom")
+    assert await broker.size() == 0
+    assert (await redis.xrange("jobs:dead"))[0][1]["error"] == "RuntimeError: boom"
+
+
+@pytest.mark.asyncio
+async def test_avatar_upload_does_not_block_other_jobs(monkeypatch):
+    monkeypatch.setattr("cloudinary.uploader.upload", lambda *args, **kwargs: time.sleep(0.2) or {"version": 1})
+    monkeypatch.setattr(tasks.job_queue, "session", nullcontext)
+    monkeypatch.setattr(tasks.shard_router, "route", AsyncMock())
+    monkeypatch.setattr(tasks.repository_users, "update_avatar", AsyncMock())
+    ticks = []
+
+    async def other_job():
+        for _ in range(5):
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.02)
+
+    started = time.monotonic()
+    await asyncio.gather(tasks.process_avatar("a@example.com", "a", ""), other_job())
+
+    assert ticks[-1] - started < 0.2
+    tasks.repository_users.update_avatar.assert_awaited_once()
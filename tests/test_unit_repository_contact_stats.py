@@ -0,0 +1,60 @@
+from datetime import date
+
+import pytest
+
+from src.db.models import Contact, ContactStats, User
+from src.repository import contact_stats as repository_stats
+
+
+def make_contact(user_id=1, birthday=date(1990, 5, 17), phone="+380501234567", email="a@example.com"):
+    return Contact(first_name="A", last_name="B", email=email, phone_number=phone, birthday=birthday,
+                   user_id=user_id)
+
+
+def test_contact_delta_buckets_by_birth_month():
+    deltas = repository_stats.contact_delta(make_contact(phone=""))
+    repository_stats.contact_delta(make_contact(birthday=None, email=None), 1, deltas)
+    assert deltas[5] == [1, 1, 0]
+    assert deltas[0] == [1, 0, 1]
+
+
+@pytest.mark.asyncio
+async def test_apply_deltas_accumulates(session):
+    await repository_stats.apply_deltas(1, repository_stats.contact_delta(make_contact()), session)
+    await repository_stats.apply_deltas(1, repository_stats.contact_delta(make_contact(phone="")), session)
+    stats = await repository_stats.get_stats(1, session, today=date(2024, 5, 1))
+    assert stats == {"total": 2, "birthdays_this_month": 2, "missing_phone": 1, "missing_email": 0}
+
+    await repository_stats.apply_deltas(1, repository_stats.contact_delta(make_contact(), -1), session)
+    stats = await repository_stats.get_stats(1, session, today=date(2024, 6, 1))
+    assert stats == {"total": 1, "birthdays_this_month": 0, "missing_phone": 1, "missing_email": 0}
+
+
+@pytest.mark.asyncio
+async def test_reconcile_repairs_drift(session):
+    session.add_all([make_contact(email=f"{n}@example.com", phone=f"+1{n}") for n in range(3)])
+    session.add(make_contact(birthday=date(1990, 1, 2), email="", phone="+19"))
+    session.add(ContactStats(user_id=1, birth_month=5, total=7, missing_phone=0, missing_email=0))
+    session.add(ContactStats(user_id=1, birth_month=11, total=1, missing_phone=0, missing_email=0))
+    session.commit()
+
+    assert await repository_stats.reconcile(session, user_id=1) == 3
+    stats = await repository_stats.get_stats(1, session, today=date(2024, 1, 1))
+    assert stats == {"total": 4, "birthdays_this_month": 1, "missing_phone": 0, "missing_email": 1}
+    assert await repository_stats.reconcile(session, user_id=1) == 0
+
+
+@pytest.mark.asyncio
+async def test_reconcile_walks_every_user_in_batches(session):
+    users = [User(username=f"user{n}", email=f"user{n}@example.com", password="secret") for n in range(5)]
+    session.add_all(users)
+    session.flush()
+    session.add_all([make_contact(user_id=user.id) for user in users])
+    session.add(ContactStats(user_id=users[0].id, birth_month=11, total=1, missing_phone=0, missing_email=0))
+    session.commit()
+
+    # one row added per user, one removed for the first
+    assert await repository_stats.reconcile(session, batch_size=2) == 6
+    for user in users:
+        stats = await repository_stats.get_stats(user.id, session, today=date(2024, 5, 1))
+        assert stats["total"] == stats["birthdays_this_month"] == 1
@@ -1,3 +1,4 @@
+import asyncio
 import unittest
 from unittest.mock import MagicMock
 from sqlalchemy.orm import Session
@@ -14,35 +15,40 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
         self.user = User(id=1, email="test@example.com", confirmed=False, refresh_token=None)
 
     async def test_get_user_by_email_found(self):
-        self.session.query().filter().first.return_value = self.user
+        self.session.scalars.return_value.first.return_value = self.user
         result = await get_user_by_email(email="test@example.com", db=self.session)
         self.assertEqual(result, self.user)
 
     async def test_get_user_by_email_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.session.scalars.return_value.first.return_value = None
         result = await get_user_by_email(email="test@example.com", db=self.session)
         self.assertIsNone(result)
 
-    async def test_create_user(self):
-        body = UserModel(email="test@example.com", password="password123")
-        self.session.add.return_value = None
-        self.session.commit.return_value = None
-        self.session.refresh.return_value = self.user
-        result = await create_user(body=body, db=self.session)
-        self.assertEqual(result.email, body.email)
-        self.assertTrue(hasattr(result, "id"))
-
     async def test_update_token(self):
         token = "new_refresh_token"
         await update_token(user=self.user, token=token, db=self.session)
         self.assertEqual(self.user.refresh_token, token)
         self.session.commit.assert_called_once()
 
-    async def test_confirmed_email(self):
-        self.session.query().filter().first.return_value = self.user
-        await confirmed_email(email="test@example.com", db=self.session)
-        self.assertTrue(self.user.confirmed)
-        self.session.commit.assert_called_once()
+
+
+def test_create_user(session):
+    body = UserModel(username="tester", email="test@example.com", password="pass123")
+    result = asyncio.run(create_user(body=body, db=session))
+    assert result.email == body.email
+    assert result.id is not None
+    assert result.confirmed is False
+    # the email is taken, nothing is inserted
+    assert asyncio.run(create_user(body=body, db=session)) is None
+    assert session.query(User).count() == 1
+
+
+def test_confirmed_email(session):
+    asyncio.run(create_user(UserModel(username="tester", email="test@example.com", password="pass123"), session))
+    assert asyncio.run(confirmed_email(email="test@example.com", db=session)) is True
+    assert asyncio.run(get_user_by_email("test@example.com", session)).confirmed is True
+    assert asyncio.run(confirmed_email(email="test@example.com", db=session)) is False
+    assert asyncio.run(confirmed_email(email="nobody@example.com", db=session)) is False
 
 
 if __name__ == '__main__':
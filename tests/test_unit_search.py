@@ -0,0 +1,61 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from src.db.models import Base, Contact, User
+from src.repository.search import SEARCH_VECTOR_SQL, search
+
+POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+
+def make_contacts(db):
+    user = User(username="owner", email="owner@example.com", password="x")
+    db.add(user)
+    db.flush()
+    db.add_all([
+        Contact(first_name="John", last_name="Doe", email="john.doe@example.com", phone_number="+380501234567",
+                user_id=user.id, additional_info="Plays chess on Sundays"),
+        Contact(first_name="Chess", last_name="Master", email="cm@example.com", phone_number="+380671112233",
+                user_id=user.id),
+        Contact(first_name="Jane", last_name="Roe", email="jane@example.com", phone_number="+380931112233",
+                user_id=user.id + 1),
+    ])
+    db.flush()
+    return user
+
+
+def test_fallback_requires_every_term(session):
+    user = make_contacts(session)
+    assert [hit["contact"].first_name for hit in search(session, user.id, "chess", 10)] == ["John", "Chess"]
+    assert [hit["contact"].first_name for hit in search(session, user.id, "SUNDAYS doe", 10)] == ["John"]
+    assert search(session, user.id, "jane", 10) == []
+    assert search(session, user.id, "100%", 10) == []
+
+
+@pytest.mark.skipif(not POSTGRES_URL, reason="set TEST_POSTGRES_URL to run against PostgreSQL")
+def test_postgres_ranks_and_highlights():
+    schema = f"test_search_{os.getpid()}"
+    engine = create_engine(POSTGRES_URL)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"CREATE SCHEMA {schema}")
+    try:
+        with engine.connect() as conn:
+            conn.exec_driver_sql(f"SET search_path TO {schema}")
+            Base.metadata.create_all(conn)
+            conn.exec_driver_sql(f"ALTER TABLE contact ADD COLUMN search_vector tsvector "
+                                 f"GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED")
+            db = Session(bind=conn)
+            user = make_contacts(db)
+            hits = search(db, user.id, "chess", 10, highlight=True)
+            # a name match outranks a match in the notes
+            assert [hit["contact"].first_name for hit in hits] == ["Chess", "John"]
+            assert "<b>chess</b>" in hits[1]["snippet"].lower()
+            assert [hit["contact"].first_name for hit in search(db, user.id, "doe", 10)] == ["John"]
+            assert search(db, user.id, "chess -sundays", 10)[0]["contact"].first_name == "Chess"
+            db.close()
+    finally:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"DROP SCHEMA {schema} CASCADE")
+        engine.dispose()
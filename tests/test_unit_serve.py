@@ -0,0 +1,77 @@
+import random
+import signal
+import socket
+import time
+import urllib.request
+
+import pytest
+import uvicorn
+
+import serve
+from src.services.lifecycle import DRAINING, READY, lifecycle
+from src.services.metrics import serve_metrics
+
+
+def test_max_requests_is_jittered_per_worker():
+    rng = random.Random(1)
+    limits = {serve.max_requests_for_worker(1000, 100, rng) for _ in range(20)}
+
+    assert all(1000 <= limit <= 1100 for limit in limits)
+    assert len(limits) > 1
+    assert serve.max_requests_for_worker(0, 100) is None
+
+
+def test_default_runtime_is_asyncio_and_h11():
+    assert serve.runtime_options("default") == {"loop": "asyncio", "http": "h11"}
+    assert set(serve.runtime_options("tuned")) == {"loop", "http"}
+
+
+def test_default_workers_follows_web_concurrency(monkeypatch):
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    assert serve.default_workers() == 3
+    monkeypatch.delenv("WEB_CONCURRENCY")
+    assert serve.default_workers() >= 1
+
+
+@pytest.mark.skipif(not hasattr(socket, "SO_REUSEPORT"), reason="SO_REUSEPORT is not available")
+def test_reuse_port_sockets_share_a_port():
+    first = serve.bind_socket("127.0.0.1", 0, reuse_port=True)
+    try:
+        second = serve.bind_socket("127.0.0.1", first.getsockname()[1], reuse_port=True)
+        second.close()
+    finally:
+        first.close()
+
+
+def test_sigterm_reports_draining_before_the_server_stops(monkeypatch):
+    monkeypatch.setattr(lifecycle, "state", READY)
+    server = serve.DrainingServer(uvicorn.Config(app=None), grace=0.2)
+
+    server.handle_exit(signal.SIGTERM, None)
+    time.sleep(0.1)
+    assert lifecycle.state == DRAINING
+    assert not server.should_exit
+
+    server.draining.join(1)
+    assert server.should_exit
+
+
+def test_sigint_stops_the_server_at_once():
+    server = serve.DrainingServer(uvicorn.Config(app=None), grace=5)
+    server.handle_exit(signal.SIGINT, None)
+    assert server.should_exit and server.draining is None
+
+
+def test_each_worker_slot_serves_metrics_on_its_own_port():
+    supervisor = serve.Supervisor({"host": "127.0.0.1", "port": 0}, 2, 0, 0, reuse_port=True, metrics_port=9200)
+    assert [supervisor.worker_metrics_port(slot) for slot in range(2)] == [9200, 9201]
+    assert serve.Supervisor({"host": "127.0.0.1", "port": 0}, 2, 0, 0, reuse_port=True,
+                            metrics_port=0).worker_metrics_port(1) == 0
+
+    server = serve_metrics(0, "127.0.0.1")
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics", timeout=2) as response:
+            assert response.read().decode().startswith("# HELP")
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from src.db.db import ShardSession
+from src.db.models import Base, Contact, ContactStats, ShardDirectory, User
+from src.db.sharding import ShardFenced, ShardRouter, add_results, fence_key, shard_for_email
+from src.jobs.move_user import move_user
+
+
+@pytest.fixture()
+def shards():
+    # three databases, the first holds the directory
+    engines = [create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+               for _ in range(3)]
+    for engine in engines:
+        Base.metadata.create_all(bind=engine)
+    yield engines
+    for engine in engines:
+        engine.dispose()
+
+
+@pytest.fixture()
+def router(shards, redis_client):
+    router = ShardRouter(shards, cache_size=100, cache_ttl=60)
+    router.use(redis_client)
+    return router
+
+
+async def create_user(router: ShardRouter, email: str, contacts: int = 0) -> tuple[int, int]:
+    user_id, shard = await router.assign(email, Session())
+    with Session(bind=router.engines[shard]) as db:
+        db.add(User(id=user_id, username=email.split("@")[0], email=email, password="x", confirmed=True))
+        for n in range(contacts):
+            db.add(Contact(first_name=f"C{n}", last_name="X", email=f"c{n}@example.com", phone_number=str(n),
+                           user_id=user_id))
+        db.add(ContactStats(user_id=user_id, birth_month=0, total=contacts))
+        db.commit()
+    return user_id, shard
+
+
+def test_new_users_are_spread_by_email_hash():
+    placements = [shard_for_email(f"user{n}@example.com", 3) for n in range(300)]
+
+    assert placements == [shard_for_email(f"user{n}@example.com", 3) for n in range(300)]
+    assert all(placements.count(shard) > 60 for shard in range(3))
+
+
+@pytest.mark.asyncio
+async def test_assign_allocates_ids_once_across_shards(router):
+    first = await router.assign("a@example.com", Session())
+    second = await router.assign("b@example.com", Session())
+
+    assert await router.assign("a@example.com", Session()) == first
+    assert first[0] != second[0]
+    assert first[1] == shard_for_email("a@example.com", 3)
+    with Session(bind=router.engines[0]) as catalog:
+        assert catalog.scalar(select(func.count()).select_from(ShardDirectory)) == 2
+
+
+@pytest.mark.asyncio
+async def test_ids_come_from_the_directory_before_sharding_is_enabled(shards):
+    with Session(bind=shards[0]) as db:
+        user_id, shard = await ShardRouter(shards[:1]).assign("early@example.com", db)
+        db.add(User(id=user_id, username="early", email="early@example.com", password="x", confirmed=True))
+        db.commit()
+    assert shard == 0
+
+    # sharding switched on later: the early user is found, new ids do not collide with theirs
+    router = ShardRouter(shards)
+    assert await router.lookup("early@example.com") == 0
+    assert (await router.assign("late@example.com", Session()))[0] != user_id
+
+
+@pytest.mark.asyncio
+async def test_sessions_follow_the_route_of_their_user(router, shards):
+    user_id, shard = await create_user(router, "routed@example.com")
+
+    class TestShardSession(ShardSession):
+        engines = shards
+
+    with TestShardSession() as db:
+        assert await router.route(db, "routed@example.com") == shard
+        assert db.scalar(select(User.id).where(User.email == "routed@example.com")) == user_id
+        # the cache answers by id as well, without the directory
+        router.engines = []
+        assert await router.lookup(user_id) == shard
+
+
+@pytest.mark.asyncio
+async def test_fenced_users_can_read_but_not_write(router, redis_client):
+    await redis_client.set(fence_key("moving@example.com"), 1)
+    db = Session()
+
+    await router.route(db, "moving@example.com")
+    with pytest.raises(ShardFenced):
+        await router.route(db, "moving@example.com", write=True)
+
+
+@pytest.mark.asyncio
+async def test_move_copies_the_user_and_switches_the_directory(router, shards, redis_client):
+    user_id, source = await create_user(router, "mover@example.com", contacts=3)
+    target = (source + 1) % 3
+
+    result = await move_user("mover@example.com", target, router=router, grace_ms=0)
+
+    assert result == {**result, "user_id": user_id, "source": source, "target": target, "contacts": 3}
+    assert await router.lookup("mover@example.com", refresh=True) == target
+    with Session(bind=shards[target]) as db:
+        assert db.scalar(select(User.email).where(User.id == user_id)) == "mover@example.com"
+        assert db.scalar(select(ContactStats.total).where(ContactStats.user_id == user_id)) == 3
+        assert sorted(db.scalars(select(Contact.first_name).where(Contact.user_id == user_id))) == ["C0", "C1", "C2"]
+    with Session(bind=shards[source]) as db:
+        assert db.scalar(select(func.count()).select_from(User)) == 0
+        assert db.scalar(select(func.count()).select_from(Contact)) == 0
+    assert not await redis_client.exists(fence_key("mover@example.com"), fence_key(user_id))
+
+
+def test_batch_results_are_added_up_across_shards():
+    assert add_results([{"purged": 2, "batches": 1}, {"purged": 3, "batches": 2}]) == {"purged": 5, "batches": 3}
+
+
+def test_fenced_writes_answer_503(client, token, router, redis_client, monkeypatch):
+    monkeypatch.setattr("src.services.auth.shard_router", router)
+    headers = {"Authorization": f"Bearer {token}"}
+    asyncio.run(redis_client.set(fence_key("deadpool@example.com"), 1))
+
+    assert client.get("/contact/contacts", headers=headers).status_code == 200
+    response = client.post("/contact/contacts", json={}, headers=headers)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
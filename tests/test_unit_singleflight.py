@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from starlette.requests import Request
+
+from src.routers import ops
+from src.services import auth
+from src.services.metrics import registry
+from src.services.singleflight import SingleFlight, calls_total
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_calls_share_one_execution():
+    flight = SingleFlight("test-shared", enabled=True)
+    executions = []
+
+    def query(user_id):
+        executions.append(threading.get_ident())
+        time.sleep(0.05)
+        return [user_id]
+
+    results = await asyncio.gather(*(flight.do(("page", 1), query, 1) for _ in range(5)))
+    assert results == [[1]] * 5
+    assert len(executions) == 1
+    assert calls_total.value(group="test-shared", outcome="collapsed") == 4
+    assert flight.in_flight() == 0
+
+
+@pytest.mark.asyncio
+async def test_different_keys_and_later_calls_execute():
+    flight = SingleFlight("test-keys", enabled=True)
+    calls = []
+
+    def query(user_id):
+        calls.append(user_id)
+        return user_id
+
+    assert await asyncio.gather(flight.do(1, query, 1), flight.do(2, query, 2)) == [1, 2]
+    assert await flight.do(1, query, 1) == 1
+    assert sorted(calls) == [1, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_waiter():
+    flight = SingleFlight("test-errors", enabled=True)
+
+    def failing():
+        time.sleep(0.02)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(flight.do("k", failing), flight.do("k", failing), return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_disabled_scope_always_executes():
+    flight = SingleFlight("test-off", enabled=False)
+    calls = []
+    await asyncio.gather(*(flight.do("k", calls.append, 1) for _ in range(3)))
+    assert calls == [1, 1, 1]
+
+
+def test_metrics_endpoint_needs_the_scrape_token(client, token, monkeypatch):
+    assert client.get("/ops/metrics").status_code == 404
+
+    monkeypatch.setattr(ops, "METRICS_TOKEN", "scrape-secret")
+    assert client.get("/ops/metrics").status_code == 401
+    # a user's access token is not a scrape token
+    assert client.get("/ops/metrics", headers={"Authorization": f"Bearer {token}"}).status_code == 401
+    response = client.get("/ops/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
+    assert "singleflight_calls_total" in response.text
+    assert registry.render().startswith("# HELP")
+
+
+@pytest.mark.asyncio
+async def test_every_request_gets_its_own_copy_of_the_shared_user(client, token, session):
+    request = Request({"type": "http", "method": "GET", "headers": []})
+    first = await auth.auth_service.get_current_user(request, token, session)
+    first.avatar = "changed by one request"
+    second = await auth.auth_service.get_current_user(request, token, session)
+
+    assert second is not first
+    assert second.avatar is None
+    assert second.email == first.email
@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.services import tracing
+from src.services.queue import InMemoryBroker, JobQueue, Worker
+
+trace = pytest.importorskip("opentelemetry.trace")
+propagate = pytest.importorskip("opentelemetry.propagate")
+otel_context = pytest.importorskip("opentelemetry.context")
+
+TRACE_ID = 0x4BF92F3577B34DA6A3CE929D0E0E4736
+TRACEPARENT = f"00-{TRACE_ID:032x}-00f067aa0ba902b7-01"
+
+
+def finished_span(trace_id: int, parent=None, ms: float = 1, error: bool = False):
+    status = trace.StatusCode.ERROR if error else trace.StatusCode.UNSET
+    return SimpleNamespace(context=SimpleNamespace(trace_id=trace_id), parent=parent, start_time=0,
+                           end_time=int(ms * 1_000_000), status=SimpleNamespace(status_code=status))
+
+
+class Collector:
+    def __init__(self):
+        self.spans = []
+
+    def on_end(self, span):
+        self.spans.append(span)
+
+
+def test_tail_sampling_keeps_slow_and_failed_traces():
+    collector = Collector()
+    processor = tracing.TailSamplingProcessor(collector, slow_ms=100, rate=0.0)
+    local_parent = SimpleNamespace(is_remote=False)
+
+    # fast and clean: the child is buffered, then the whole trace is dropped with its root
+    processor.on_end(finished_span(1, parent=local_parent))
+    assert processor.traces
+    processor.on_end(finished_span(1, ms=5))
+    # a failed statement keeps its trace
+    processor.on_end(finished_span(2, parent=local_parent, error=True))
+    processor.on_end(finished_span(2, ms=5))
+    # a slow root whose caller is in another process
+    processor.on_end(finished_span(3, parent=SimpleNamespace(is_remote=True), ms=250))
+
+    assert [span.context.trace_id for span in collector.spans] == [2, 2, 3]
+    assert not processor.traces
+
+
+def test_tail_sampling_bounds_unfinished_traces():
+    processor = tracing.TailSamplingProcessor(Collector(), max_traces=2)
+    for trace_id in range(5):
+        processor.on_end(finished_span(trace_id, parent=SimpleNamespace(is_remote=False)))
+
+    assert list(processor.traces) == [3, 4]
+
+
+def test_span_is_a_no_op_while_tracing_is_off(monkeypatch):
+    monkeypatch.setattr(tracing, "tracer", None)
+    with tracing.span("anything") as span:
+        assert span is None
+    assert tracing.inject() == {}
+
+
+@pytest.mark.asyncio
+async def test_jobs_continue_the_trace_that_queued_them(monkeypatch):
+    monkeypatch.setattr(tracing, "tracer", trace.get_tracer("test"))
+    queue = JobQueue(InMemoryBroker())
+    seen = []
+
+    @queue.task("probe")
+    async def probe():
+        seen.append(trace.get_current_span().get_span_context().trace_id)
+
+    token = otel_context.attach(propagate.extract({"traceparent": TRACEPARENT}))
+    try:
+        await queue.enqueue("probe")
+    finally:
+        otel_context.detach(token)
+    message_id, job = queue.broker.jobs[0]
+    assert job.trace["traceparent"].split("-")[1] == f"{TRACE_ID:032x}"
+
+    await Worker(queue).execute(message_id, job)
+    assert seen == [TRACE_ID]
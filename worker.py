@@ -0,0 +1,70 @@
+"""
+Job worker.
+
+Usage::
+
+    python worker.py [--concurrency 8] [--max-retries 5] [--metrics-port 9100]
+
+Consumes the Redis stream the web application enqueues jobs to (confirmation emails,
+avatar uploads, contact imports). Run as many workers as needed; they share the work
+through a consumer group and pick up jobs a crashed worker left unacknowledged.
+SIGINT/SIGTERM stop fetching and wait for running jobs to finish.
+"""
+import argparse
+import asyncio
+import os
+import signal
+
+import redis.asyncio as redis
+from dotenv import load_dotenv
+
+import src.jobs.tasks  # noqa: F401  registers the tasks
+from src.db.db import shard_engines
+from src.db.sharding import shard_router
+from src.services.events import event_hub
+from src.services.invalidation import invalidation_bus
+from src.services.metrics import serve_metrics
+from src.services.queue import JOB_CONCURRENCY, JOB_MAX_RETRIES, RedisStreamBroker, Worker, job_queue
+from src.services.tracing import configure_tracing, instrument_engine, instrument_redis
+
+load_dotenv()
+
+
+async def run(concurrency: int, max_retries: int) -> None:
+    r = redis.Redis(host=os.getenv('REDIS_HOST'), port=os.getenv('REDIS_PORT'), db=0, encoding="utf-8",
+                    decode_responses=True)
+    instrument_redis(r)
+    job_queue.use(RedisStreamBroker(r))
+    shard_router.use(r)
+    event_hub.use(r)
+    await invalidation_bus.start(r)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    worker = Worker(job_queue, concurrency=concurrency, max_retries=max_retries)
+    print(f"{worker.consumer} started with concurrency {concurrency}")
+    try:
+        await worker.run(stop)
+    finally:
+        await invalidation_bus.close()
+        await r.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=JOB_CONCURRENCY)
+    parser.add_argument("--max-retries", type=int, default=JOB_MAX_RETRIES)
+    parser.add_argument("--metrics-port", type=int, help="serve job metrics on this port")
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    if configure_tracing("contacts-worker"):
+        for shard_engine in shard_engines:
+            instrument_engine(shard_engine)
+    asyncio.run(run(args.concurrency, args.max_retries))
+
+
+if __name__ == "__main__":
+    main()